@@ -15,6 +15,8 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
 django_app = get_asgi_application()
 
+import asyncio
+from contextlib import asynccontextmanager
 from importlib.util import find_spec
 from typing import Union
 
@@ -23,9 +25,58 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from django.conf import settings
 
+from markets.broadcast import trade_broadcast_hub
+from markets.client import close_sonic_testnet_client
+from markets.indexer import TradeIndexer
+from markets.jobs import market_creation_executor
+from markets.mint_pool import MINT_POOL_REFILL_IN_API, mint_pool_filler
+from markets.log_subscriber import TradeLogSubscriber
+from markets.rpc_pool import rpc_pool
+from markets.trade_index import TRADE_INGEST_IN_API, trade_channel_listener
+from markets.views import get_component_stats
+from tools.http import close_http_session, open_http_session
+from tools.metrics import MetricsMiddleware, register_stats
+from tools.tracing import TracingMiddleware, trace_exporter
+
 from .fastapi_router import setup_routers
 
-app = FastAPI(swagger_ui_parameters={"displayRequestDuration": True}, root_path="/api")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_http_session()
+    trace_exporter.start()
+    rpc_pool.start_health_checks()
+    market_creation_executor.start()
+    if MINT_POOL_REFILL_IN_API:
+        mint_pool_filler.start()
+    trade_channel_listening = asyncio.ensure_future(trade_channel_listener.run())
+    trade_ingester = None
+    if TRADE_INGEST_IN_API == "ws":
+        trade_ingester = TradeLogSubscriber()
+    elif TRADE_INGEST_IN_API == "poll":
+        trade_ingester = TradeIndexer()
+    if trade_ingester is not None:
+        trade_ingestion = asyncio.ensure_future(trade_ingester.run())
+    yield
+    trade_broadcast_hub.close_all()
+    if trade_ingester is not None:
+        trade_ingester.stop()
+        await trade_ingestion
+    trade_channel_listener.stop()
+    await trade_channel_listening
+    await mint_pool_filler.stop()
+    await market_creation_executor.stop()
+    await rpc_pool.stop_health_checks()
+    await close_sonic_testnet_client()
+    await trace_exporter.stop()
+    await close_http_session()
+
+
+app = FastAPI(
+    swagger_ui_parameters={"displayRequestDuration": True},
+    root_path="/api",
+    lifespan=lifespan,
+)
 app.mount("/admin", django_app)
 
 origins = ["*"]
@@ -37,6 +88,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+register_stats(get_component_stats)
 
 
 setup_routers(app)
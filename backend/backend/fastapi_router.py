@@ -1,7 +1,10 @@
 from fastapi import FastAPI
-from markets.views import router as market_router
+from markets.views import router as market_router, users_router
+from tools.metrics import metrics_endpoint
 
 
 def setup_routers(app: FastAPI):
     """Routes"""
     app.include_router(market_router, prefix="/markets")
+    app.include_router(users_router, prefix="/users")
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
@@ -0,0 +1,150 @@
+"""
+RPC fixtures the benchmarks replay: the signature history of an address and
+its parsed transactions, as returned by `getSignaturesForAddress` and
+`getTransaction`.
+
+    python -m benchmarks.fixtures record <address> --limit 1000
+    python -m benchmarks.fixtures synthesize --count 1000
+"""
+
+import os
+import gzip
+import json
+import asyncio
+import argparse
+from typing import Dict, List, Optional, TypedDict
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+DEFAULT_FIXTURE = os.path.join(FIXTURES_DIR, "market.json.gz")
+
+
+class Fixture(TypedDict):
+    address: str
+    slot: int
+    # getSignaturesForAddress results, newest first.
+    signatures: List[dict]
+    # getTransaction results by signature.
+    transactions: Dict[str, dict]
+
+
+def load_fixture(path: Optional[str] = None, *, count: int = 1000) -> Fixture:
+    """
+    Loads a recorded fixture, or synthesizes `count` transactions when no
+    path is given and none was recorded to the default path.
+    """
+    if path is None and not os.path.exists(DEFAULT_FIXTURE):
+        return make_fixture(count)
+
+    with gzip.open(path or DEFAULT_FIXTURE, "rt") as f:
+        return json.load(f)
+
+
+def save_fixture(fixture: Fixture, path: str = DEFAULT_FIXTURE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt") as f:
+        json.dump(fixture, f)
+
+
+def make_fixture(count: int, seed: int = 0) -> Fixture:
+    """Seeded transactions shaped like swaps on Sonic, for offline runs."""
+    from benchmarks.token_trades import make_transactions
+
+    transactions = make_transactions(count, seed)[::-1]
+
+    return {
+        "address": "Mint" + "0" * 40,
+        "slot": transactions[0]["slot"],
+        "signatures": [
+            {
+                "signature": tx["transaction"]["signatures"][0],
+                "slot": tx["slot"],
+                "err": None,
+                "memo": None,
+                "blockTime": tx["blockTime"],
+                "confirmationStatus": "finalized",
+            }
+            for tx in transactions
+        ],
+        "transactions": {tx["transaction"]["signatures"][0]: tx for tx in transactions},
+    }
+
+
+async def record_fixture(address: str, limit: int) -> Fixture:
+    """Records the latest `limit` transactions of an address from the RPC."""
+    from markets.rpc import (
+        RpcException,
+        get_signatures_for_addresses_rpc,
+        get_transactions,
+        rpc_request,
+    )
+
+    signatures = []
+    while len(signatures) < limit:
+        before = signatures[-1]["signature"] if signatures else None
+        resp = await rpc_request(
+            get_signatures_for_addresses_rpc(address, before=before)
+        )
+        if "result" not in resp:
+            raise RpcException(resp)
+        if not resp["result"]:
+            break
+
+        signatures.extend(resp["result"])
+
+    signatures = signatures[:limit]
+    successful = [
+        sig_obj["signature"] for sig_obj in signatures if sig_obj["err"] is None
+    ]
+    transactions = await get_transactions(successful, use_cache=False)
+    slot = await rpc_request({"jsonrpc": "2.0", "id": 1, "method": "getSlot"})
+
+    return {
+        "address": address,
+        "slot": slot["result"],
+        "signatures": signatures,
+        "transactions": {tx["transaction"]["signatures"][0]: tx for tx in transactions},
+    }
+
+
+async def _record(address: str, limit: int, output: str):
+    from tools.http import close_http_session
+
+    try:
+        fixture = await record_fixture(address, limit)
+    finally:
+        await close_http_session()
+
+    save_fixture(fixture, output)
+    print(f"Recorded {len(fixture['transactions'])} transactions to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Records or synthesizes RPC fixtures.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Record from the RPC_URLS endpoint.")
+    record.add_argument("address")
+    record.add_argument("--limit", type=int, default=1000)
+    record.add_argument("--output", default=DEFAULT_FIXTURE)
+
+    synthesize = subparsers.add_parser("synthesize", help="Generate offline.")
+    synthesize.add_argument("--count", type=int, default=1000)
+    synthesize.add_argument("--seed", type=int, default=0)
+    synthesize.add_argument("--output", default=DEFAULT_FIXTURE)
+
+    args = parser.parse_args()
+
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    django.setup()
+
+    if args.command == "record":
+        asyncio.run(_record(args.address, args.limit, args.output))
+    else:
+        save_fixture(make_fixture(args.count, args.seed), args.output)
+        print(f"Synthesized {args.count} transactions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
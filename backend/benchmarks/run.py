@@ -0,0 +1,442 @@
+"""
+Benchmarks of the trades pipeline and API endpoints, offline against RPC
+fixtures served by the mock JSON-RPC server.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --update-baseline
+    python -m benchmarks.run --rpc-latency 0.05 --rpc-batch-error-rate 0.01
+
+Results are compared against `baseline.json`, a local file recorded with
+`--update-baseline` on the machine the runs are compared on. The run fails
+when a metric regresses by more than the tolerance, and skips the comparison
+when the baseline was recorded with another setup. Endpoint benchmarks start the API in
+a subprocess and write a `benchmark` market to the configured database,
+skip them with `--skip-endpoints`.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+BENCHMARK_RPC_HOST = "127.0.0.1"
+BENCHMARK_RPC_PORT = int(os.getenv("BENCHMARK_RPC_PORT", 18899))
+BENCHMARK_API_PORT = int(os.getenv("BENCHMARK_API_PORT", 18000))
+
+# Point the RPC helpers at the mock server before they are imported, and
+# lift the rate limit so the pipeline is measured rather than the budget.
+BENCHMARK_ENV = {
+    "RPC_URLS": f"http://{BENCHMARK_RPC_HOST}:{BENCHMARK_RPC_PORT}/",
+    "RPC_RATE_LIMIT": "1000000",
+    "RPC_RATE_BURST": "1000000",
+    "RPC_HEDGE_PERCENTILE": "0",
+    "TX_CACHE_ENABLED": "false",
+    "MINT_POOL_REFILL_IN_API": "false",
+}
+for key, value in BENCHMARK_ENV.items():
+    os.environ.setdefault(key, value)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django
+
+django.setup()
+
+import aiohttp
+
+from benchmarks.fixtures import Fixture, load_fixture
+from benchmarks.token_trades import classify_per_transaction
+from markets.mock_rpc import FixtureResponder, MockRpcServer
+from markets.rpc import BATCH_REQUEST_SIZE, batched_rpc_requests
+from markets.token_trades import classify_sol_token_trades, get_sol_token_trades
+from tools.http import close_http_session
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+ENDPOINT_BENCHMARK_SLUG = "benchmark"
+
+
+class Results:
+    """Metrics of a run, keyed by name."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Dict] = {}
+
+    def add(self, name: str, value: float, unit: str, *, higher_is_better: bool):
+        self.metrics[name] = {
+            "value": round(value, 3),
+            "unit": unit,
+            "higher_is_better": higher_is_better,
+        }
+        print(f"{name:<45} {value:>14,.3f} {unit}")
+
+
+def best_of(repeat: int, fn: Callable) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+async def async_best_of(repeat: int, fn: Callable) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    index = round(percent / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+def bench_classifier(results: Results, fixture: Fixture, repeat: int):
+    transactions = list(fixture["transactions"].values())
+
+    per_transaction = best_of(
+        repeat, lambda: [classify_per_transaction(tx) for tx in transactions]
+    )
+    batched = best_of(repeat, lambda: classify_sol_token_trades(transactions))
+
+    results.add(
+        "classifier.per_transaction",
+        len(transactions) / per_transaction,
+        "tx/s",
+        higher_is_better=True,
+    )
+    results.add(
+        "classifier.classify_sol_token_trades",
+        len(transactions) / batched,
+        "tx/s",
+        higher_is_better=True,
+    )
+
+
+async def bench_trades_pipeline(results: Results, fixture: Fixture, repeat: int):
+    trades = await get_sol_token_trades(fixture["address"])
+    elapsed = await async_best_of(
+        repeat, lambda: get_sol_token_trades(fixture["address"])
+    )
+
+    results.add(
+        "pipeline.get_sol_token_trades",
+        elapsed * 1000,
+        "ms",
+        higher_is_better=False,
+    )
+    results.add(
+        "pipeline.get_sol_token_trades.trades",
+        len(trades) / elapsed,
+        "trades/s",
+        higher_is_better=True,
+    )
+
+
+async def bench_batched_requests(
+    results: Results, fixture: Fixture, repeat: int, count: int
+):
+    signatures = list(fixture["transactions"])
+    requests = [
+        {
+            "jsonrpc": "2.0",
+            "id": i,
+            "method": "getTransaction",
+            "params": [
+                signatures[i % len(signatures)],
+                {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0},
+            ],
+        }
+        for i in range(count)
+    ]
+
+    elapsed = await async_best_of(
+        repeat, lambda: batched_rpc_requests(requests, BATCH_REQUEST_SIZE)
+    )
+
+    results.add(
+        "rpc.batched_rpc_requests",
+        count / elapsed,
+        "requests/s",
+        higher_is_better=True,
+    )
+
+
+async def bench_endpoints(
+    results: Results, fixture: Fixture, requests: int, concurrency: int
+):
+    from markets.models import AttentionMarket, Candle, MarketTradeCursor, TokenTrade
+
+    market, _ = await AttentionMarket.objects.aupdate_or_create(
+        slug=ENDPOINT_BENCHMARK_SLUG, defaults={"address": fixture["address"]}
+    )
+    await TokenTrade.objects.filter(market=market).adelete()
+    await Candle.objects.filter(market=market).adelete()
+    await MarketTradeCursor.objects.filter(market=market).adelete()
+
+    base_url = f"http://127.0.0.1:{BENCHMARK_API_PORT}"
+    endpoints = {
+        "list": "/markets/attention/",
+        "trades": f"/markets/attention/trades/{market.id}?limit=100",
+        "candles": f"/markets/attention/{market.id}/candles?interval=1m",
+        "stats": f"/markets/attention/{market.id}/stats",
+    }
+
+    server = start_api_server()
+    try:
+        async with aiohttp.ClientSession(base_url) as session:
+            await wait_for_api(session)
+            # Ingests the fixture history, later reads serve the index.
+            async with session.get(endpoints["trades"]) as resp:
+                resp.raise_for_status()
+
+            for name, path in endpoints.items():
+                # Warm up connections and caches before measuring.
+                await load(session, path, concurrency, concurrency)
+                latencies, elapsed = await load(session, path, requests, concurrency)
+                latencies.sort()
+                results.add(
+                    f"endpoints.{name}.p50",
+                    percentile(latencies, 50) * 1000,
+                    "ms",
+                    higher_is_better=False,
+                )
+                results.add(
+                    f"endpoints.{name}.p99",
+                    percentile(latencies, 99) * 1000,
+                    "ms",
+                    higher_is_better=False,
+                )
+                results.add(
+                    f"endpoints.{name}.throughput",
+                    requests / elapsed,
+                    "requests/s",
+                    higher_is_better=True,
+                )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def start_api_server() -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "backend.asgi:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(BENCHMARK_API_PORT),
+            "--log-level",
+            "warning",
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=os.environ.copy(),
+    )
+
+
+async def wait_for_api(session: aiohttp.ClientSession, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get("/markets/rpc/stats") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientConnectionError:
+            pass
+
+        if time.monotonic() > deadline:
+            raise TimeoutError("API server did not start")
+        await asyncio.sleep(0.2)
+
+
+async def load(
+    session: aiohttp.ClientSession, path: str, requests: int, concurrency: int
+):
+    """Sends `requests` GETs from `concurrency` clients, returns latencies."""
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            async with session.get(path) as resp:
+                await resp.read()
+                resp.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+
+    return latencies, time.perf_counter() - start
+
+
+def compare(metrics: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float):
+    """Prints the change of each metric, returns the regressed ones."""
+    regressions = []
+    print(f"\n{'metric':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metric in metrics.items():
+        if name not in baseline:
+            continue
+
+        before, after = baseline[name]["value"], metric["value"]
+        change = (after - before) / before if before else 0
+        worse = -change if metric["higher_is_better"] else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<45} {before:>12,.3f} {after:>12,.3f} {change:>+8.1%}{flag}")
+
+    return regressions
+
+
+async def run(args, fixture: Fixture) -> Results:
+    results = Results()
+    bench_classifier(results, fixture, args.repeat)
+
+    rpc_server = MockRpcServer(
+        FixtureResponder(fixture),
+        latency=args.rpc_latency,
+        jitter=args.rpc_jitter,
+        rate_limit_rate=args.rpc_rate_limit_rate,
+        batch_error_rate=args.rpc_batch_error_rate,
+        max_throughput=args.rpc_max_throughput,
+        seed=0,
+    )
+    await rpc_server.start(BENCHMARK_RPC_HOST, BENCHMARK_RPC_PORT)
+    try:
+        await bench_trades_pipeline(results, fixture, args.repeat)
+        await bench_batched_requests(
+            results, fixture, args.repeat, args.batched_requests
+        )
+        if not args.skip_endpoints:
+            await bench_endpoints(
+                results, fixture, args.endpoint_requests, args.concurrency
+            )
+    finally:
+        await close_http_session()
+        await rpc_server.stop()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fixture", help="Recorded fixture, see benchmarks.fixtures")
+    parser.add_argument(
+        "--count", type=int, default=1000, help="Transactions of a synthetic fixture"
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--batched-requests", type=int, default=1000)
+    parser.add_argument("--endpoint-requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--skip-endpoints", action="store_true")
+    parser.add_argument(
+        "--rpc-latency", type=float, default=0, help="Seconds per RPC request"
+    )
+    parser.add_argument(
+        "--rpc-jitter", type=float, default=0, help="Random extra RPC seconds"
+    )
+    parser.add_argument(
+        "--rpc-rate-limit-rate",
+        type=float,
+        default=0,
+        help="Share of RPC requests answered 429",
+    )
+    parser.add_argument(
+        "--rpc-batch-error-rate",
+        type=float,
+        default=0,
+        help="Share of batch items answered with a transient error",
+    )
+    parser.add_argument(
+        "--rpc-max-throughput",
+        type=float,
+        default=0,
+        help="RPC requests per second served before answering 429",
+    )
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Relative change of a metric counted as a regression",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Save the results as the baseline instead of comparing",
+    )
+    args = parser.parse_args()
+
+    fixture = load_fixture(args.fixture, count=args.count)
+    results = asyncio.run(run(args, fixture))
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "cpus": os.cpu_count(),
+        "fixture": {
+            "address": fixture["address"],
+            "transactions": len(fixture["transactions"]),
+        },
+        "rpc": {
+            "latency": args.rpc_latency,
+            "jitter": args.rpc_jitter,
+            "rate_limit_rate": args.rpc_rate_limit_rate,
+            "batch_error_rate": args.rpc_batch_error_rate,
+            "max_throughput": args.rpc_max_throughput,
+        },
+        "metrics": results.metrics,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --update-baseline")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    # Absolute numbers only compare on the same machine and setup.
+    environment = ("python", "machine", "cpus", "fixture", "rpc")
+    differences = [key for key in environment if baseline.get(key) != report[key]]
+    if differences:
+        print(
+            f"\nThe baseline was recorded with a different {', '.join(differences)}, "
+            "skipping the comparison, refresh it with --update-baseline"
+        )
+        return
+
+    regressions = compare(results.metrics, baseline["metrics"], args.tolerance)
+    if regressions:
+        print(
+            f"\n{len(regressions)} metrics regressed by more than {args.tolerance:.0%}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
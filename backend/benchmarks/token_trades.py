@@ -0,0 +1,291 @@
+"""
+Throughput of `classify_sol_token_trades` against the classifier it replaced.
+
+    python -m benchmarks.token_trades --count 5000
+"""
+
+import os
+import time
+import random
+import argparse
+from typing import Any, Dict, Optional
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from markets.token_trades import classify_sol_token_trades
+from markets.typing import TokenTrade
+
+WSOL_MINT = "So11111111111111111111111111111111111111112"
+
+
+def make_transaction(rnd: random.Random, index: int) -> dict:
+    """A jsonParsed `getTransaction` result shaped like a swap on Sonic."""
+    signer = f"Signer{rnd.randrange(200):040d}"
+    mint = f"Mint{rnd.randrange(20):042d}"
+    kind = rnd.choice(["buy", "sell", "transfer", "failed"])
+    fee = 5000
+
+    pre_lamports = rnd.randrange(10**9, 10**11)
+    sol_delta = rnd.randrange(10**6, 10**9)
+    pre_amount = rnd.randrange(10**6, 10**12)
+    token_delta = rnd.randrange(1, 10**6)
+
+    post_lamports, post_amount = pre_lamports - fee, pre_amount
+    if kind == "buy":
+        post_lamports -= sol_delta
+        post_amount += token_delta
+    elif kind == "sell":
+        post_lamports += sol_delta
+        post_amount -= token_delta
+
+    def token_balance(account_index, token_mint, owner, amount, decimals=6):
+        return {
+            "accountIndex": account_index,
+            "mint": token_mint,
+            "owner": owner,
+            "programId": "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA",
+            "uiTokenAmount": {
+                "amount": str(amount),
+                "decimals": decimals,
+                "uiAmount": amount / 10**decimals,
+                "uiAmountString": str(amount / 10**decimals),
+            },
+        }
+
+    account_keys = [
+        {"pubkey": signer, "signer": True, "source": "transaction", "writable": True}
+    ] + [
+        {
+            "pubkey": f"Account{index}{n:030d}",
+            "signer": False,
+            "source": "transaction",
+            "writable": n < 4,
+        }
+        for n in range(10)
+    ]
+    pool = "Pool" + "0" * 40
+
+    return {
+        "blockTime": 1_740_000_000 + index,
+        "slot": 300_000_000 + index,
+        "version": 0,
+        "meta": {
+            "err": None,
+            "fee": fee,
+            "computeUnitsConsumed": 45_000,
+            "preBalances": [pre_lamports] + [2_039_280] * 10,
+            "postBalances": [post_lamports] + [2_039_280] * 10,
+            "preTokenBalances": [
+                token_balance(1, mint, signer, pre_amount),
+                token_balance(2, mint, pool, 10**15),
+                token_balance(3, WSOL_MINT, pool, 10**13, 9),
+            ],
+            "postTokenBalances": [
+                token_balance(1, mint, signer, post_amount),
+                token_balance(2, mint, pool, 10**15 - (post_amount - pre_amount)),
+                token_balance(3, WSOL_MINT, pool, 10**13, 9),
+            ],
+            "innerInstructions": [
+                {
+                    "index": 2,
+                    "instructions": [
+                        {
+                            "parsed": {
+                                "info": {"amount": str(token_delta)},
+                                "type": "transfer",
+                            },
+                            "program": "spl-token",
+                            "programId": "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA",
+                            "stackHeight": 2,
+                        }
+                    ]
+                    * 3,
+                }
+            ],
+            "logMessages": [f"Program log: Instruction: Swap {n}" for n in range(12)],
+            "rewards": [],
+            "status": {"Ok": None},
+        },
+        "transaction": {
+            "message": {
+                "accountKeys": account_keys,
+                "instructions": [
+                    {
+                        "accounts": [key["pubkey"] for key in account_keys[:6]],
+                        "data": "3Bxs4h24hBtQy9rw",
+                        "programId": "SwapProgram" + "1" * 33,
+                        "stackHeight": None,
+                    }
+                ]
+                * 3,
+                "recentBlockhash": "Blockhash" + "2" * 35,
+            },
+            "signatures": [f"Signature{index:079d}"],
+        },
+    }
+
+
+def classify_per_transaction(transaction: Dict[str, Any]) -> Optional[TokenTrade]:
+    """
+    The trade classifier as it was before batching, one transaction at a
+    time. Kept as the baseline of the benchmarks and as the reference
+    `classify_sol_token_trades` must match.
+    """
+    # Basic validation
+    if not transaction or "meta" not in transaction or "transaction" not in transaction:
+        return None
+
+    meta = transaction["meta"]
+    tx_message = transaction["transaction"]["message"]
+
+    # Get signers (first account in accountKeys is usually the signer/fee payer)
+    account_keys = tx_message.get("accountKeys", [])
+    if not account_keys:
+        return None
+
+    # Find the signer account
+    signers = [acc for acc in account_keys if acc.get("signer")]
+    if not signers:
+        return None
+
+    signer = signers[0]["pubkey"]
+    signer_index = next(
+        (i for i, acc in enumerate(account_keys) if acc.get("pubkey") == signer), None
+    )
+    if signer_index is None:
+        return None
+
+    # Get SOL balances before and after
+    pre_sol_balance = (
+        meta.get("preBalances", [])[signer_index]
+        if signer_index < len(meta.get("preBalances", []))
+        else 0
+    )
+    post_sol_balance = (
+        meta.get("postBalances", [])[signer_index]
+        if signer_index < len(meta.get("postBalances", []))
+        else 0
+    )
+    sol_change = (post_sol_balance - pre_sol_balance) / 10**9  # Convert lamports to SOL
+
+    # Get token balances before and after
+    pre_token_balances = meta.get("preTokenBalances", [])
+    post_token_balances = meta.get("postTokenBalances", [])
+
+    # Find tokens owned by the signer
+    signer_pre_tokens = {
+        balance["mint"]: float(balance["uiTokenAmount"]["amount"])
+        / 10 ** balance["uiTokenAmount"]["decimals"]
+        for balance in pre_token_balances
+        if balance.get("owner") == signer
+    }
+
+    signer_post_tokens = {
+        balance["mint"]: float(balance["uiTokenAmount"]["amount"])
+        / 10 ** balance["uiTokenAmount"]["decimals"]
+        for balance in post_token_balances
+        if balance.get("owner") == signer
+    }
+
+    # Calculate token changes
+    token_changes = {}
+    all_tokens = set(list(signer_pre_tokens.keys()) + list(signer_post_tokens.keys()))
+
+    for token in all_tokens:
+        pre_amount = signer_pre_tokens.get(token, 0)
+        post_amount = signer_post_tokens.get(token, 0)
+        change = post_amount - pre_amount
+        if change != 0:
+            token_changes[token] = change
+
+    # Transaction fee always reduces SOL balance, so we need to account for it
+    transaction_fee = meta.get("fee", 0) / 10**9
+    adjusted_sol_change = sol_change + transaction_fee
+
+    # Determine if this is a buy or sell with SOL
+    if adjusted_sol_change < 0 and any(change > 0 for change in token_changes.values()):
+        # SOL decreased, token increased = BUY
+        traded_token = next(
+            (token for token, change in token_changes.items() if change > 0), None
+        )
+        return TokenTrade(
+            type="buy",
+            sol_amount=abs(adjusted_sol_change),
+            token=traded_token,
+            token_amount=token_changes.get(traded_token, 0) if traded_token else 0,
+            timestamp=transaction.get("blockTime"),
+            signature=(
+                transaction["transaction"]["signatures"][0]
+                if transaction["transaction"].get("signatures")
+                else None
+            ),
+            signer=signer,
+        )
+    elif adjusted_sol_change > 0 and any(
+        change < 0 for change in token_changes.values()
+    ):
+        # SOL increased, token decreased = SELL
+        traded_token = next(
+            (token for token, change in token_changes.items() if change < 0), None
+        )
+        return TokenTrade(
+            type="sell",
+            sol_amount=adjusted_sol_change,
+            token=traded_token,
+            token_amount=(
+                abs(token_changes.get(traded_token, 0)) if traded_token else 0
+            ),
+            timestamp=transaction.get("blockTime"),
+            signature=(
+                transaction["transaction"]["signatures"][0]
+                if transaction["transaction"].get("signatures")
+                else None
+            ),
+            signer=signer,
+        )
+
+    return None
+
+
+def make_transactions(count: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    return [make_transaction(rnd, index) for index in range(count)]
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    transactions = make_transactions(args.count)
+
+    expected = [classify_per_transaction(tx) for tx in transactions]
+    assert classify_sol_token_trades(transactions) == expected, "Outputs differ"
+
+    per_transaction = best_of(
+        args.repeat, lambda: [classify_per_transaction(tx) for tx in transactions]
+    )
+    batched = best_of(args.repeat, lambda: classify_sol_token_trades(transactions))
+
+    print(f"transactions:          {args.count} ({sum(map(bool, expected))} trades)")
+    print(f"per transaction:       {args.count / per_transaction:,.0f} tx/s")
+    print(f"classify_sol_token_trades: {args.count / batched:,.0f} tx/s")
+    print(f"speedup:               {per_transaction / batched:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,142 @@
+import asyncio
 import logging
-from typing import List
+from typing import Optional
 
-from markets.typing import CreateAttentionMarketResponse
 from markets.models import AttentionMarket
 from markets.client import get_sonic_testnet_client
 from markets.constants import DEFAULT_DECIMALS
 from markets.keypair import get_keypair
+from solana.rpc.types import TxOpts
+from solders.keypair import Keypair
+from solders.message import Message
+from solders.pubkey import Pubkey
+from solders.system_program import CreateAccountParams, create_account
+from solders.transaction import Transaction
 from spl.token.async_client import AsyncToken
-from spl.token.constants import TOKEN_PROGRAM_ID
-from spl.token.instructions import get_associated_token_address
+from spl.token.constants import MINT_LEN, TOKEN_PROGRAM_ID
+from spl.token.instructions import (
+    InitializeMintParams,
+    MintToParams,
+    create_associated_token_account,
+    get_associated_token_address,
+    initialize_mint,
+    mint_to,
+)
 
 logger = logging.getLogger(__name__)
 
 
-async def get_attention_markets() -> List[CreateAttentionMarketResponse]:
-    markets = []
-    async for market in AttentionMarket.objects.all():
-        markets.append(
-            CreateAttentionMarketResponse(
-                id=market.id,
-                slug=market.slug,
-                image_url=market.image_url,
-                address=market.address,
-            )
-        )
-
-    return markets
-
+async def create_attention_market(
+    slug: str, image_url: str, *, token_address: Optional[str] = None
+) -> AttentionMarket:
+    """
+    Creates a market, minting its token unless `token_address` is given.
 
-async def create_attention_market(slug: str, image_url: str) -> AttentionMarket:
-    token_address = await create_and_mint_token()
+    Creating a market whose slug exists returns the existing one.
+    """
+    if token_address is None:
+        token_address = await create_and_mint_token()
 
-    # create a new attention market
-    market = await AttentionMarket.objects.acreate(
-        slug=slug, image_url=image_url, address=token_address
+    # create a new attention market, the listing cache is invalidated on save
+    market, _ = await AttentionMarket.objects.aget_or_create(
+        slug=slug, defaults={"image_url": image_url, "address": token_address}
     )
 
     return market
 
 
-async def create_and_mint_token() -> str:
-    # create a new token
+# Minted to the creator's associated token account, in base units.
+INITIAL_MINT_AMOUNT = 100_000_000
+
+
+async def create_and_mint_token(mint: Optional[Keypair] = None) -> str:
+    """
+    Creates a token and mints the initial supply in one transaction.
+
+    Mint account creation, mint initialization, creation of the creator's
+    associated token account and the initial mint are atomic, so a failure
+    leaves no partially created token behind.
+
+    Args:
+        mint: Keypair of the mint account, a new one by default. Sending
+            again for the same keypair can't create a second token.
+
+    Returns:
+        Address of the new mint
+    """
     client = await get_sonic_testnet_client()
-    token_client = await AsyncToken.create_mint(
-        client,
-        get_keypair(),
-        get_keypair().pubkey(),
-        DEFAULT_DECIMALS,
-        TOKEN_PROGRAM_ID,
-    )
+    payer = get_keypair()
+    mint = mint or Keypair()
 
-    logger.info("Created mint: %s", token_client.pubkey)
+    rent, latest_blockhash = await asyncio.gather(
+        AsyncToken.get_min_balance_rent_for_exempt_for_mint(client),
+        client.get_latest_blockhash(),
+    )
 
-    # Get the associated token account address
     associated_token_account = get_associated_token_address(
-        owner=get_keypair().pubkey(), mint=token_client.pubkey
+        owner=payer.pubkey(), mint=mint.pubkey()
     )
 
-    logger.info("Associated token account: %s", associated_token_account)
+    instructions = [
+        create_account(
+            CreateAccountParams(
+                from_pubkey=payer.pubkey(),
+                to_pubkey=mint.pubkey(),
+                lamports=rent,
+                space=MINT_LEN,
+                owner=TOKEN_PROGRAM_ID,
+            )
+        ),
+        initialize_mint(
+            InitializeMintParams(
+                program_id=TOKEN_PROGRAM_ID,
+                mint=mint.pubkey(),
+                decimals=DEFAULT_DECIMALS,
+                mint_authority=payer.pubkey(),
+            )
+        ),
+        create_associated_token_account(
+            payer=payer.pubkey(), owner=payer.pubkey(), mint=mint.pubkey()
+        ),
+        mint_to(
+            MintToParams(
+                program_id=TOKEN_PROGRAM_ID,
+                mint=mint.pubkey(),
+                dest=associated_token_account,
+                mint_authority=payer.pubkey(),
+                amount=INITIAL_MINT_AMOUNT,
+            )
+        ),
+    ]
+
+    blockhash = latest_blockhash.value.blockhash
+    message = Message.new_with_blockhash(instructions, payer.pubkey(), blockhash)
+    transaction = Transaction([payer, mint], message, blockhash)
+
+    # Waits for confirmation, the market must only be stored for a live mint.
+    resp = await client.send_transaction(
+        transaction,
+        opts=TxOpts(
+            skip_confirmation=False,
+            preflight_commitment=client.commitment,
+            last_valid_block_height=latest_blockhash.value.last_valid_block_height,
+        ),
+    )
 
-    # Create associated token account if it doesn't exist
-    await token_client.create_associated_token_account(owner=get_keypair().pubkey())
+    logger.info(
+        "Created mint %s with %s tokens in %s in transaction %s",
+        mint.pubkey(),
+        INITIAL_MINT_AMOUNT,
+        associated_token_account,
+        resp.value,
+    )
 
-    logger.info("Created associated token account")
+    return str(mint.pubkey())
 
-    # mint 100_000_000 tokens to the associated token account
-    await token_client.mint_to(
-        dest=associated_token_account,
-        mint_authority=get_keypair().pubkey(),
-        amount=100_000_000,
-        multi_signers=[get_keypair()],
-    )
 
-    logger.info("Minted tokens successfully")
+async def mint_exists(address: Pubkey) -> bool:
+    """Whether the mint account exists, i.e. its creation landed."""
+    client = await get_sonic_testnet_client()
+    resp = await client.get_account_info(address)
 
-    return str(token_client.pubkey)
+    return resp.value is not None
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class MarketsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'markets'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+
+        from markets.listing_cache import invalidate_market_listing
+        from markets.models import AttentionMarket
+        from tools.metrics import install_db_query_timer
+
+        connection_created.connect(install_db_query_timer)
+        post_save.connect(invalidate_market_listing, sender=AttentionMarket)
+        post_delete.connect(invalidate_market_listing, sender=AttentionMarket)
@@ -0,0 +1,271 @@
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+import msgspec
+from fastapi import WebSocket, WebSocketDisconnect, status
+
+from markets.models import AttentionMarket
+
+logger = logging.getLogger(__name__)
+
+# Messages buffered per connection, a client falling this far behind is
+# disconnected rather than slowing down the others.
+TRADE_STREAM_QUEUE_SIZE = int(os.getenv("TRADE_STREAM_QUEUE_SIZE", 256))
+# A send blocked for longer, on a full socket buffer, also disconnects.
+TRADE_STREAM_SEND_TIMEOUT = float(os.getenv("TRADE_STREAM_SEND_TIMEOUT", 10))
+TRADE_STREAM_MAX_MARKETS = int(os.getenv("TRADE_STREAM_MAX_MARKETS", 100))
+
+
+class TradeSubscriber:
+    """A connection's subscriptions and its queue of encoded messages."""
+
+    __slots__ = ("market_ids", "queue", "close_code")
+
+    def __init__(self, queue_size: int):
+        self.market_ids: Set[int] = set()
+        # None is queued last, once the connection must be closed.
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.close_code: Optional[int] = None
+
+
+class TradeBroadcastHub:
+    """
+    Fans out newly stored trades to the subscribers of their market.
+
+    A batch of trades is encoded once and the same message is queued for
+    every subscriber, without waiting on any of them. A subscriber whose
+    queue is full is evicted. Idle subscribers cost a set entry per market
+    and an empty queue.
+    """
+
+    def __init__(self, queue_size: int = TRADE_STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers_by_market: Dict[int, Set[TradeSubscriber]] = {}
+        self._subscribers: Set[TradeSubscriber] = set()
+        self._counters = defaultdict(int)
+
+    def connect(self) -> TradeSubscriber:
+        subscriber = TradeSubscriber(self.queue_size)
+        self._subscribers.add(subscriber)
+
+        return subscriber
+
+    def disconnect(self, subscriber: TradeSubscriber):
+        self.unsubscribe(subscriber, list(subscriber.market_ids))
+        self._subscribers.discard(subscriber)
+
+    def subscribe(self, subscriber: TradeSubscriber, market_ids: Iterable[int]):
+        for market_id in market_ids:
+            subscriber.market_ids.add(market_id)
+            self._subscribers_by_market.setdefault(market_id, set()).add(subscriber)
+
+    def unsubscribe(self, subscriber: TradeSubscriber, market_ids: Iterable[int]):
+        for market_id in market_ids:
+            subscriber.market_ids.discard(market_id)
+            subscribers = self._subscribers_by_market.get(market_id)
+            if subscribers is None:
+                continue
+
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers_by_market[market_id]
+
+    def has_subscribers(self, market_id: int) -> bool:
+        return market_id in self._subscribers_by_market
+
+    def publish(self, market_id: int, trades: List[dict]) -> int:
+        """
+        Queues trades of a market, oldest first, for its subscribers.
+
+        Returns:
+            Number of subscribers the trades were queued for
+        """
+        subscribers = self._subscribers_by_market.get(market_id)
+        if not subscribers or not trades:
+            return 0
+
+        message = encode_message(
+            {"type": "trades", "market_id": market_id, "trades": trades}
+        )
+        self._counters["published"] += 1
+
+        delivered = 0
+        for subscriber in list(subscribers):
+            if self.send(subscriber, message):
+                delivered += 1
+
+        return delivered
+
+    def send(self, subscriber: TradeSubscriber, message: str) -> bool:
+        """Queues a message for one subscriber, evicts it if it is too slow."""
+        if subscriber.close_code is not None:
+            return False
+
+        try:
+            subscriber.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.evict(subscriber)
+            return False
+
+        self._counters["sent"] += 1
+        return True
+
+    def evict(self, subscriber: TradeSubscriber):
+        self._counters["evicted"] += 1
+        self.close(subscriber, status.WS_1013_TRY_AGAIN_LATER)
+
+    def close(
+        self, subscriber: TradeSubscriber, code: int = status.WS_1000_NORMAL_CLOSURE
+    ):
+        """Drops the subscriber and its backlog, its connection is closed next."""
+        self.disconnect(subscriber)
+        subscriber.close_code = code
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def close_all(self, code: int = status.WS_1001_GOING_AWAY):
+        for subscriber in list(self._subscribers):
+            self.close(subscriber, code)
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "markets": len(self._subscribers_by_market),
+            "subscriptions": sum(map(len, self._subscribers_by_market.values())),
+            **self._counters,
+        }
+
+
+def encode_message(message: dict) -> str:
+    return msgspec.json.encode(message).decode()
+
+
+async def serve_trade_stream(
+    websocket: WebSocket, hub: TradeBroadcastHub, market_ids: List[int]
+):
+    """
+    Runs an accepted trade stream connection until either side closes it.
+
+    Client commands are read concurrently with sending the subscriber's
+    queue, every message to the client goes through that queue.
+    """
+    subscriber = hub.connect()
+    try:
+        await _update_subscriptions(hub, subscriber, "subscribe", market_ids)
+
+        tasks = [
+            asyncio.ensure_future(_receive_commands(websocket, hub, subscriber)),
+            asyncio.ensure_future(_send_messages(websocket, hub, subscriber)),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.disconnect(subscriber)
+
+
+async def _receive_commands(
+    websocket: WebSocket, hub: TradeBroadcastHub, subscriber: TradeSubscriber
+):
+    while True:
+        try:
+            command = await websocket.receive_json()
+            action = command["action"]
+            market_ids = [int(market_id) for market_id in command["markets"]]
+        except WebSocketDisconnect:
+            raise
+        except (ValueError, TypeError, KeyError):
+            hub.send(
+                subscriber,
+                encode_message({"type": "error", "detail": "Invalid command"}),
+            )
+            continue
+
+        if action not in ("subscribe", "unsubscribe"):
+            hub.send(
+                subscriber,
+                encode_message({"type": "error", "detail": "Unknown action"}),
+            )
+            continue
+
+        await _update_subscriptions(hub, subscriber, action, market_ids)
+
+
+async def _update_subscriptions(
+    hub: TradeBroadcastHub,
+    subscriber: TradeSubscriber,
+    action: str,
+    market_ids: List[int],
+):
+    if action == "unsubscribe":
+        hub.unsubscribe(subscriber, market_ids)
+        unknown = []
+    else:
+        known = {
+            market_id
+            async for market_id in AttentionMarket.objects.filter(
+                id__in=market_ids
+            ).values_list("id", flat=True)
+        }
+        unknown = sorted(set(market_ids) - known)
+        if len(subscriber.market_ids | known) > TRADE_STREAM_MAX_MARKETS:
+            hub.send(
+                subscriber,
+                encode_message(
+                    {
+                        "type": "error",
+                        "detail": f"At most {TRADE_STREAM_MAX_MARKETS} markets per connection",
+                    }
+                ),
+            )
+            return
+
+        hub.subscribe(subscriber, known)
+
+    hub.send(
+        subscriber,
+        encode_message(
+            {
+                "type": "subscriptions",
+                "markets": sorted(subscriber.market_ids),
+                "unknown": unknown,
+            }
+        ),
+    )
+
+
+async def _send_messages(
+    websocket: WebSocket, hub: TradeBroadcastHub, subscriber: TradeSubscriber
+):
+    while True:
+        message = await subscriber.queue.get()
+        try:
+            if message is None:
+                await websocket.close(code=subscriber.close_code)
+                return
+
+            await asyncio.wait_for(
+                websocket.send_text(message), timeout=TRADE_STREAM_SEND_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            # The socket is unusable mid-frame, drop it without a close frame.
+            logger.warning("Evicting trade stream client stuck on a send")
+            hub.evict(subscriber)
+            return
+        except (RuntimeError, OSError):
+            # Sends to a client that went away fail as per the ASGI server.
+            return
+
+
+trade_broadcast_hub = TradeBroadcastHub()
@@ -0,0 +1,168 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+
+from markets.models import AttentionMarket, Candle, MarketTradeCursor, TokenTrade
+
+# Bucket length in seconds of every maintained interval.
+CANDLE_INTERVALS = {
+    "1m": 60,
+    "5m": 5 * 60,
+    "1h": 60 * 60,
+    "1d": 24 * 60 * 60,
+}
+CANDLE_FIELDS = [
+    "bucket_start",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume_sol",
+    "volume_token",
+    "trade_count",
+]
+CANDLE_UPDATE_FIELDS = CANDLE_FIELDS[1:] + [
+    "open_timestamp",
+    "open_trade_id",
+    "close_timestamp",
+    "close_trade_id",
+]
+REBUILD_CHUNK_SIZE = 5000
+
+
+def update_candles(market_id: int, trades: Iterable[TokenTrade]):
+    """
+    Folds newly stored trades into the market's candles of every interval.
+
+    Must run in the transaction storing the trades, after they got their
+    ids, and with the market's trade cursor locked so that updates of a
+    market are serialized.
+    """
+    trades = [trade for trade in trades if trade.token_amount]
+    if not trades:
+        return
+
+    for interval, seconds in CANDLE_INTERVALS.items():
+        trades_by_bucket = defaultdict(list)
+        for trade in trades:
+            trades_by_bucket[trade.timestamp - trade.timestamp % seconds].append(trade)
+
+        candles = {
+            candle.bucket_start: candle
+            for candle in Candle.objects.filter(
+                market_id=market_id,
+                interval=interval,
+                bucket_start__in=list(trades_by_bucket),
+            )
+        }
+
+        new_candles = []
+        for bucket_start, bucket_trades in trades_by_bucket.items():
+            candle = candles.get(bucket_start)
+            for trade in bucket_trades:
+                if candle is None:
+                    candle = _new_candle(market_id, interval, bucket_start, trade)
+                    new_candles.append(candle)
+                else:
+                    _add_trade(candle, trade)
+
+        Candle.objects.bulk_create(new_candles)
+        Candle.objects.bulk_update(candles.values(), CANDLE_UPDATE_FIELDS)
+
+
+def _new_candle(
+    market_id: int, interval: str, bucket_start: int, trade: TokenTrade
+) -> Candle:
+    price = trade.sol_amount / trade.token_amount
+
+    return Candle(
+        market_id=market_id,
+        interval=interval,
+        bucket_start=bucket_start,
+        open=price,
+        high=price,
+        low=price,
+        close=price,
+        volume_sol=trade.sol_amount,
+        volume_token=trade.token_amount,
+        trade_count=1,
+        open_timestamp=trade.timestamp,
+        open_trade_id=trade.id,
+        close_timestamp=trade.timestamp,
+        close_trade_id=trade.id,
+    )
+
+
+def _add_trade(candle: Candle, trade: TokenTrade):
+    price = trade.sol_amount / trade.token_amount
+    key = (trade.timestamp, trade.id)
+
+    candle.high = max(candle.high, price)
+    candle.low = min(candle.low, price)
+    candle.volume_sol += trade.sol_amount
+    candle.volume_token += trade.token_amount
+    candle.trade_count += 1
+    if key < (candle.open_timestamp, candle.open_trade_id):
+        candle.open = price
+        candle.open_timestamp, candle.open_trade_id = key
+    if key > (candle.close_timestamp, candle.close_trade_id):
+        candle.close = price
+        candle.close_timestamp, candle.close_trade_id = key
+
+
+def rebuild_candles(market_id: int):
+    """Recomputes all candles of a market from its stored trades."""
+    with transaction.atomic():
+        # Holds off concurrent trade stores of the market.
+        MarketTradeCursor.objects.select_for_update().filter(
+            market_id=market_id
+        ).first()
+        Candle.objects.filter(market_id=market_id).delete()
+
+        trades = TokenTrade.objects.filter(market_id=market_id).order_by(
+            "timestamp", "id"
+        )
+        chunk = []
+        for trade in trades.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+            chunk.append(trade)
+            if len(chunk) == REBUILD_CHUNK_SIZE:
+                update_candles(market_id, chunk)
+                chunk = []
+
+        update_candles(market_id, chunk)
+
+
+async def get_candles(
+    market: AttentionMarket,
+    interval: str,
+    *,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    limit: int,
+) -> List[Dict]:
+    """
+    Returns the market's bars of `interval`, oldest first.
+
+    Args:
+        market: Market of the trades
+        interval: One of `CANDLE_INTERVALS`
+        start: Unix time of the first bucket, inclusive
+        end: Unix time of the last bucket, exclusive
+        limit: Maximum number of bars, the latest ones when `start` is not set
+
+    Returns:
+        Bars as dicts, buckets without trades are omitted
+    """
+    candles = Candle.objects.filter(market=market, interval=interval)
+    if start is not None:
+        candles = candles.filter(bucket_start__gte=start)
+    if end is not None:
+        candles = candles.filter(bucket_start__lt=end)
+
+    if start is None:
+        candles = candles.order_by("-bucket_start").values(*CANDLE_FIELDS)[:limit]
+        return list(reversed([candle async for candle in candles]))
+
+    candles = candles.order_by("bucket_start").values(*CANDLE_FIELDS)[:limit]
+    return [candle async for candle in candles]
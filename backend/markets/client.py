@@ -1,5 +1,61 @@
+import logging
+from typing import Dict
+
+import httpx
 from solana.rpc.async_api import AsyncClient
 
+from markets.rpc_pool import rpc_pool
+from tools.http import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# One solana client per pool endpoint, keyed by URL.
+_clients: Dict[str, AsyncClient] = {}
+
+
+async def get_sonic_testnet_client() -> AsyncClient:
+    """
+    Returns the solana client of the currently best RPC endpoint.
+
+    Clients are worker wide and each shares one keep-alive pool. Callers
+    should hold on to the returned client for a multi step flow, so that
+    e.g. a confirmation is asked from the node the transaction was sent to.
+    """
+    url = rpc_pool.pick().url
+
+    if url not in _clients:
+        client = AsyncClient(url, timeout=HTTP_TIMEOUT)
+
+        # Swap the provider's default httpx session for one sized like the
+        # aiohttp pool in tools.http. The provider and its session are
+        # private to solana-py, as of the pinned 0.36, if a release moves
+        # them the client keeps its default pool.
+        provider = getattr(client, "_provider", None)
+        session = getattr(provider, "session", None)
+        if isinstance(session, httpx.AsyncClient):
+            await session.aclose()
+            provider.session = httpx.AsyncClient(
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_LIMIT_PER_HOST,
+                    max_keepalive_connections=HTTP_POOL_LIMIT_PER_HOST,
+                    keepalive_expiry=HTTP_KEEPALIVE_TIMEOUT,
+                ),
+            )
+        else:
+            logger.warning("Can't size the HTTP pool of the Solana client")
+        _clients[url] = client
+
+    return _clients[url]
+
+
+async def close_sonic_testnet_client():
+    for client in _clients.values():
+        await client.close()
 
-async def get_sonic_testnet_client():
-    return AsyncClient("https://api.testnet.v1.sonic.game")
+    _clients.clear()
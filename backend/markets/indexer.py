@@ -0,0 +1,199 @@
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+from django.utils import timezone
+
+from markets.models import AttentionMarket, MarketTradeCursor
+from markets.rpc import (
+    SIGNATURES_PAGE_SIZE,
+    TransactionFetchError,
+    get_signatures,
+    get_successful_sig_objs,
+    get_transactions,
+)
+from markets.token_trades import get_sol_token_trades_from_transactions
+from markets.trade_index import store_market_trades, sync_market_trades
+
+logger = logging.getLogger(__name__)
+
+INDEXER_POLL_INTERVAL = float(os.getenv("INDEXER_POLL_INTERVAL", 2))
+INDEXER_MAX_POLL_INTERVAL = float(os.getenv("INDEXER_MAX_POLL_INTERVAL", 60))
+INDEXER_BACKOFF_FACTOR = float(os.getenv("INDEXER_BACKOFF_FACTOR", 2))
+
+
+class TradeIndexer:
+    """
+    Polls every attention market for new trades in one loop.
+
+    Each tick batches `getSignaturesForAddress` for all due markets into a
+    single JSON-RPC call, then fetches only the new transactions. Markets
+    without activity are polled less often, up to `max_interval`.
+    """
+
+    def __init__(
+        self,
+        *,
+        poll_interval: float = INDEXER_POLL_INTERVAL,
+        max_interval: float = INDEXER_MAX_POLL_INTERVAL,
+        backoff_factor: float = INDEXER_BACKOFF_FACTOR,
+    ):
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+
+        self._interval_by_market: Dict[int, float] = {}
+        self._next_poll_by_market: Dict[int, float] = {}
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        logger.info("Stopping trade indexer")
+        self._stop.set()
+
+    async def run(self):
+        logger.info("Trade indexer started")
+        while not self._stop.is_set():
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Trade indexer tick failed")
+
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self._sleep_time())
+            except asyncio.TimeoutError:
+                pass
+
+        logger.info("Trade indexer stopped")
+
+    async def tick(self):
+        all_markets = [market async for market in AttentionMarket.objects.all()]
+
+        # Forget schedules of deleted markets.
+        market_ids = {market.id for market in all_markets}
+        for market_id in list(self._next_poll_by_market):
+            if market_id not in market_ids:
+                del self._next_poll_by_market[market_id]
+                del self._interval_by_market[market_id]
+
+        now = time.monotonic()
+        markets = [
+            market
+            for market in all_markets
+            if self._next_poll_by_market.get(market.id, 0) <= now
+        ]
+        if not markets:
+            return
+
+        cursors = {
+            cursor.market_id: cursor.last_signature
+            async for cursor in MarketTradeCursor.objects.filter(market__in=markets)
+        }
+
+        # Markets never indexed need a full history walk.
+        backfill = [market for market in markets if not cursors.get(market.id)]
+        polled = [market for market in markets if cursors.get(market.id)]
+
+        for market in backfill:
+            new_trades = await sync_market_trades(market)
+            self._schedule(market.id, active=bool(new_trades))
+
+        if polled:
+            await self._poll(polled, cursors)
+
+    async def _poll(self, markets: List[AttentionMarket], cursors: Dict[int, str]):
+        # Failed transactions are kept to tell a full page from a partial one.
+        signatures_by_addr = await get_signatures(
+            [market.address for market in markets],
+            {market.address: cursors[market.id] for market in markets},
+            only_successful=False,
+        )
+
+        idle_market_ids = []
+        new_signatures_by_market = {}
+        newest_signature_by_market = {}
+        for market in markets:
+            sig_objs = signatures_by_addr.get(market.address)
+            if sig_objs is None:
+                # Failed lookup, try again on the next regular tick.
+                self._schedule(market.id, active=True)
+            elif len(sig_objs) >= SIGNATURES_PAGE_SIZE:
+                # Too much activity for one page, walk it fully.
+                await sync_market_trades(market)
+                self._schedule(market.id, active=True)
+            elif not sig_objs:
+                idle_market_ids.append(market.id)
+                self._schedule(market.id, active=False)
+            else:
+                newest_signature_by_market[market.id] = sig_objs[0]["signature"]
+                new_signatures_by_market[market.id] = [
+                    sig_obj["signature"]
+                    for sig_obj in get_successful_sig_objs(sig_objs)
+                ]
+                self._schedule(market.id, active=True)
+
+        if idle_market_ids:
+            await MarketTradeCursor.objects.filter(
+                market_id__in=idle_market_ids
+            ).aupdate(synced_at=timezone.now())
+
+        if not new_signatures_by_market:
+            return
+
+        market_ids_by_signature = defaultdict(list)
+        for market_id, signatures in new_signatures_by_market.items():
+            for signature in signatures:
+                market_ids_by_signature[signature].append(market_id)
+
+        unresolved = set()
+        try:
+            transactions = await get_transactions(list(market_ids_by_signature))
+        except TransactionFetchError as e:
+            logger.warning("Failed to get %s transactions", len(e.unresolved))
+            transactions = e.transactions
+            unresolved = set(e.unresolved)
+
+        trades_by_market = defaultdict(list)
+        for trade_info in get_sol_token_trades_from_transactions(transactions):
+            for market_id in market_ids_by_signature[trade_info.signature]:
+                trades_by_market[market_id].append(trade_info)
+
+        for market_id, signatures in new_signatures_by_market.items():
+            # A market missing transactions keeps its cursor, they are fetched
+            # again on its next poll.
+            complete = unresolved.isdisjoint(signatures)
+            new_trades = await store_market_trades(
+                market_id,
+                trades_by_market[market_id],
+                since_signature=cursors[market_id],
+                newest_signature=(
+                    newest_signature_by_market[market_id]
+                    if complete
+                    else cursors[market_id]
+                ),
+            )
+            logger.info(
+                "Indexed %s new trades for market %s", len(new_trades), market_id
+            )
+
+    def _schedule(self, market_id: int, *, active: bool):
+        if active:
+            interval = self.poll_interval
+        else:
+            interval = min(
+                self._interval_by_market.get(market_id, self.poll_interval)
+                * self.backoff_factor,
+                self.max_interval,
+            )
+
+        self._interval_by_market[market_id] = interval
+        self._next_poll_by_market[market_id] = time.monotonic() + interval
+
+    def _sleep_time(self) -> float:
+        if not self._next_poll_by_market:
+            return self.poll_interval
+
+        next_poll = min(self._next_poll_by_market.values())
+        return min(max(next_poll - time.monotonic(), 0), self.poll_interval)
@@ -0,0 +1,199 @@
+import os
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Optional, Set
+
+from django.db.models import F
+from django.utils import timezone
+
+from solders.keypair import Keypair
+
+from markets.api import create_and_mint_token, create_attention_market, mint_exists
+from markets.mint_pool import claim_pooled_mint, mint_pool_filler
+from markets.models import AttentionMarket, MarketCreationJob
+from tools.tracing import create_background_task
+
+logger = logging.getLogger(__name__)
+
+MARKET_CREATION_CONCURRENCY = int(os.getenv("MARKET_CREATION_CONCURRENCY", 4))
+# A job running for longer is assumed lost with its worker and is retried.
+MARKET_CREATION_STALE_AFTER = timedelta(
+    seconds=float(os.getenv("MARKET_CREATION_STALE_AFTER", 300))
+)
+# Submitting waits this long for the job, enough for one served from the
+# mint pool to complete within the request.
+MARKET_CREATION_INLINE_WAIT = float(os.getenv("MARKET_CREATION_INLINE_WAIT", 2))
+
+
+class MarketCreationExecutor:
+    """
+    Runs market creation jobs in the background of the API worker.
+
+    Jobs live in the database, so any worker can resume them after a
+    restart. A job is claimed with a conditional update before running,
+    so it never runs twice at the same time, even across workers.
+    """
+
+    def __init__(self, concurrency: int = MARKET_CREATION_CONCURRENCY):
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, slug: str, image_url: str) -> MarketCreationJob:
+        """
+        Returns the creation job of `slug`, creating and scheduling it once.
+
+        Submitting a slug again returns its job, a failed or lost job is
+        rescheduled.
+        """
+        market = await AttentionMarket.objects.filter(slug=slug).afirst()
+        job, created = await MarketCreationJob.objects.aget_or_create(
+            slug=slug,
+            defaults={
+                "image_url": image_url,
+                # Markets created before jobs existed.
+                "status": (
+                    MarketCreationJob.SUCCEEDED if market else MarketCreationJob.PENDING
+                ),
+                "market": market,
+                "token_address": market.address if market else None,
+            },
+        )
+
+        if not created and await self._reset(job):
+            job = await MarketCreationJob.objects.aget(id=job.id)
+
+        if job.status == MarketCreationJob.PENDING:
+            task = self._schedule(job.id)
+            await asyncio.wait({task}, timeout=MARKET_CREATION_INLINE_WAIT)
+            job = await MarketCreationJob.objects.aget(id=job.id)
+
+        return job
+
+    async def resume(self):
+        """Schedules every pending or lost job."""
+        await MarketCreationJob.objects.filter(
+            status=MarketCreationJob.RUNNING,
+            updated_at__lt=timezone.now() - MARKET_CREATION_STALE_AFTER,
+        ).aupdate(status=MarketCreationJob.PENDING, updated_at=timezone.now())
+
+        async for job_id in MarketCreationJob.objects.filter(
+            status=MarketCreationJob.PENDING
+        ).values_list("id", flat=True):
+            self._schedule(job_id)
+
+    def start(self):
+        self._spawn(self.resume())
+
+    async def stop(self):
+        # Interrupted jobs stay running until they go stale and are retried.
+        for task in list(self._tasks):
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _reset(self, job: MarketCreationJob) -> bool:
+        """Moves a failed or lost job back to pending."""
+        jobs = MarketCreationJob.objects.filter(id=job.id)
+        reset = await jobs.filter(status=MarketCreationJob.FAILED).aupdate(
+            status=MarketCreationJob.PENDING, error=None, updated_at=timezone.now()
+        )
+        if not reset:
+            reset = await jobs.filter(
+                status=MarketCreationJob.RUNNING,
+                updated_at__lt=timezone.now() - MARKET_CREATION_STALE_AFTER,
+            ).aupdate(status=MarketCreationJob.PENDING, updated_at=timezone.now())
+
+        return bool(reset)
+
+    def _schedule(self, job_id: int) -> asyncio.Task:
+        return self._spawn(self._run(job_id))
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        # Keep a reference, the loop only holds weak ones to tasks. Jobs
+        # outlive the request submitting them, so stay out of its trace.
+        task = create_background_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return task
+
+    async def _run(self, job_id: int):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            await run_market_creation_job(job_id)
+
+
+async def run_market_creation_job(job_id: int) -> bool:
+    """
+    Runs a pending job, returns False if it wasn't pending.
+
+    The token is taken from the mint pool, or minted if the pool is empty.
+    Its address is saved before the market is created, so a job failing in
+    between reuses its token when retried. See `mint_job_token` for a job
+    failing while minting.
+    """
+    claimed = await MarketCreationJob.objects.filter(
+        id=job_id, status=MarketCreationJob.PENDING
+    ).aupdate(
+        status=MarketCreationJob.RUNNING,
+        attempts=F("attempts") + 1,
+        updated_at=timezone.now(),
+    )
+    if not claimed:
+        return False
+
+    job = await MarketCreationJob.objects.aget(id=job_id)
+    try:
+        if job.token_address is None:
+            job.token_address = await claim_pooled_mint(job.id)
+            mint_pool_filler.request_refill()
+
+        if job.token_address is None:
+            job.token_address = await mint_job_token(job)
+            await job.asave(update_fields=["token_address", "updated_at"])
+
+        job.market = await create_attention_market(
+            job.slug, job.image_url, token_address=job.token_address
+        )
+        job.status = MarketCreationJob.SUCCEEDED
+        job.error = None
+    except Exception as e:
+        logger.exception("Market creation job %s failed", job_id)
+        job.status = MarketCreationJob.FAILED
+        job.error = str(e) or type(e).__name__
+
+    await job.asave(update_fields=["market", "status", "error", "updated_at"])
+
+    return True
+
+
+async def mint_job_token(job: MarketCreationJob) -> str:
+    """
+    Mints the token of a job, at most once across retries.
+
+    The mint keypair is saved on the job before the transaction is sent.
+    A retry after a timeout or crash checks whether that mint exists on
+    chain, and otherwise sends again for the same mint, which fails rather
+    than mint twice if the first transaction lands late.
+
+    Returns:
+        Address of the mint
+    """
+    if job.mint_keypair is not None:
+        mint = Keypair.from_base58_string(job.mint_keypair)
+        if await mint_exists(mint.pubkey()):
+            logger.info("Job %s found its mint %s on chain", job.id, mint.pubkey())
+            return str(mint.pubkey())
+    else:
+        mint = Keypair()
+        job.mint_keypair = str(mint)
+        await job.asave(update_fields=["mint_keypair", "updated_at"])
+
+    return await create_and_mint_token(mint)
+
+
+market_creation_executor = MarketCreationExecutor()
@@ -0,0 +1,111 @@
+import os
+import time
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+import msgspec
+from django.db.models import F
+from django.utils import timezone
+
+from markets.models import AttentionMarket, CacheVersion
+
+# Workers check the shared version at most this often, so a market created
+# on another worker shows up within this many seconds.
+LISTING_VERSION_CHECK_INTERVAL = float(os.getenv("LISTING_VERSION_CHECK_INTERVAL", 1))
+
+MARKET_LISTING_KEY = "attention_markets"
+MARKET_LISTING_FIELDS = ["id", "slug", "image_url", "address"]
+
+
+@dataclass(frozen=True)
+class CachedListing:
+    version: int
+    body: bytes
+    etag: str
+    last_modified: Optional[datetime]
+
+
+class MarketListingCache:
+    """
+    In-process cache of the serialized market listing.
+
+    The listing is keyed by a `CacheVersion` row that every save or delete
+    of a market bumps, see `invalidate_market_listing`. Between version
+    checks a read costs no database query, and the ETag only changes when
+    the listing does. The row's bump time is the listing's Last-Modified,
+    deleting a market moves it forward too.
+    """
+
+    def __init__(self, key: str = MARKET_LISTING_KEY):
+        self.key = key
+        self._listing: Optional[CachedListing] = None
+        self._version: Optional[Tuple[int, Optional[datetime]]] = None
+        self._version_checked_at = 0.0
+
+    async def get(self) -> CachedListing:
+        version, updated_at = await self._get_version()
+        if self._listing is None or self._listing.version != version:
+            self._listing = await self._build(version, updated_at)
+
+        return self._listing
+
+    def invalidate(self):
+        """
+        Bumps the shared version and drops this worker's copy.
+
+        Synchronous, to run in the transaction of the change, so the bump
+        commits or rolls back with it.
+        """
+        updated = CacheVersion.objects.filter(key=self.key).update(
+            version=F("version") + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            CacheVersion.objects.get_or_create(key=self.key, defaults={"version": 1})
+
+        self._listing = None
+        self._version = None
+
+    async def _get_version(self) -> Tuple[int, Optional[datetime]]:
+        now = time.monotonic()
+        if (
+            self._version is None
+            or now - self._version_checked_at >= LISTING_VERSION_CHECK_INTERVAL
+        ):
+            self._version = (
+                await CacheVersion.objects.filter(key=self.key)
+                .values_list("version", "updated_at")
+                .afirst()
+            ) or (0, None)
+            self._version_checked_at = now
+
+        return self._version
+
+    async def _build(
+        self, version: int, updated_at: Optional[datetime]
+    ) -> CachedListing:
+        # The version is read before the markets, a change in between bumps
+        # it again and the next check rebuilds.
+        markets = [
+            market
+            async for market in AttentionMarket.objects.order_by("id").values(
+                *MARKET_LISTING_FIELDS
+            )
+        ]
+        body = msgspec.json.encode(markets)
+
+        return CachedListing(
+            version=version,
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"',
+            last_modified=updated_at,
+        )
+
+
+market_listing_cache = MarketListingCache()
+
+
+def invalidate_market_listing(sender, **kwargs):
+    """`post_save` and `post_delete` receiver of `AttentionMarket`."""
+    market_listing_cache.invalidate()
@@ -0,0 +1,275 @@
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from itertools import count
+from typing import Dict, List
+
+import aiohttp
+
+from markets.models import AttentionMarket, MarketTradeCursor
+from markets.rpc import TransactionFetchError, get_transactions
+from markets.rpc_pool import RPC_URLS
+from markets.token_trades import get_sol_token_trades_from_transactions
+from markets.trade_index import store_market_trades, sync_market_trades
+from tools.http import get_http_session
+
+logger = logging.getLogger(__name__)
+
+# Defaults to the websocket endpoint of the first RPC endpoint.
+RPC_WS_URL = os.getenv(
+    "RPC_WS_URL",
+    RPC_URLS[0].replace("https://", "wss://", 1).replace("http://", "ws://", 1),
+)
+# Finalized, like the transactions fetched and cached for the signatures.
+WS_COMMITMENT = "finalized"
+# Notified signatures are fetched in batches, at least this often.
+WS_FLUSH_INTERVAL = float(os.getenv("WS_FLUSH_INTERVAL", 0.5))
+WS_FLUSH_SIZE = 100
+# Cursor sync of every market, catches notifications missed while connected.
+WS_RECONCILE_INTERVAL = float(os.getenv("WS_RECONCILE_INTERVAL", 60))
+WS_MARKETS_REFRESH_INTERVAL = float(os.getenv("WS_MARKETS_REFRESH_INTERVAL", 10))
+WS_HEARTBEAT = 30
+WS_MIN_RECONNECT_DELAY = 1
+WS_MAX_RECONNECT_DELAY = 30
+
+
+class TradeLogSubscriber:
+    """
+    Ingests trades pushed by a JSON-RPC websocket instead of polling.
+
+    Every market mint gets a `logsSubscribe` subscription. Notified
+    signatures are buffered, fetched, classified and stored in batches,
+    without moving the market cursors. The cursor sync fills gaps: on every
+    (re)connect, once subscribed, and every `reconcile_interval`, which
+    also advances the cursors. The connection is reopened with backoff.
+    """
+
+    def __init__(
+        self,
+        url: str = RPC_WS_URL,
+        *,
+        flush_interval: float = WS_FLUSH_INTERVAL,
+        reconcile_interval: float = WS_RECONCILE_INTERVAL,
+        markets_refresh_interval: float = WS_MARKETS_REFRESH_INTERVAL,
+    ):
+        self.url = url
+        self.flush_interval = flush_interval
+        self.reconcile_interval = reconcile_interval
+        self.markets_refresh_interval = markets_refresh_interval
+
+        self._stop = asyncio.Event()
+        self._request_ids = count(1)
+        # Per connection state.
+        self._market_by_request_id: Dict[int, AttentionMarket] = {}
+        self._market_by_subscription: Dict[int, AttentionMarket] = {}
+        self._subscription_by_market: Dict[int, int] = {}
+        # Notified signatures with the markets they were notified for.
+        self._pending: Dict[str, List[int]] = defaultdict(list)
+        self._counters = defaultdict(int)
+
+    def stop(self):
+        logger.info("Stopping trade log subscriber")
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "subscriptions": len(self._subscription_by_market),
+            "pending_signatures": len(self._pending),
+            **self._counters,
+        }
+
+    async def run(self):
+        logger.info("Trade log subscriber started")
+        delay = WS_MIN_RECONNECT_DELAY
+        while not self._stop.is_set():
+            connected_at = time.monotonic()
+            try:
+                await self._run_connection()
+            except (aiohttp.ClientError, ConnectionError) as e:
+                logger.warning("Lost connection to %s: %s", self.url, e)
+            except Exception:
+                logger.exception("Trade log subscription to %s failed", self.url)
+
+            if self._stop.is_set():
+                break
+
+            # Reset the backoff after a connection that held for a while.
+            if time.monotonic() - connected_at > WS_MAX_RECONNECT_DELAY:
+                delay = WS_MIN_RECONNECT_DELAY
+
+            self._counters["reconnects"] += 1
+            logger.warning("Reconnecting to %s in %ss", self.url, delay)
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, WS_MAX_RECONNECT_DELAY)
+
+        logger.info("Trade log subscriber stopped")
+
+    async def _run_connection(self):
+        self._market_by_request_id.clear()
+        self._market_by_subscription.clear()
+        self._subscription_by_market.clear()
+
+        async with get_http_session().ws_connect(
+            self.url, heartbeat=WS_HEARTBEAT
+        ) as ws:
+            logger.info("Connected to %s", self.url)
+            await self._refresh_subscriptions(ws)
+
+            tasks = [
+                asyncio.ensure_future(self._receive(ws)),
+                asyncio.ensure_future(self._flush_periodically()),
+                asyncio.ensure_future(self._maintain(ws)),
+                asyncio.ensure_future(self._stop.wait()),
+            ]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+            # Store what was notified before the connection went away.
+            await self._flush()
+
+    async def _receive(self, ws: aiohttp.ClientWebSocketResponse):
+        async for message in ws:
+            if message.type == aiohttp.WSMsgType.TEXT:
+                self._handle(message.json())
+            elif message.type == aiohttp.WSMsgType.ERROR:
+                raise ws.exception()
+
+        raise ConnectionError(f"Websocket closed with code {ws.close_code}")
+
+    def _handle(self, message: dict):
+        if message.get("method") == "logsNotification":
+            params = message["params"]
+            market = self._market_by_subscription.get(params["subscription"])
+            value = params["result"]["value"]
+            if market is None or value.get("err") is not None:
+                return
+
+            self._counters["notifications"] += 1
+            if market.id not in self._pending[value["signature"]]:
+                self._pending[value["signature"]].append(market.id)
+            return
+
+        market = self._market_by_request_id.pop(message.get("id"), None)
+        if market is None:
+            return
+
+        if "result" in message:
+            self._market_by_subscription[message["result"]] = market
+            self._subscription_by_market[market.id] = message["result"]
+        else:
+            logger.error(
+                "Failed to subscribe to market %s: %s", market.id, message.get("error")
+            )
+
+    async def _maintain(self, ws: aiohttp.ClientWebSocketResponse):
+        # Gap fill right after subscribing, then periodic reconciliation.
+        reconcile_at = time.monotonic()
+        while True:
+            if time.monotonic() >= reconcile_at:
+                await self._reconcile()
+                reconcile_at = time.monotonic() + self.reconcile_interval
+
+            await asyncio.sleep(self.markets_refresh_interval)
+            await self._refresh_subscriptions(ws)
+
+    async def _refresh_subscriptions(self, ws: aiohttp.ClientWebSocketResponse):
+        markets = {market.id: market async for market in AttentionMarket.objects.all()}
+
+        subscribing = {market.id for market in self._market_by_request_id.values()}
+        for market in markets.values():
+            if market.id in self._subscription_by_market or market.id in subscribing:
+                continue
+
+            # Pushed trades are stored against the cursor row.
+            await MarketTradeCursor.objects.aget_or_create(market=market)
+
+            request_id = next(self._request_ids)
+            self._market_by_request_id[request_id] = market
+            await ws.send_json(
+                {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "method": "logsSubscribe",
+                    "params": [
+                        {"mentions": [market.address]},
+                        {"commitment": WS_COMMITMENT},
+                    ],
+                }
+            )
+
+        for market_id in list(self._subscription_by_market):
+            if market_id in markets:
+                continue
+
+            subscription = self._subscription_by_market.pop(market_id)
+            del self._market_by_subscription[subscription]
+            await ws.send_json(
+                {
+                    "jsonrpc": "2.0",
+                    "id": next(self._request_ids),
+                    "method": "logsUnsubscribe",
+                    "params": [subscription],
+                }
+            )
+
+    async def _reconcile(self):
+        async for market in AttentionMarket.objects.all():
+            try:
+                await sync_market_trades(market)
+            except Exception:
+                logger.exception("Failed to sync trades for market %s", market.id)
+
+        self._counters["reconciliations"] += 1
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    async def _flush(self):
+        while self._pending:
+            signatures = list(self._pending)[:WS_FLUSH_SIZE]
+            await self.ingest(
+                {signature: self._pending.pop(signature) for signature in signatures}
+            )
+
+    async def ingest(self, market_ids_by_signature: Dict[str, List[int]]):
+        """Fetches, classifies and stores the trades of notified signatures."""
+        try:
+            transactions = await get_transactions(list(market_ids_by_signature))
+        except TransactionFetchError as e:
+            # Pushed trades don't move the cursors, the next cursor sync picks
+            # up the unresolved ones.
+            logger.warning("Deferring %s notified signatures: %s", len(e.unresolved), e)
+            self._counters["deferred"] += len(e.unresolved)
+            transactions = e.transactions
+
+        trades_by_market = defaultdict(list)
+        for trade_info in get_sol_token_trades_from_transactions(transactions):
+            for market_id in market_ids_by_signature.get(trade_info.signature, []):
+                trades_by_market[market_id].append(trade_info)
+
+        for market_id, trades in trades_by_market.items():
+            # Signatures arrive oldest first, stores expect newest first.
+            new_trades = await store_market_trades(
+                market_id,
+                list(reversed(trades)),
+                since_signature=None,
+                newest_signature=None,
+            )
+            self._counters["trades"] += len(new_trades)
+            logger.info(
+                "Ingested %s pushed trades for market %s", len(new_trades), market_id
+            )
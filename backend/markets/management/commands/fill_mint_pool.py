@@ -0,0 +1,67 @@
+import signal
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from markets.mint_pool import (
+    MINT_POOL_CHECK_INTERVAL,
+    MINT_POOL_LOW_WATER,
+    MINT_POOL_SIZE,
+    MintPoolFiller,
+    fill_mint_pool,
+)
+from markets.client import close_sonic_testnet_client
+from tools.http import close_http_session
+
+
+class Command(BaseCommand):
+    help = "Keeps the pool of pre-created market mints filled."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=MINT_POOL_SIZE,
+            help="Number of available mints to fill the pool up to.",
+        )
+        parser.add_argument(
+            "--low-water",
+            type=int,
+            default=MINT_POOL_LOW_WATER,
+            help="Refill only once fewer mints than this are available.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Fill the pool once and exit.",
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        try:
+            if options["once"]:
+                created = await fill_mint_pool(
+                    size=options["size"], low_water=options["size"]
+                )
+                self.stdout.write(f"Created {created} mints")
+                return
+
+            filler = MintPoolFiller(
+                size=options["size"],
+                low_water=options["low_water"],
+                check_interval=MINT_POOL_CHECK_INTERVAL,
+            )
+            filler.start()
+
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+
+            await stop.wait()
+            await filler.stop()
+        finally:
+            await close_sonic_testnet_client()
+            await close_http_session()
@@ -0,0 +1,85 @@
+import signal
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from markets.indexer import (
+    INDEXER_BACKOFF_FACTOR,
+    INDEXER_MAX_POLL_INTERVAL,
+    INDEXER_POLL_INTERVAL,
+    TradeIndexer,
+)
+from markets.log_subscriber import RPC_WS_URL, TradeLogSubscriber
+from markets.rpc_pool import rpc_pool
+from tools.http import close_http_session
+
+
+class Command(BaseCommand):
+    help = "Continuously indexes trades of all attention markets."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=INDEXER_POLL_INTERVAL,
+            help="Seconds between polls of an active market.",
+        )
+        parser.add_argument(
+            "--max-interval",
+            type=float,
+            default=INDEXER_MAX_POLL_INTERVAL,
+            help="Upper bound of the backed off poll interval of idle markets.",
+        )
+        parser.add_argument(
+            "--backoff",
+            type=float,
+            default=INDEXER_BACKOFF_FACTOR,
+            help="Poll interval multiplier applied after each idle poll.",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=["poll", "ws"],
+            default="poll",
+            help="Poll every market, or ingest trades pushed over websocket.",
+        )
+        parser.add_argument(
+            "--ws-url",
+            default=RPC_WS_URL,
+            help="JSON-RPC websocket endpoint of the ws mode.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run a single polling pass and exit.",
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        if options["mode"] == "ws":
+            indexer = TradeLogSubscriber(options["ws_url"])
+        else:
+            indexer = TradeIndexer(
+                poll_interval=options["interval"],
+                max_interval=options["max_interval"],
+                backoff_factor=options["backoff"],
+            )
+
+        try:
+            if options["once"]:
+                if options["mode"] == "ws":
+                    raise CommandError("--once only applies to the poll mode")
+
+                await indexer.tick()
+                return
+
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, indexer.stop)
+
+            rpc_pool.start_health_checks()
+            await indexer.run()
+        finally:
+            await rpc_pool.stop_health_checks()
+            await close_http_session()
@@ -0,0 +1,104 @@
+import signal
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from markets.mock_rpc import CassetteResponder, FixtureResponder, MockRpcServer
+from tools.transport import Cassette
+
+
+class Command(BaseCommand):
+    help = "Serves a local JSON-RPC stand-in with injected latency and faults."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8899)
+        parser.add_argument(
+            "--cassette",
+            help="Answer with the responses recorded by HTTP_TRANSPORT=record.",
+        )
+        parser.add_argument(
+            "--fixture",
+            help="Answer from a benchmark fixture, synthetic if neither is given.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0,
+            help="Seconds added to every HTTP request.",
+        )
+        parser.add_argument(
+            "--latency-per-item",
+            type=float,
+            default=0,
+            help="Seconds added per request of a batch.",
+        )
+        parser.add_argument(
+            "--jitter",
+            type=float,
+            default=0,
+            help="Up to this many seconds added at random.",
+        )
+        parser.add_argument(
+            "--rate-limit-rate",
+            type=float,
+            default=0,
+            help="Share of HTTP requests answered 429.",
+        )
+        parser.add_argument(
+            "--batch-error-rate",
+            type=float,
+            default=0,
+            help="Share of batch items answered with a transient error.",
+        )
+        parser.add_argument(
+            "--batch-drop-rate",
+            type=float,
+            default=0,
+            help="Share of batch items left out of the response.",
+        )
+        parser.add_argument(
+            "--max-throughput",
+            type=float,
+            default=0,
+            help="Requests per second served before answering 429, 0 for no cap.",
+        )
+        parser.add_argument("--seed", type=int, help="Seed of the fault injection.")
+
+    def handle(self, *args, **options):
+        if options["cassette"] and options["fixture"]:
+            raise CommandError("Pass either --cassette or --fixture")
+
+        if options["cassette"]:
+            responder = CassetteResponder(Cassette(options["cassette"]).load())
+        else:
+            from benchmarks.fixtures import load_fixture
+
+            responder = FixtureResponder(load_fixture(options["fixture"]))
+
+        server = MockRpcServer(
+            responder,
+            latency=options["latency"],
+            latency_per_item=options["latency_per_item"],
+            jitter=options["jitter"],
+            rate_limit_rate=options["rate_limit_rate"],
+            batch_error_rate=options["batch_error_rate"],
+            batch_drop_rate=options["batch_drop_rate"],
+            max_throughput=options["max_throughput"],
+            seed=options["seed"],
+        )
+        asyncio.run(self._run(server, options["host"], options["port"]))
+
+    async def _run(self, server: MockRpcServer, host: str, port: int):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        await server.start(host, port)
+        self.stdout.write(f"Serving JSON-RPC on http://{host}:{port}/")
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            self.stdout.write(f"Served {server.stats()}")
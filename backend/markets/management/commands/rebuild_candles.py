@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from markets.candles import rebuild_candles
+from markets.models import AttentionMarket
+
+
+class Command(BaseCommand):
+    help = "Recomputes the candles of markets from their stored trades."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--market",
+            type=int,
+            action="append",
+            help="Id of a market to rebuild, all markets by default.",
+        )
+
+    def handle(self, *args, **options):
+        markets = AttentionMarket.objects.order_by("id")
+        if options["market"]:
+            markets = markets.filter(id__in=options["market"])
+
+        for market_id in markets.values_list("id", flat=True):
+            rebuild_candles(market_id)
+            self.stdout.write(f"Rebuilt candles of market {market_id}")
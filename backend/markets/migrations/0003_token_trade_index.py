@@ -0,0 +1,52 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0002_attentionmarket_image_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketTradeCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_signature', models.CharField(max_length=128, null=True)),
+                ('synced_at', models.DateTimeField(null=True)),
+                ('market', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trade_cursor', to='markets.attentionmarket')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TokenTrade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('signature', models.CharField(max_length=128)),
+                ('type', models.CharField(choices=[('buy', 'buy'), ('sell', 'sell')], max_length=4)),
+                ('sol_amount', models.FloatField()),
+                ('token', models.CharField(max_length=255)),
+                ('token_amount', models.FloatField()),
+                ('timestamp', models.BigIntegerField()),
+                ('signer', models.CharField(max_length=255)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trades', to='markets.attentionmarket')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['market', '-timestamp', '-id'], name='markets_tok_market__653ad5_idx'), models.Index(fields=['signature'], name='markets_tok_signatu_0cc43f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tokentrade',
+            constraint=models.UniqueConstraint(fields=('market', 'signature'), name='unique_market_trade_signature'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0003_token_trade_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=128, unique=True)),
+                ('data', models.BinaryField()),
+                ('accessed_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0005_cacheversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1m'), ('5m', '5m'), ('1h', '1h'), ('1d', '1d')], max_length=2)),
+                ('bucket_start', models.BigIntegerField()),
+                ('open', models.FloatField()),
+                ('high', models.FloatField()),
+                ('low', models.FloatField()),
+                ('close', models.FloatField()),
+                ('volume_sol', models.FloatField(default=0)),
+                ('volume_token', models.FloatField(default=0)),
+                ('trade_count', models.IntegerField(default=0)),
+                ('open_timestamp', models.BigIntegerField()),
+                ('open_trade_id', models.BigIntegerField()),
+                ('close_timestamp', models.BigIntegerField()),
+                ('close_trade_id', models.BigIntegerField()),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='markets.attentionmarket')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='candle',
+            constraint=models.UniqueConstraint(fields=('market', 'interval', 'bucket_start'), name='unique_market_candle'),
+        ),
+    ]
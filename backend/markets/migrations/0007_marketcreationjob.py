@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0006_candle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketCreationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('slug', models.CharField(max_length=255, unique=True)),
+                ('image_url', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('succeeded', 'succeeded'), ('failed', 'failed')], db_index=True, default='pending', max_length=16)),
+                ('token_address', models.CharField(max_length=255, null=True)),
+                ('error', models.TextField(null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('market', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='creation_job', to='markets.attentionmarket')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0007_marketcreationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledMint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('address', models.CharField(max_length=255, unique=True)),
+                ('claimed_at', models.DateTimeField(db_index=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('markets', '0008_pooledmint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketcreationjob',
+            name='mint_keypair',
+            field=models.CharField(max_length=128, null=True),
+        ),
+    ]
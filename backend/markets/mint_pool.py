@@ -0,0 +1,138 @@
+import os
+import asyncio
+import logging
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from markets.api import create_and_mint_token
+from markets.models import MarketCreationJob, PooledMint
+
+logger = logging.getLogger(__name__)
+
+# The pool is refilled up to MINT_POOL_SIZE once it drops below the low
+# water mark. A size of 0 disables it.
+MINT_POOL_SIZE = int(os.getenv("MINT_POOL_SIZE", 5))
+MINT_POOL_LOW_WATER = int(os.getenv("MINT_POOL_LOW_WATER", 2))
+MINT_POOL_CHECK_INTERVAL = float(os.getenv("MINT_POOL_CHECK_INTERVAL", 60))
+# Refill in the API workers, disable when the `fill_mint_pool` command runs.
+MINT_POOL_REFILL_IN_API = os.getenv("MINT_POOL_REFILL_IN_API", "true").lower() == "true"
+
+
+@sync_to_async
+def claim_pooled_mint(job_id: int) -> Optional[str]:
+    """
+    Takes an available mint from the pool for a creation job.
+
+    The mint is claimed and recorded on the job in one transaction, so it is
+    never lost nor handed out twice. Rows locked by concurrent claims are
+    skipped instead of waited on.
+
+    Returns:
+        Address of the mint, None if the pool is empty
+    """
+    with transaction.atomic():
+        mint = (
+            PooledMint.objects.select_for_update(skip_locked=True)
+            .filter(claimed_at__isnull=True)
+            .order_by("id")
+            .first()
+        )
+        if mint is None:
+            return None
+
+        mint.claimed_at = timezone.now()
+        mint.save(update_fields=["claimed_at", "updated_at"])
+        MarketCreationJob.objects.filter(id=job_id).update(
+            token_address=mint.address, updated_at=timezone.now()
+        )
+
+    return mint.address
+
+
+async def get_available_mint_count() -> int:
+    return await PooledMint.objects.filter(claimed_at__isnull=True).acount()
+
+
+async def fill_mint_pool(
+    size: int = MINT_POOL_SIZE, low_water: int = MINT_POOL_LOW_WATER
+) -> int:
+    """
+    Mints tokens into the pool until it holds `size`, if below `low_water`.
+
+    Mints are created one at a time and the pool is recounted in between,
+    so concurrent fillers overshoot by at most one mint each.
+
+    Returns:
+        Number of mints created
+    """
+    if await get_available_mint_count() >= low_water:
+        return 0
+
+    created = 0
+    while await get_available_mint_count() < size:
+        address = await create_and_mint_token()
+        await PooledMint.objects.acreate(address=address)
+        created += 1
+
+    logger.info("Added %s mints to the pool", created)
+
+    return created
+
+
+class MintPoolFiller:
+    """Keeps the mint pool filled in the background."""
+
+    def __init__(
+        self,
+        *,
+        size: int = MINT_POOL_SIZE,
+        low_water: int = MINT_POOL_LOW_WATER,
+        check_interval: float = MINT_POOL_CHECK_INTERVAL,
+    ):
+        self.size = size
+        self.low_water = low_water
+        self.check_interval = check_interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.size <= 0:
+            return
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        self._task = None
+
+    def request_refill(self):
+        """Checks the pool now rather than at the next interval."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                await fill_mint_pool(self.size, self.low_water)
+            except Exception:
+                logger.exception("Failed to fill the mint pool")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+mint_pool_filler = MintPoolFiller()
@@ -0,0 +1,327 @@
+import time
+import random
+import asyncio
+import logging
+from collections import defaultdict
+from itertools import count
+from typing import Callable, Dict, List, Optional
+
+import msgspec
+from aiohttp import WSCloseCode, WSMsgType, web
+
+from markets.rpc import SIGNATURES_PAGE_SIZE
+from tools.transport import Cassette
+
+logger = logging.getLogger(__name__)
+
+# Transient errors answered for batch items, retried by `batched_rpc_requests`.
+BATCH_ITEM_ERRORS = [
+    {"code": -32005, "message": "Node is behind"},
+    {"code": -32603, "message": "Internal error"},
+]
+
+
+class FixtureResponder:
+    """
+    Answers from a fixture: the signature history of an address and its
+    transactions, see `benchmarks.fixtures`. Accounts and balances are
+    answered as empty, other methods as not found.
+    """
+
+    def __init__(self, fixture: dict):
+        self.fixture = fixture
+        self._index_by_signature = {
+            sig_obj["signature"]: index
+            for index, sig_obj in enumerate(fixture["signatures"])
+        }
+
+    def __call__(self, request: dict) -> dict:
+        method = request.get("method")
+        params = request.get("params") or []
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+
+        if method == "getSignaturesForAddress":
+            response["result"] = self.get_signatures(
+                params[0], params[1] if len(params) > 1 else {}
+            )
+        elif method == "getTransaction":
+            response["result"] = self.fixture["transactions"].get(params[0])
+        elif method == "getHealth":
+            response["result"] = "ok"
+        elif method == "getSlot":
+            response["result"] = self.fixture["slot"]
+        elif method == "getBalance":
+            response["result"] = self.with_context(0)
+        elif method == "getTokenLargestAccounts":
+            response["result"] = self.with_context([])
+        elif method == "getMultipleAccounts":
+            response["result"] = self.with_context([None] * len(params[0]))
+        else:
+            response["error"] = {"code": -32601, "message": "Method not found"}
+
+        return response
+
+    def with_context(self, value) -> dict:
+        return {"context": {"slot": self.fixture["slot"]}, "value": value}
+
+    def get_signatures(self, address: str, options: dict) -> list:
+        if address != self.fixture["address"]:
+            return []
+
+        signatures = self.fixture["signatures"]
+        start = 0
+        if options.get("before"):
+            start = self._index_by_signature.get(options["before"], len(signatures)) + 1
+        end = len(signatures)
+        if options.get("until"):
+            end = self._index_by_signature.get(options["until"], end)
+
+        limit = options.get("limit") or SIGNATURES_PAGE_SIZE
+        return signatures[start:end][:limit]
+
+
+class CassetteResponder:
+    """Answers with the responses recorded by the record transport."""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    def __call__(self, request: dict) -> dict:
+        response, _ = self.cassette.respond(request)
+        return response
+
+
+class MockRpcServer:
+    """
+    Local JSON-RPC server with injected latency and faults, to reproduce
+    load behavior without the live RPC.
+
+    The same URL also accepts websocket connections speaking `logsSubscribe`
+    and `logsUnsubscribe`. Notifications are only sent by `notify_logs`, and
+    `close_websockets` drops the connections like a restarting node.
+
+    Args:
+        responder: Answers one JSON-RPC request
+        latency: Seconds added to every HTTP request
+        latency_per_item: Seconds added per request of a batch
+        jitter: Up to this many seconds added at random
+        rate_limit_rate: Share of HTTP requests answered 429
+        batch_error_rate: Share of batch items answered with a transient error
+        batch_drop_rate: Share of batch items left out of the response
+        max_throughput: Requests per second, batch items included, served
+            before answering 429. 0 for no cap.
+        seed: Seed of the fault injection
+    """
+
+    def __init__(
+        self,
+        responder: Callable[[dict], dict],
+        *,
+        latency: float = 0,
+        latency_per_item: float = 0,
+        jitter: float = 0,
+        rate_limit_rate: float = 0,
+        batch_error_rate: float = 0,
+        batch_drop_rate: float = 0,
+        max_throughput: float = 0,
+        seed: Optional[int] = None,
+    ):
+        self.responder = responder
+        self.latency = latency
+        self.latency_per_item = latency_per_item
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.batch_error_rate = batch_error_rate
+        self.batch_drop_rate = batch_drop_rate
+        self.max_throughput = max_throughput
+
+        self._random = random.Random(seed)
+        self._tokens = max_throughput
+        self._refilled_at = time.monotonic()
+        self._counters = defaultdict(int)
+        self._runner: Optional[web.AppRunner] = None
+        # Open websockets with their subscriptions, by id, to an address.
+        self._websockets: Dict[web.WebSocketResponse, Dict[int, str]] = {}
+        self._subscription_ids = count(1)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024**2)
+        app.router.add_post("/", self.handle)
+        app.router.add_get("/", self.handle_websocket)
+
+        return app
+
+    async def start(self, host: str, port: int) -> str:
+        """Serves on `host`, port 0 picks a free one. Returns the URL."""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        port = self._runner.addresses[0][1]
+        logger.info("Mock RPC listening on http://%s:%s/", host, port)
+        return f"http://{host}:{port}/"
+
+    async def stop(self):
+        # Open websockets would hold up the shutdown.
+        await self.close_websockets()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> Dict:
+        return dict(self._counters)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        items = body if isinstance(body, list) else [body]
+        self._counters["http_requests"] += 1
+        self._counters["requests"] += len(items)
+
+        if self._is_rate_limited(len(items)):
+            self._counters["rate_limited"] += 1
+            return web.json_response(
+                {
+                    "jsonrpc": "2.0",
+                    "error": {"code": 429, "message": "Too many requests"},
+                },
+                status=429,
+            )
+
+        delay = self.latency + self.latency_per_item * len(items)
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if not isinstance(body, list):
+            return self._response(self.responder(body))
+
+        responses: List[dict] = []
+        for item in items:
+            roll = self._random.random()
+            if roll < self.batch_drop_rate:
+                self._counters["dropped"] += 1
+            elif roll < self.batch_drop_rate + self.batch_error_rate:
+                self._counters["errors"] += 1
+                responses.append(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": item.get("id"),
+                        "error": self._random.choice(BATCH_ITEM_ERRORS),
+                    }
+                )
+            else:
+                responses.append(self.responder(item))
+
+        return self._response(responses)
+
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subscriptions: Dict[int, str] = {}
+        self._websockets[ws] = subscriptions
+        self._counters["ws_connections"] += 1
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+
+                response = self._handle_ws_request(
+                    msgspec.json.decode(message.data), subscriptions
+                )
+                await ws.send_str(msgspec.json.encode(response).decode())
+        finally:
+            self._websockets.pop(ws, None)
+
+        return ws
+
+    def _handle_ws_request(self, request: dict, subscriptions: Dict[int, str]) -> dict:
+        method = request.get("method")
+        params = request.get("params") or []
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+
+        if method == "logsSubscribe":
+            subscription = next(self._subscription_ids)
+            subscriptions[subscription] = params[0]["mentions"][0]
+            response["result"] = subscription
+        elif method == "logsUnsubscribe":
+            response["result"] = subscriptions.pop(params[0], None) is not None
+        else:
+            response["error"] = {"code": -32601, "message": "Method not found"}
+
+        return response
+
+    def subscribed_addresses(self) -> List[str]:
+        """Addresses with a logs subscription, once per subscription."""
+        return [
+            address
+            for subscriptions in self._websockets.values()
+            for address in subscriptions.values()
+        ]
+
+    async def notify_logs(
+        self, address: str, signature: str, *, err: Optional[dict] = None
+    ) -> int:
+        """
+        Sends a `logsNotification` of a transaction mentioning `address` to
+        every subscription to it.
+
+        Returns:
+            Number of notifications sent
+        """
+        sent = 0
+        for ws, subscriptions in list(self._websockets.items()):
+            for subscription, mentioned in list(subscriptions.items()):
+                if mentioned != address:
+                    continue
+
+                message = {
+                    "jsonrpc": "2.0",
+                    "method": "logsNotification",
+                    "params": {
+                        "result": {
+                            "context": {"slot": 0},
+                            "value": {"signature": signature, "err": err, "logs": []},
+                        },
+                        "subscription": subscription,
+                    },
+                }
+                await ws.send_str(msgspec.json.encode(message).decode())
+                sent += 1
+
+        self._counters["ws_notifications"] += sent
+        return sent
+
+    async def close_websockets(self, code: int = WSCloseCode.GOING_AWAY) -> int:
+        """Closes every open websocket, returns how many were open."""
+        websockets = list(self._websockets)
+        for ws in websockets:
+            await ws.close(code=code)
+
+        return len(websockets)
+
+    def _response(self, body) -> web.Response:
+        return web.Response(
+            body=msgspec.json.encode(body), content_type="application/json"
+        )
+
+    def _is_rate_limited(self, cost: int) -> bool:
+        if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+            return True
+
+        if not self.max_throughput:
+            return False
+
+        # Token bucket holding one second of throughput.
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_throughput,
+            self._tokens + (now - self._refilled_at) * self.max_throughput,
+        )
+        self._refilled_at = now
+        # A batch larger than the bucket is served once it is full.
+        if self._tokens < min(cost, self.max_throughput):
+            return True
+
+        self._tokens -= cost
+        return False
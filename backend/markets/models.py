@@ -1,6 +1,6 @@
 from django.db import models
 
-from tools.app_models import TimeTrackedModel
+from tools.app_models import AppModel, TimeTrackedModel
 
 # Create your models here.
 
@@ -9,3 +9,136 @@ class AttentionMarket(TimeTrackedModel):
     slug = models.CharField(max_length=255, unique=True)
     image_url = models.CharField(max_length=255, null=True)
     address = models.CharField(max_length=255)
+
+
+class TokenTrade(TimeTrackedModel):
+    """A SOL/token trade parsed from a transaction touching a market's mint."""
+
+    market = models.ForeignKey(
+        AttentionMarket, on_delete=models.CASCADE, related_name="trades"
+    )
+    signature = models.CharField(max_length=128)
+    type = models.CharField(max_length=4, choices=[("buy", "buy"), ("sell", "sell")])
+    sol_amount = models.FloatField()
+    token = models.CharField(max_length=255)
+    token_amount = models.FloatField()
+    timestamp = models.BigIntegerField()
+    signer = models.CharField(max_length=255)
+
+    class Meta(TimeTrackedModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=["market", "signature"], name="unique_market_trade_signature"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["market", "-timestamp", "-id"]),
+            models.Index(fields=["signature"]),
+        ]
+
+
+class MarketTradeCursor(TimeTrackedModel):
+    """Newest signature already ingested for a market, used as the `until` bound."""
+
+    market = models.OneToOneField(
+        AttentionMarket, on_delete=models.CASCADE, related_name="trade_cursor"
+    )
+    last_signature = models.CharField(max_length=128, null=True)
+    synced_at = models.DateTimeField(null=True)
+
+
+class CachedTransaction(AppModel):
+    """Compressed `getTransaction` result of a finalized transaction."""
+
+    signature = models.CharField(max_length=128, unique=True)
+    data = models.BinaryField()
+    accessed_at = models.DateTimeField(db_index=True)
+
+
+class CacheVersion(AppModel):
+    """Version of a cached resource, bumped on change and shared by all workers."""
+
+    key = models.CharField(max_length=64, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class Candle(AppModel):
+    """
+    OHLCV bar of a market's trades over one interval bucket.
+
+    Open and close are tracked by their trade's (timestamp, id) so bars stay
+    correct when older trades are ingested late.
+    """
+
+    market = models.ForeignKey(
+        AttentionMarket, on_delete=models.CASCADE, related_name="candles"
+    )
+    interval = models.CharField(
+        max_length=2,
+        choices=[("1m", "1m"), ("5m", "5m"), ("1h", "1h"), ("1d", "1d")],
+    )
+    bucket_start = models.BigIntegerField()
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    close = models.FloatField()
+    volume_sol = models.FloatField(default=0)
+    volume_token = models.FloatField(default=0)
+    trade_count = models.IntegerField(default=0)
+    open_timestamp = models.BigIntegerField()
+    open_trade_id = models.BigIntegerField()
+    close_timestamp = models.BigIntegerField()
+    close_trade_id = models.BigIntegerField()
+
+    class Meta(AppModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=["market", "interval", "bucket_start"],
+                name="unique_market_candle",
+            )
+        ]
+
+
+class MarketCreationJob(TimeTrackedModel):
+    """Background creation of a market, the slug is the idempotency key."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    slug = models.CharField(max_length=255, unique=True)
+    image_url = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=16,
+        choices=[
+            (PENDING, PENDING),
+            (RUNNING, RUNNING),
+            (SUCCEEDED, SUCCEEDED),
+            (FAILED, FAILED),
+        ],
+        default=PENDING,
+        db_index=True,
+    )
+    # Recorded as soon as the token exists, so a retry never mints twice.
+    token_address = models.CharField(max_length=255, null=True)
+    # Recorded before minting, so a retry can tell whether the mint landed
+    # and resends for the same address. The mint authority is the payer,
+    # the mint keypair has no use once the account exists.
+    mint_keypair = models.CharField(max_length=128, null=True)
+    market = models.OneToOneField(
+        AttentionMarket,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="creation_job",
+    )
+    error = models.TextField(null=True)
+    attempts = models.IntegerField(default=0)
+
+
+class PooledMint(TimeTrackedModel):
+    """Token created and minted ahead of time, waiting for a market."""
+
+    address = models.CharField(max_length=255, unique=True)
+    claimed_at = models.DateTimeField(null=True, db_index=True)
@@ -0,0 +1,134 @@
+import os
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import aiohttp
+from django.db.models import OuterRef, Subquery
+from solders.pubkey import Pubkey
+
+from markets.models import AttentionMarket, TokenTrade
+from markets.rpc import (
+    RpcException,
+    get_accounts_by_owner_request,
+    get_sol_balance,
+    rpc_request,
+)
+from markets.rpc_types import decode_token_accounts
+from tools.http import RateLimitException
+from tools.ttl_cache import TTLCache
+
+PORTFOLIO_TTL = float(os.getenv("PORTFOLIO_TTL", 5))
+
+portfolio_cache = TTLCache(ttl=PORTFOLIO_TTL, max_entries=10_000)
+
+
+async def get_portfolio(owner: str) -> Dict:
+    """
+    Returns the holdings of a wallet in every attention market, cached per
+    wallet. Raises `ValueError` for an invalid address and `RpcException`
+    if the RPC fails.
+    """
+    owner_pubkey = Pubkey.from_string(owner)
+
+    return await portfolio_cache.get(owner, lambda: compute_portfolio(owner_pubkey))
+
+
+async def compute_portfolio(owner: Pubkey) -> Dict:
+    """
+    Reads every SPL token account of the wallet in one
+    `getTokenAccountsByOwner` call, associated or not.
+
+    Args:
+        owner: Wallet address
+
+    Returns:
+        SOL balance, and holdings with their value at the market's last
+        trade price, largest value first
+    """
+    markets = [
+        market
+        async for market in AttentionMarket.objects.order_by("id").values(
+            "id", "slug", "image_url", "address"
+        )
+    ]
+
+    try:
+        resp, sol_balance = await asyncio.gather(
+            rpc_request(
+                get_accounts_by_owner_request(str(owner)),
+                decode=decode_token_accounts,
+            ),
+            get_sol_balance(str(owner)),
+        )
+    except (RateLimitException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise RpcException(f"getTokenAccountsByOwner failed: {e!r}") from e
+    if "result" not in resp:
+        raise RpcException(f"getTokenAccountsByOwner failed: {resp.get('error')}")
+
+    # A wallet may hold a mint in several accounts, balances are summed and
+    # the largest account is reported.
+    balance_by_mint: Dict[str, float] = defaultdict(float)
+    largest_account_by_mint: Dict[str, Tuple[float, str]] = {}
+    for account in resp["result"]["value"]:
+        info = account["account"]["data"]["parsed"]["info"]
+        token_amount = info["tokenAmount"]
+        balance = int(token_amount["amount"]) / 10 ** token_amount["decimals"]
+        if not balance:
+            continue
+
+        mint = info["mint"]
+        balance_by_mint[mint] += balance
+        if balance > largest_account_by_mint.get(mint, (0, None))[0]:
+            largest_account_by_mint[mint] = (balance, account["pubkey"])
+
+    holdings = []
+    for market in markets:
+        if market["address"] not in largest_account_by_mint:
+            continue
+
+        holdings.append(
+            {
+                "market_id": market["id"],
+                "slug": market["slug"],
+                "image_url": market["image_url"],
+                "token": market["address"],
+                "token_account": largest_account_by_mint[market["address"]][1],
+                "balance": balance_by_mint[market["address"]],
+            }
+        )
+
+    prices = await get_last_prices([holding["market_id"] for holding in holdings])
+    for holding in holdings:
+        price = prices.get(holding["market_id"])
+        holding["price"] = price
+        holding["value_sol"] = holding["balance"] * price if price else 0
+
+    holdings.sort(key=lambda holding: holding["value_sol"], reverse=True)
+
+    return {
+        "owner": str(owner),
+        "sol_balance": sol_balance,
+        "total_value_sol": sum(holding["value_sol"] for holding in holdings),
+        "holdings": holdings,
+    }
+
+
+async def get_last_prices(market_ids: List[int]) -> Dict[int, float]:
+    """Returns the SOL per token price of the last trade of each market."""
+    if not market_ids:
+        return {}
+
+    last_trades = TokenTrade.objects.filter(market=OuterRef("pk")).order_by(
+        "-timestamp", "-id"
+    )
+    markets = AttentionMarket.objects.filter(id__in=market_ids).annotate(
+        last_sol_amount=Subquery(last_trades.values("sol_amount")[:1]),
+        last_token_amount=Subquery(last_trades.values("token_amount")[:1]),
+    )
+
+    return {
+        market["id"]: market["last_sol_amount"] / market["last_token_amount"]
+        async for market in markets.values("id", "last_sol_amount", "last_token_amount")
+        if market["last_token_amount"]
+    }
@@ -1,14 +1,69 @@
+import os
+import time
 import logging
 import asyncio
-from typing import List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 from tools.dictionary import get_from_dict
 from markets.constants import SOL_DECIMALS
-from tools.http import req_post
-
-RPC_URL = "https://api.testnet.v1.sonic.game"
+from markets.rpc_types import (
+    decode_raw_transactions,
+    decode_signatures,
+    decode_signatures_batch,
+    decode_token_accounts,
+    decode_transaction,
+)
+from markets.tx_cache import TX_CACHE_ENABLED, transaction_cache
+from tools.singleflight import coalesce
+from tools.metrics import (
+    RPC_BATCH_ITEM_RETRIES,
+    RPC_BATCH_SIZE,
+    RPC_REQUEST_DURATION,
+    RPC_REQUESTS,
+    get_rpc_method,
+    record_retry,
+)
+from tools.tracing import span
+from tools.http import (
+    BASE_WAIT,
+    MAX_RETRIES,
+    MAX_WAIT,
+    RateLimitException,
+    req_post_once,
+)
+from markets.rpc_pool import RpcEndpoint, rpc_pool
+from tenacity import retry, retry_if_exception_type, stop_after_attempt
 
 BATCH_REQUEST_SIZE = 100
+# Default and maximum `limit` of getSignaturesForAddress.
+SIGNATURES_PAGE_SIZE = 1000
+# Maximum keys of one getMultipleAccounts call, and calls per batch.
+MULTIPLE_ACCOUNTS_LIMIT = 100
+MULTIPLE_ACCOUNTS_BATCH_SIZE = 5
+# getTransaction batches fetched ahead of the consumer of a pipeline.
+PIPELINE_MAX_IN_FLIGHT = int(os.getenv("RPC_PIPELINE_MAX_IN_FLIGHT", 4))
+BATCH_ITEM_MAX_ATTEMPTS = int(os.getenv("RPC_BATCH_ITEM_MAX_ATTEMPTS", 4))
+
+# Invalid request, method not found and invalid params, resending won't help.
+NON_RETRYABLE_RPC_ERROR_CODES = {-32600, -32601, -32602}
+
+
+class RpcException(Exception):
+    pass
+
+
+class TransactionFetchError(RpcException):
+    """
+    Raised when some transactions still failed after the batch retries.
+
+    `transactions` has the ones fetched, in request order, and
+    `unresolved` the signatures of the others.
+    """
+
+    def __init__(self, unresolved: List[str], transactions: List[dict]):
+        super().__init__(f"Failed to get {len(unresolved)} transactions")
+        self.unresolved = unresolved
+        self.transactions = transactions
 
 
 async def get_program_accounts(pubkey: str):
@@ -25,7 +80,24 @@ async def get_program_accounts(pubkey: str):
     return await rpc_request(req)
 
 
-async def get_transactions(tx_ids: List[str]):
+async def get_transactions(tx_ids: List[str], *, use_cache: bool = TX_CACHE_ENABLED):
+    """
+    Fetches parsed transactions, in the order of `tx_ids`.
+
+    Transactions are read with the default finalized commitment, so results
+    are served from and added to the transaction cache. Transactions the
+    node doesn't have are left out. Raises `TransactionFetchError` if any
+    request still failed after retries, so callers keeping a cursor don't
+    move it past transactions they never saw.
+    """
+    cached = {}
+    if use_cache:
+        with span("tx_cache.get_many", transactions=len(tx_ids)):
+            cached = {
+                tx_id: decode_transaction(raw)
+                for tx_id, raw in (await transaction_cache.get_many(tx_ids)).items()
+            }
+
     requests = [
         {
             "jsonrpc": "2.0",
@@ -36,23 +108,44 @@ async def get_transactions(tx_ids: List[str]):
                 {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0},
             ],
         }
-        for tx_id in tx_ids
+        for tx_id in dict.fromkeys(tx_ids)
+        if tx_id not in cached
     ]
 
-    results = await batched_rpc_requests(requests, BATCH_REQUEST_SIZE)
+    # Results are kept raw for the cache and decoded into the typed subset.
+    results = await batched_rpc_requests(
+        requests, BATCH_REQUEST_SIZE, decode=decode_raw_transactions
+    )
 
-    resps = []
+    fetched = {}
+    raw_by_id = {}
+    unresolved = []
     for result in results:
-        if "result" in result:
-            resps.append(result["result"])
-        else:
+        if "result" not in result:
             logging.error("Failed to get transaction: %s", result)
+            unresolved.append(result["id"])
+            continue
+
+        raw = bytes(result["result"])
+        if raw != b"null":
+            raw_by_id[result["id"]] = raw
+            fetched[result["id"]] = decode_transaction(raw)
+
+    if use_cache:
+        await transaction_cache.set_many(raw_by_id)
 
-    return resps
+    transactions = {**cached, **fetched}
+    ordered = [transactions[tx_id] for tx_id in tx_ids if tx_id in transactions]
+    if unresolved:
+        raise TransactionFetchError(unresolved, ordered)
+
+    return ordered
 
 
 async def get_user_token_accounts(pubkey):
-    resp = await rpc_request(get_accounts_by_owner_request(pubkey))
+    resp = await rpc_request(
+        get_accounts_by_owner_request(pubkey), decode=decode_token_accounts
+    )
 
     return get_token_accounts_and_balances_by_mints(resp)
 
@@ -69,7 +162,10 @@ async def get_token_largest_accounts(token_address: str):
 
 
 async def get_user_token_account(pubkey, token_address):
-    resp = await rpc_request(get_accounts_by_owner_request(pubkey, token_address))
+    resp = await rpc_request(
+        get_accounts_by_owner_request(pubkey, token_address),
+        decode=decode_token_accounts,
+    )
 
     token_account_by_token_address, balance_by_token_address = (
         get_token_accounts_and_balances_by_mints(resp)
@@ -85,45 +181,120 @@ async def get_all_signatures(
     *,
     until: Optional[str] = None,
     only_successful: bool = True,
-    max_loops: int = 1,
+    max_loops: Optional[int] = None,
 ):
     signatures = []
+    try:
+        loop_count = 0
+        async for page in iter_signature_pages(
+            pubkey, until=until, only_successful=only_successful
+        ):
+            if max_loops is not None and loop_count > max_loops:
+                logging.error(
+                    "Exceeded max loops of %s for fetching signatures for %s",
+                    max_loops,
+                    pubkey,
+                )
+                return None
+
+            signatures.extend(page)
+            loop_count += 1
+    except RpcException as e:
+        logging.error("Failed to get signatures for address: %s", e)
+        return None
+
+    return signatures
+
+
+async def iter_signature_pages(
+    pubkey: str,
+    *,
+    until: Optional[str] = None,
+    only_successful: bool = True,
+) -> AsyncIterator[List[str]]:
+    """
+    Pages through the signatures of an address, newest first, using `before`.
+
+    Walks the full history, or back to `until` exclusive. Raises
+    `RpcException` if a page can't be fetched.
+    """
     before = None
-    loop_count = 0
     while True:
-        if loop_count > max_loops:
-            logging.error(
-                "Exceeded max loops of %s for fetching signatures for %s",
-                max_loops,
-                pubkey,
+        result = await rpc_request(
+            get_signatures_for_addresses_rpc(pubkey, before=before, until=until),
+            decode=decode_signatures,
+        )
+        if "result" not in result:
+            raise RpcException(result)
+
+        sig_objs = result["result"]
+        if not sig_objs:
+            return
+
+        before = sig_objs[-1]["signature"]
+        yield [
+            sig_obj["signature"]
+            for sig_obj in (
+                get_successful_sig_objs(sig_objs) if only_successful else sig_objs
             )
-            return None
+        ]
 
-        request = get_signatures_for_addresses_rpc(pubkey, before=before, until=until)
+        if len(sig_objs) < SIGNATURES_PAGE_SIZE:
+            return
 
-        result = await rpc_request(request)
-        if "result" in result:
-
-            new_signatures = result["result"]
-            if len(new_signatures) == 0:
-                break
-            else:
-                before = new_signatures[-1]["signature"]
-                signatures.extend(
-                    get_successful_sig_objs(new_signatures)
-                    if only_successful
-                    else new_signatures
-                )
 
-                if before == until:
-                    break
+async def iter_transaction_batches(
+    pubkey: str,
+    *,
+    until: Optional[str] = None,
+    max_in_flight: int = PIPELINE_MAX_IN_FLIGHT,
+) -> AsyncIterator[Tuple[List[str], List[dict]]]:
+    """
+    Streams the successful transactions of an address, newest first.
+
+    Signature pages are split into `getTransaction` batches that are fetched
+    concurrently while paging continues, at most `max_in_flight` batches
+    ahead of the consumer. Yields `(signatures, transactions)` per batch,
+    in history order.
+    """
+    batches: asyncio.Queue = asyncio.Queue(maxsize=max_in_flight)
+
+    async def produce():
+        try:
+            async for page in iter_signature_pages(pubkey, until=until):
+                for i in range(0, len(page), BATCH_REQUEST_SIZE):
+                    signatures = page[i : i + BATCH_REQUEST_SIZE]
+                    await batches.put(
+                        (
+                            signatures,
+                            asyncio.ensure_future(get_transactions(signatures)),
+                        )
+                    )
+        except Exception as e:
+            failed = asyncio.get_running_loop().create_future()
+            failed.set_exception(e)
+            await batches.put(([], failed))
         else:
-            logging.error("Failed to get signatures for address: %s", result)
-            return None
+            await batches.put(None)
 
-        loop_count += 1
-
-    return [sig_obj["signature"] for sig_obj in signatures]
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item = await batches.get()
+            if item is None:
+                return
+
+            signatures, transactions = item
+            # Time the consumer waits on fetches it didn't overlap.
+            with span("rpc.wait_transactions"):
+                transactions = await transactions
+            yield signatures, transactions
+    finally:
+        producer.cancel()
+        while not batches.empty():
+            item = batches.get_nowait()
+            if item is not None:
+                item[1].cancel()
 
 
 async def get_signatures(
@@ -139,7 +310,9 @@ async def get_signatures(
         for address in addresses
     ]
     try:
-        results = await batched_rpc_requests(requests, BATCH_REQUEST_SIZE)
+        results = await batched_rpc_requests(
+            requests, BATCH_REQUEST_SIZE, decode=decode_signatures_batch
+        )
 
         signatures_by_addr = {}
         for result in results:
@@ -177,21 +350,45 @@ def get_signatures_for_addresses_rpc(
 
 
 async def get_account_infos(pubkeys: List[str]):
-    data = {
+    """
+    Gets parsed accounts, in chunks of the 100 keys getMultipleAccounts takes.
+
+    Chunks are sent concurrently as JSON-RPC batches. The response has the
+    shape of a single getMultipleAccounts response, with one value per
+    pubkey in order, or is the error of the first failed chunk.
+    """
+    requests = [
+        {
+            "jsonrpc": "2.0",
+            "id": i,
+            "method": "getMultipleAccounts",
+            "params": [
+                pubkeys[i : i + MULTIPLE_ACCOUNTS_LIMIT],
+                {"encoding": "jsonParsed"},
+            ],
+        }
+        for i in range(0, len(pubkeys), MULTIPLE_ACCOUNTS_LIMIT)
+    ]
+    if not requests:
+        return {"jsonrpc": "2.0", "id": 1, "result": {"context": {}, "value": []}}
+
+    results = await batched_rpc_requests(requests, MULTIPLE_ACCOUNTS_BATCH_SIZE)
+
+    values = []
+    for result in results:
+        if "result" not in result:
+            return result
+
+        values.extend(result["result"]["value"])
+
+    return {
         "jsonrpc": "2.0",
         "id": 1,
-        "method": "getMultipleAccounts",
-        "params": [
-            pubkeys,
-            {"encoding": "jsonParsed"},
-        ],
+        "result": {"context": results[0]["result"]["context"], "value": values},
     }
 
-    results = await rpc_request(data)
-
-    return results
-
 
+@coalesce()
 async def get_sol_balance(pubkey: str):
     data = {
         "jsonrpc": "2.0",
@@ -207,10 +404,59 @@ async def get_sol_balance(pubkey: str):
     return None
 
 
-async def rpc_request(request_body):
-    headers = {"Content-Type": "application/json"}
+# No wait between attempts, the endpoint's rate limiter pauses every caller
+# after a 429 and the pool routes around paused endpoints.
+@retry(
+    stop=stop_after_attempt(MAX_RETRIES),
+    retry=retry_if_exception_type(RateLimitException),
+    before_sleep=record_retry,
+    reraise=True,
+)
+async def rpc_request(
+    request_body,
+    *,
+    decode: Optional[Callable[[bytes], Any]] = None,
+    hedge: bool = True,
+):
+    """
+    Sends a JSON-RPC request or batch through the endpoint pool.
 
-    return await req_post(RPC_URL, request_body, headers=headers)
+    `hedge` must only be left on for reads, a hedged request may be
+    executed by two endpoints.
+    """
+    headers = {"Content-Type": "application/json"}
+    is_batch = isinstance(request_body, list)
+    cost = len(request_body) if is_batch else 1
+    method = get_rpc_method(request_body)
+    batch = "true" if is_batch else "false"
+
+    async def send(endpoint: RpcEndpoint):
+        async with endpoint.rate_limiter.acquire(cost):
+            outcome = "error"
+            try:
+                with RPC_REQUEST_DURATION.labels(method, batch).time(), span(
+                    f"rpc.{method}", endpoint=endpoint.url, requests=cost
+                ):
+                    # Timed once the limiter let the call through, queueing
+                    # says nothing about the endpoint's latency.
+                    start = time.monotonic()
+                    result = await req_post_once(
+                        endpoint.url, request_body, headers=headers, decode=decode
+                    )
+                    latency = time.monotonic() - start
+                outcome = "ok"
+                return result, latency
+            except RateLimitException:
+                outcome = "rate_limited"
+                raise
+            except asyncio.CancelledError:
+                # The losing call of a hedged request.
+                outcome = "cancelled"
+                raise
+            finally:
+                RPC_REQUESTS.labels(method, batch, outcome).inc()
+
+    return await rpc_pool.request(send, hedge=hedge)
 
 
 def get_accounts_by_owner_request(pubkey: str, token_address: Optional[str] = None):
@@ -266,13 +512,88 @@ def get_token_accounts_and_balances_by_mints(
     return token_account_by_token_address, balance_by_token_address
 
 
-async def batched_rpc_requests(requests: List[dict], batch_size: int):
-    tasks = []
-    for i in range(0, len(requests), batch_size):
-        batch = requests[i : i + batch_size]
-        tasks.append(rpc_request(batch))
+async def batched_rpc_requests(
+    requests: List[dict],
+    batch_size: int,
+    *,
+    max_attempts: int = BATCH_ITEM_MAX_ATTEMPTS,
+    decode: Optional[Callable[[bytes], Any]] = None,
+) -> List[dict]:
+    """
+    Sends requests as JSON-RPC batches.
+
+    Responses are matched to their request by id, so the result has exactly
+    one response per request, in request order, carrying the request's
+    original id. Items whose response is missing or a transient error are
+    resent in later batches; an item that fails `max_attempts` times is
+    returned with its last `error`.
+    """
+    responses: List[Optional[dict]] = [None] * len(requests)
+    pending = list(range(len(requests)))
+
+    for attempt in range(max_attempts):
+        if attempt > 0:
+            logging.warning(
+                "Retrying %s of %s batch items, attempt %s",
+                len(pending),
+                len(requests),
+                attempt + 1,
+            )
+            RPC_BATCH_ITEM_RETRIES.inc(len(pending))
+            await asyncio.sleep(min(BASE_WAIT * 2 ** (attempt - 1), MAX_WAIT))
+
+        batches = [
+            pending[i : i + batch_size] for i in range(0, len(pending), batch_size)
+        ]
+        results = await asyncio.gather(
+            *[send_batch(requests, batch, decode=decode) for batch in batches]
+        )
+
+        pending = []
+        for batch, responses_by_index in zip(batches, results):
+            for index in batch:
+                response = responses_by_index.get(index)
+                if response is None:
+                    response = {
+                        "jsonrpc": "2.0",
+                        "error": {"code": None, "message": "Missing batch response"},
+                    }
+
+                responses[index] = {**response, "id": requests[index]["id"]}
+                if "error" in response and is_retryable_rpc_error(response["error"]):
+                    pending.append(index)
+
+        if not pending:
+            break
+
+    return responses
+
+
+async def send_batch(
+    requests: List[dict],
+    indexes: List[int],
+    *,
+    decode: Optional[Callable[[bytes], Any]] = None,
+) -> Dict[int, dict]:
+    """Sends one batch with request indexes as ids, returns responses by index."""
+    batch = [{**requests[index], "id": index} for index in indexes]
+    RPC_BATCH_SIZE.observe(len(batch))
+    try:
+        results = await rpc_request(batch, decode=decode)
+    except Exception as e:
+        logging.error("Batch of %s requests failed: %s", len(batch), e)
+        return {}
+
+    if not isinstance(results, list):
+        logging.error("Unexpected batch response: %s", results)
+        return {}
+
+    return {
+        result["id"]: result
+        for result in results
+        if isinstance(result, dict) and isinstance(result.get("id"), int)
+    }
+
 
-    results = await asyncio.gather(*tasks)
-    return [
-        item for sublist in results for item in sublist
-    ]  # Flatten the list of lists
+def is_retryable_rpc_error(error: dict) -> bool:
+    return error.get("code") not in NON_RETRYABLE_RPC_ERROR_CODES
@@ -0,0 +1,307 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from tools.http import RateLimitException, req_post_once
+from tools.rate_limit import AdaptiveRateLimiter
+
+logger = logging.getLogger(__name__)
+
+SONIC_TESTNET_RPC_URL = "https://api.testnet.v1.sonic.game"
+
+# Comma separated JSON-RPC endpoints serving the same cluster.
+RPC_URLS = [
+    url.strip()
+    for url in os.getenv("RPC_URLS", SONIC_TESTNET_RPC_URL).split(",")
+    if url.strip()
+]
+
+# Budget of each endpoint. Rates count requests, a batch costs one token
+# per item.
+RPC_MAX_IN_FLIGHT = int(os.getenv("RPC_MAX_IN_FLIGHT", 8))
+RPC_RATE_LIMIT = float(os.getenv("RPC_RATE_LIMIT", 400))
+RPC_RATE_BURST = float(os.getenv("RPC_RATE_BURST", 400))
+
+RPC_HEALTH_CHECK_INTERVAL = float(os.getenv("RPC_HEALTH_CHECK_INTERVAL", 10))
+RPC_HEALTH_CHECK_TIMEOUT = float(os.getenv("RPC_HEALTH_CHECK_TIMEOUT", 3))
+# Endpoints more than this many slots behind the highest one are unhealthy.
+RPC_MAX_SLOT_LAG = int(os.getenv("RPC_MAX_SLOT_LAG", 150))
+RPC_MAX_CONSECUTIVE_FAILURES = int(os.getenv("RPC_MAX_CONSECUTIVE_FAILURES", 3))
+RPC_LATENCY_EWMA_ALPHA = float(os.getenv("RPC_LATENCY_EWMA_ALPHA", 0.2))
+# A read slower than this latency percentile of its endpoint is also sent
+# to the next best endpoint. 0 disables hedging.
+RPC_HEDGE_PERCENTILE = float(os.getenv("RPC_HEDGE_PERCENTILE", 95))
+RPC_HEDGE_MIN_SAMPLES = 20
+
+LATENCY_WINDOW = 200
+
+
+class RpcEndpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.rate_limiter = AdaptiveRateLimiter(
+            max_in_flight=RPC_MAX_IN_FLIGHT,
+            rate=RPC_RATE_LIMIT,
+            burst=RPC_RATE_BURST,
+            increase_step=RPC_RATE_LIMIT / 100,
+        )
+
+        self.healthy = True
+        self.slot: Optional[int] = None
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.consecutive_failures = 0
+        self._latencies.append(latency)
+        self._update_ewma(latency)
+
+    def record_probe(self, latency: float):
+        """
+        Records a passed health check. Probes are light requests, they keep
+        the EWMA of an idle endpoint current but stay out of the window the
+        hedge delay is taken from.
+        """
+        self.consecutive_failures = 0
+        self._update_ewma(latency)
+
+    def _update_ewma(self, latency: float):
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += RPC_LATENCY_EWMA_ALPHA * (latency - self.ewma_latency)
+
+    def record_failure(self):
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.healthy and self.consecutive_failures >= RPC_MAX_CONSECUTIVE_FAILURES:
+            logger.warning("Marking RPC endpoint %s unhealthy", self.url)
+            self.healthy = False
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        if len(self._latencies) < RPC_HEDGE_MIN_SAMPLES:
+            return None
+
+        latencies = sorted(self._latencies)
+        return latencies[
+            min(int(len(latencies) * percentile / 100), len(latencies) - 1)
+        ]
+
+    def score(self) -> float:
+        """Lower is better: expected latency, penalised while rate limited."""
+        score = self.ewma_latency if self.ewma_latency is not None else 0
+        if self.rate_limiter.is_paused:
+            score += 60
+        return score
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "slot": self.slot,
+            "ewma_latency": self.ewma_latency,
+            "p50_latency": self.latency_percentile(50),
+            "p99_latency": self.latency_percentile(99),
+            "requests": self.requests,
+            "failures": self.failures,
+            "rate_limiter": self.rate_limiter.stats(),
+        }
+
+
+class RpcEndpointPool:
+    """
+    Routes JSON-RPC calls to the fastest healthy endpoint.
+
+    Endpoint latency is tracked as an EWMA of successful calls. Health comes
+    from consecutive failures and from periodic `getHealth`/`getSlot`
+    probes, which also catch endpoints lagging behind the others. Reads can
+    be hedged: if the chosen endpoint hasn't answered within its usual
+    latency percentile, the call is also sent to the next best endpoint and
+    the first answer wins.
+    """
+
+    def __init__(
+        self, urls: List[str], *, hedge_percentile: float = RPC_HEDGE_PERCENTILE
+    ):
+        self.endpoints = [RpcEndpoint(url) for url in urls]
+        self.hedge_percentile = hedge_percentile
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    def pick(self, exclude: Optional[RpcEndpoint] = None) -> Optional[RpcEndpoint]:
+        candidates = [
+            endpoint for endpoint in self.endpoints if endpoint is not exclude
+        ]
+        healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+
+        # With no healthy endpoint left, degrade rather than fail.
+        return min(healthy or candidates, key=RpcEndpoint.score, default=None)
+
+    async def request(
+        self,
+        send: Callable[[RpcEndpoint], Awaitable[Tuple[Any, float]]],
+        *,
+        hedge: bool = True,
+    ) -> Any:
+        """
+        Runs `send` against the best endpoint, hedged if allowed.
+
+        Args:
+            send: Sends the call to an endpoint, returns its result and the
+                seconds the endpoint took to answer, excluding any wait for
+                the endpoint's rate limiter.
+            hedge: Whether the call may also be sent to a second endpoint.
+
+        Returns:
+            The result of the first endpoint to answer.
+        """
+        primary = self.pick()
+
+        hedge_delay = (
+            primary.latency_percentile(self.hedge_percentile)
+            if hedge and self.hedge_percentile and len(self.endpoints) > 1
+            else None
+        )
+        if hedge_delay is None:
+            return await self._send(primary, send)
+
+        primary_task = asyncio.ensure_future(self._send(primary, send))
+        done, _ = await asyncio.wait({primary_task}, timeout=hedge_delay)
+        if done:
+            return primary_task.result()
+
+        secondary = self.pick(exclude=primary)
+        if not secondary.healthy:
+            return await primary_task
+
+        self.hedged_requests += 1
+        secondary_task = asyncio.ensure_future(self._send(secondary, send))
+        pending = {primary_task, secondary_task}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary_task:
+                            self.hedge_wins += 1
+                        return task.result()
+
+            # Both failed, surface the primary's error.
+            return primary_task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(
+        self,
+        endpoint: RpcEndpoint,
+        send: Callable[[RpcEndpoint], Awaitable[Tuple[Any, float]]],
+    ) -> Any:
+        try:
+            result, latency = await send(endpoint)
+        except RateLimitException:
+            # Throttling is handled by the endpoint's rate limiter.
+            raise
+        except Exception:
+            endpoint.record_failure()
+            raise
+
+        endpoint.record_success(latency)
+        return result
+
+    async def check_health(self):
+        await asyncio.gather(*[self._probe(endpoint) for endpoint in self.endpoints])
+
+        slots = [endpoint.slot for endpoint in self.endpoints if endpoint.slot]
+        max_slot = max(slots, default=0)
+        for endpoint in self.endpoints:
+            if (
+                endpoint.slot is not None
+                and endpoint.slot < max_slot - RPC_MAX_SLOT_LAG
+            ):
+                if endpoint.healthy:
+                    logger.warning(
+                        "RPC endpoint %s is %s slots behind",
+                        endpoint.url,
+                        max_slot - endpoint.slot,
+                    )
+                endpoint.healthy = False
+
+    async def _probe(self, endpoint: RpcEndpoint):
+        probe = [
+            {"jsonrpc": "2.0", "id": 0, "method": "getHealth"},
+            {"jsonrpc": "2.0", "id": 1, "method": "getSlot"},
+        ]
+        start = time.monotonic()
+        try:
+            results = await asyncio.wait_for(
+                req_post_once(
+                    endpoint.url,
+                    probe,
+                    headers={"Content-Type": "application/json"},
+                ),
+                timeout=RPC_HEALTH_CHECK_TIMEOUT,
+            )
+            results_by_id = {result.get("id"): result for result in results}
+            healthy = results_by_id.get(0, {}).get("result") == "ok"
+            endpoint.slot = results_by_id.get(1, {}).get("result")
+        except Exception as e:
+            logger.warning(
+                "Health check of RPC endpoint %s failed: %s", endpoint.url, e
+            )
+            healthy = False
+            endpoint.slot = None
+
+        if healthy:
+            endpoint.record_probe(time.monotonic() - start)
+        if healthy != endpoint.healthy:
+            logger.warning(
+                "RPC endpoint %s is now %s",
+                endpoint.url,
+                "healthy" if healthy else "unhealthy",
+            )
+        endpoint.healthy = healthy
+
+    async def _run_health_checks(self):
+        while True:
+            try:
+                await self.check_health()
+            except Exception:
+                logger.exception("RPC health checks failed")
+
+            await asyncio.sleep(RPC_HEALTH_CHECK_INTERVAL)
+
+    def start_health_checks(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.ensure_future(self._run_health_checks())
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+
+        self._health_task = None
+
+    def stats(self) -> Dict:
+        return {
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+
+rpc_pool = RpcEndpointPool(RPC_URLS)
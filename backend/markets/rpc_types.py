@@ -0,0 +1,144 @@
+"""
+Typed views of the JSON-RPC responses we read.
+
+Bodies are decoded by msgspec straight into these TypedDicts. Fields that
+aren't declared, such as instructions and log messages of parsed
+transactions, are skipped by the parser instead of being built into nested
+dicts, and declared fields are type checked. The result keeps the JSON-RPC
+shape, so callers read it like the untyped response.
+"""
+
+from typing import Any, Callable, Generic, List, Optional, TypedDict, TypeVar
+
+import msgspec
+
+T = TypeVar("T")
+
+
+class RpcResponse(TypedDict, Generic[T], total=False):
+    id: Any
+    result: Optional[T]
+    error: dict
+
+
+# getTransaction, jsonParsed
+
+
+class UiTokenAmount(TypedDict):
+    amount: str
+    decimals: int
+
+
+class TokenBalance(TypedDict, total=False):
+    mint: str
+    owner: str
+    uiTokenAmount: UiTokenAmount
+
+
+class TransactionMeta(TypedDict, total=False):
+    err: Any
+    fee: int
+    preBalances: List[int]
+    postBalances: List[int]
+    preTokenBalances: List[TokenBalance]
+    postTokenBalances: List[TokenBalance]
+
+
+class AccountKey(TypedDict, total=False):
+    pubkey: str
+    signer: bool
+
+
+class Message(TypedDict, total=False):
+    accountKeys: List[AccountKey]
+
+
+class TransactionBody(TypedDict, total=False):
+    message: Message
+    signatures: List[str]
+
+
+class Transaction(TypedDict, total=False):
+    meta: Optional[TransactionMeta]
+    transaction: TransactionBody
+    slot: int
+    blockTime: Optional[int]
+
+
+class RawRpcResponse(TypedDict, total=False):
+    """Response with its result left as undecoded JSON."""
+
+    id: Any
+    result: msgspec.Raw
+    error: dict
+
+
+# getSignaturesForAddress
+
+
+class SignatureInfo(TypedDict, total=False):
+    signature: str
+    err: Any
+    slot: int
+    blockTime: Optional[int]
+
+
+# getTokenAccountsByOwner, jsonParsed
+
+
+class TokenAmount(TypedDict):
+    amount: str
+    decimals: int
+
+
+class TokenAccountInfo(TypedDict, total=False):
+    mint: str
+    owner: str
+    tokenAmount: TokenAmount
+
+
+class ParsedTokenAccount(TypedDict):
+    info: TokenAccountInfo
+
+
+class TokenAccountData(TypedDict):
+    parsed: ParsedTokenAccount
+
+
+class TokenAccount(TypedDict):
+    data: TokenAccountData
+
+
+class KeyedTokenAccount(TypedDict):
+    pubkey: str
+    account: TokenAccount
+
+
+class TokenAccounts(TypedDict):
+    value: List[KeyedTokenAccount]
+
+
+def typed_decoder(response_type: Any) -> Callable[[bytes], Any]:
+    """
+    Returns a decoder of JSON-RPC response bodies of `response_type`.
+
+    Bodies that don't match the type, like a single error object in place
+    of a batch, are decoded untyped instead.
+    """
+    decoder = msgspec.json.Decoder(response_type)
+
+    def decode(body: bytes) -> Any:
+        try:
+            return decoder.decode(body)
+        except msgspec.ValidationError:
+            return msgspec.json.decode(body)
+
+    return decode
+
+
+decode_raw_transactions = typed_decoder(List[RawRpcResponse])
+# A single getTransaction result, like those of the transaction cache.
+decode_transaction = msgspec.json.Decoder(Transaction).decode
+decode_signatures = typed_decoder(RpcResponse[List[SignatureInfo]])
+decode_signatures_batch = typed_decoder(List[RpcResponse[List[SignatureInfo]]])
+decode_token_accounts = typed_decoder(RpcResponse[TokenAccounts])
@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+from django.db.models import Sum
+
+from markets.models import AttentionMarket, Candle, TokenTrade
+from markets.rpc import RpcException, get_account_infos, get_token_largest_accounts
+from tools.dictionary import get_from_dict
+from tools.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Trade aggregates are cheap queries, holders cost two RPC calls.
+MARKET_STATS_TTL = float(os.getenv("MARKET_STATS_TTL", 10))
+MARKET_STATS_STALE_TTL = float(os.getenv("MARKET_STATS_STALE_TTL", 60))
+TOP_HOLDERS_TTL = float(os.getenv("TOP_HOLDERS_TTL", 60))
+TOP_HOLDERS_STALE_TTL = float(os.getenv("TOP_HOLDERS_STALE_TTL", 600))
+TOP_HOLDERS_LIMIT = 10
+
+VOLUME_WINDOW = 24 * 60 * 60
+
+market_stats_cache = TTLCache(ttl=MARKET_STATS_TTL, stale_ttl=MARKET_STATS_STALE_TTL)
+top_holders_cache = TTLCache(ttl=TOP_HOLDERS_TTL, stale_ttl=TOP_HOLDERS_STALE_TTL)
+
+
+async def get_market_stats(market: AttentionMarket) -> Dict:
+    """
+    Returns the summary of a market, cached per market.
+
+    Args:
+        market: Market to summarize
+
+    Returns:
+        Trade aggregates and top holders, holders are None if the chain
+        couldn't be read
+    """
+    stats = await market_stats_cache.get(market.id, lambda: compute_trade_stats(market))
+
+    try:
+        top_holders = await top_holders_cache.get(
+            market.address, lambda: get_top_holders(market.address)
+        )
+    except Exception:
+        logger.exception("Failed to get top holders of market %s", market.id)
+        top_holders = None
+
+    return {**stats, "top_holders": top_holders}
+
+
+async def compute_trade_stats(market: AttentionMarket) -> Dict:
+    # Summarizes what is indexed, keeping the index fresh is left to the
+    # indexer and the trade endpoints, so a stats request costs no RPC call.
+    trades = TokenTrade.objects.filter(market=market)
+    last_trade = (
+        await trades.order_by("-timestamp", "-id")
+        .values("sol_amount", "token_amount", "timestamp")
+        .afirst()
+    )
+
+    # Summed from minute bars, so the window is aligned to the minute.
+    window_start = int(time.time()) - VOLUME_WINDOW
+    volume = await Candle.objects.filter(
+        market=market, interval="1m", bucket_start__gte=window_start - 60
+    ).aaggregate(
+        volume_sol=Sum("volume_sol"),
+        volume_token=Sum("volume_token"),
+        trade_count=Sum("trade_count"),
+    )
+
+    return {
+        "last_price": (
+            last_trade["sol_amount"] / last_trade["token_amount"]
+            if last_trade and last_trade["token_amount"]
+            else None
+        ),
+        "last_trade_at": last_trade["timestamp"] if last_trade else None,
+        "volume_sol_24h": volume["volume_sol"] or 0,
+        "volume_token_24h": volume["volume_token"] or 0,
+        "trade_count_24h": volume["trade_count"] or 0,
+        "trade_count": await trades.acount(),
+        "unique_traders": await trades.values("signer").distinct().acount(),
+    }
+
+
+async def get_top_holders(
+    token_address: str, limit: int = TOP_HOLDERS_LIMIT
+) -> List[Dict]:
+    """
+    Gets the largest token accounts of a mint with their owners.
+
+    Args:
+        token_address: Address of the token
+        limit: Maximum number of holders
+
+    Returns:
+        Holders with their token account, owner and amount, largest first
+    """
+    resp = await get_token_largest_accounts(token_address)
+    if "result" not in resp:
+        raise RpcException(f"getTokenLargestAccounts failed: {resp.get('error')}")
+
+    accounts = resp["result"]["value"][:limit]
+    if not accounts:
+        return []
+
+    infos = await get_account_infos([account["address"] for account in accounts])
+    owners: List[Optional[str]] = [
+        get_from_dict(info, ["data", "parsed", "info", "owner"]) if info else None
+        for info in get_from_dict(infos, ["result", "value"]) or [None] * len(accounts)
+    ]
+
+    return [
+        {
+            "token_account": account["address"],
+            "owner": owner,
+            "amount": float(account["uiAmountString"]),
+        }
+        for account, owner in zip(accounts, owners)
+    ]
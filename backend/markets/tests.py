@@ -1,3 +1,1081 @@
-from django.test import TestCase
+import os
+import asyncio
+import tempfile
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+import msgspec
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils.http import parse_http_date
+from fastapi import status
+from solders.hash import Hash
+from solders.keypair import Keypair
+from solders.system_program import ID as SYSTEM_PROGRAM_ID
+from spl.token.constants import ASSOCIATED_TOKEN_PROGRAM_ID, TOKEN_PROGRAM_ID
+
+from backend.asgi import app
+from benchmarks.token_trades import classify_per_transaction, make_transactions
+from markets.api import create_and_mint_token
+from markets.broadcast import TradeBroadcastHub
+from markets.candles import CANDLE_FIELDS, rebuild_candles
+from markets.indexer import TradeIndexer
+from markets.log_subscriber import TradeLogSubscriber
+from markets.mint_pool import claim_pooled_mint, fill_mint_pool
+from markets.mock_rpc import FixtureResponder, MockRpcServer
+from markets.models import (
+    AttentionMarket,
+    Candle,
+    MarketCreationJob,
+    MarketTradeCursor,
+    PooledMint,
+    TokenTrade,
+)
+from markets.rpc import (
+    batched_rpc_requests,
+    get_transactions,
+    iter_transaction_batches,
+    rpc_request,
+)
+from markets.rpc_pool import (
+    RPC_HEDGE_MIN_SAMPLES,
+    RPC_MAX_CONSECUTIVE_FAILURES,
+    RpcEndpoint,
+    RpcEndpointPool,
+    rpc_pool,
+)
+from markets.rpc_types import decode_raw_transactions, decode_transaction
+from markets.token_trades import (
+    classify_sol_token_trades,
+    get_sol_token_trades,
+    is_sol_token_trade,
+)
+from markets.trade_index import store_market_trades, sync_market_trades
+from markets.tx_cache import TransactionCache
+from markets.typing import TokenTrade as TokenTradeData
+from tools.http import close_http_session, set_http_transport
+from tools.rate_limit import AdaptiveRateLimiter
+from tools.transport import (
+    NOT_RECORDED_ERROR_CODE,
+    Cassette,
+    RecordingTransport,
+    ReplayTransport,
+)
+from tools.ttl_cache import TTLCache
+
+MINT = "Mint" + "1" * 40
+SIGNER = "Signer" + "2" * 38
+
+
+def make_swap(signature: str, block_time: int, *, kind: str = "buy") -> dict:
+    """A jsonParsed `getTransaction` result of the signer swapping SOL for MINT."""
+    sol_delta = 10**8 if kind == "sell" else -(10**8)
+    token_delta = -(10**6) if kind == "sell" else 10**6
+
+    def token_balance(amount: int) -> dict:
+        return {
+            "accountIndex": 1,
+            "mint": MINT,
+            "owner": SIGNER,
+            "uiTokenAmount": {"amount": str(amount), "decimals": 6},
+        }
+
+    return {
+        "blockTime": block_time,
+        "slot": block_time,
+        "meta": {
+            "err": None,
+            "fee": 5000,
+            "preBalances": [10**10, 0],
+            "postBalances": [10**10 + sol_delta - 5000, 0],
+            "preTokenBalances": [token_balance(10**9)],
+            "postTokenBalances": [token_balance(10**9 + token_delta)],
+        },
+        "transaction": {
+            "signatures": [signature],
+            "message": {
+                "accountKeys": [
+                    {"pubkey": SIGNER, "signer": True},
+                    {"pubkey": "TokenAccount" + "3" * 32, "signer": False},
+                ]
+            },
+        },
+    }
+
+
+def make_fixture(transactions: List[dict]) -> dict:
+    """Fixture of MINT's history, `transactions` oldest first."""
+    return {
+        "address": MINT,
+        "slot": transactions[-1]["slot"] if transactions else 0,
+        "signatures": [
+            {
+                "signature": tx["transaction"]["signatures"][0],
+                "slot": tx["slot"],
+                "err": None,
+                "memo": None,
+                "blockTime": tx["blockTime"],
+                "confirmationStatus": "finalized",
+            }
+            for tx in reversed(transactions)
+        ],
+        "transactions": {tx["transaction"]["signatures"][0]: tx for tx in transactions},
+    }
+
+
+class FailingResponder(FixtureResponder):
+    """Answers `getTransaction` of the `failing` signatures with an error."""
+
+    def __init__(self, fixture: dict, failing: Iterable[str]):
+        super().__init__(fixture)
+        self.failing = set(failing)
+
+    def __call__(self, request: dict) -> dict:
+        if (
+            request.get("method") == "getTransaction"
+            and request["params"][0] in self.failing
+        ):
+            return {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "error": {"code": -32602, "message": "Invalid params"},
+            }
+
+        return super().__call__(request)
+
+
+async def create_market() -> AttentionMarket:
+    market = await AttentionMarket.objects.acreate(
+        slug="test", address=MINT, image_url="https://example.com/test.png"
+    )
+    await MarketTradeCursor.objects.acreate(market=market)
+
+    return market
+
+
+async def get_signatures(market: AttentionMarket) -> Dict[str, str]:
+    """Types of the market's stored trades, by signature."""
+    return {
+        trade.signature: trade.type
+        async for trade in TokenTrade.objects.filter(market=market)
+    }
+
+
+def api_client() -> httpx.AsyncClient:
+    """Client of the API app in process, without running its lifespan."""
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+    )
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 10):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("Timed out waiting for the condition")
+        await asyncio.sleep(0.02)
+
+
+class MockRpcTestCase(TestCase):
+    """Routes RPC calls to a mock server started by `start_mock_rpc`."""
+
+    async def start_mock_rpc(self, transactions: List[dict], **kwargs) -> MockRpcServer:
+        server = MockRpcServer(FixtureResponder(make_fixture(transactions)), **kwargs)
+        url = await server.start("127.0.0.1", 0)
+
+        patcher = mock.patch.object(rpc_pool, "endpoints", [RpcEndpoint(url)])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_rpc_url = url
+
+        return server
+
+    async def stop_mock_rpc(self, server: MockRpcServer):
+        await server.stop()
+        await close_http_session()
+
+
+class TradeLogSubscriberTests(MockRpcTestCase):
+    async def test_reconnect_reconciles_trades_missed_while_disconnected(self):
+        market = await create_market()
+        history = [make_swap("sig-1", 1_700_000_000)]
+        server = await self.start_mock_rpc(history)
+        subscriber = TradeLogSubscriber(
+            self.mock_rpc_url.replace("http://", "ws://"),
+            flush_interval=0.02,
+            reconcile_interval=3600,
+            markets_refresh_interval=0.05,
+        )
+
+        with mock.patch("markets.log_subscriber.WS_MIN_RECONNECT_DELAY", 0.05):
+            running = asyncio.ensure_future(subscriber.run())
+            try:
+                # Subscribed, then the history is synced from the cursor.
+                await wait_until(lambda: server.subscribed_addresses() == [MINT])
+                await wait_until(lambda: subscriber.stats().get("reconciliations") == 1)
+                self.assertEqual(await get_signatures(market), {"sig-1": "buy"})
+
+                # A pushed trade is stored without a cursor sync.
+                history.append(make_swap("sig-2", 1_700_000_001, kind="sell"))
+                server.responder = FixtureResponder(make_fixture(history))
+                self.assertEqual(await server.notify_logs(MINT, "sig-2"), 1)
+                await wait_until(lambda: subscriber.stats().get("trades") == 1)
+
+                # A trade made while disconnected is never notified, the
+                # sync on reconnect fills the gap.
+                await server.close_websockets()
+                history.append(make_swap("sig-3", 1_700_000_002))
+                server.responder = FixtureResponder(make_fixture(history))
+                await wait_until(lambda: subscriber.stats().get("reconciliations") == 2)
+            finally:
+                subscriber.stop()
+                await running
+                await self.stop_mock_rpc(server)
+
+        self.assertEqual(
+            await get_signatures(market),
+            {"sig-1": "buy", "sig-2": "sell", "sig-3": "buy"},
+        )
+        self.assertEqual(subscriber.stats()["reconnects"], 1)
+        self.assertEqual(server.stats()["ws_connections"], 2)
+        cursor = await MarketTradeCursor.objects.aget(market=market)
+        self.assertEqual(cursor.last_signature, "sig-3")
+
+
+class TradeIndexTests(MockRpcTestCase):
+    async def test_sync_stores_new_trades_and_advances_the_cursor(self):
+        market = await create_market()
+        history = [make_swap(f"sig-{i}", 1_700_000_000 + i) for i in range(3)]
+        server = await self.start_mock_rpc(history)
+        try:
+            self.assertEqual(len(await sync_market_trades(market)), 3)
+            cursor = await MarketTradeCursor.objects.aget(market=market)
+            self.assertEqual(cursor.last_signature, "sig-2")
+
+            # Only signatures newer than the cursor are walked.
+            history.append(make_swap("sig-3", 1_700_000_003, kind="sell"))
+            server.responder = FixtureResponder(make_fixture(history))
+            new_trades = await sync_market_trades(market)
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertEqual([trade.signature for trade in new_trades], ["sig-3"])
+        self.assertEqual(len(await get_signatures(market)), 4)
+        cursor = await MarketTradeCursor.objects.aget(market=market)
+        self.assertEqual(cursor.last_signature, "sig-3")
+
+    async def test_partial_fetch_stores_trades_without_moving_the_cursor(self):
+        market = await create_market()
+        history = [make_swap(f"sig-{i}", 1_700_000_000 + i) for i in range(3)]
+        server = await self.start_mock_rpc(history)
+        server.responder = FailingResponder(make_fixture(history), ["sig-1"])
+        try:
+            await sync_market_trades(market)
+            self.assertEqual(set(await get_signatures(market)), {"sig-0", "sig-2"})
+            cursor = await MarketTradeCursor.objects.aget(market=market)
+            self.assertIsNone(cursor.last_signature)
+
+            # The next sync walks the same range again.
+            server.responder = FixtureResponder(make_fixture(history))
+            new_trades = await sync_market_trades(market)
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertEqual([trade.signature for trade in new_trades], ["sig-1"])
+        cursor = await MarketTradeCursor.objects.aget(market=market)
+        self.assertEqual(cursor.last_signature, "sig-2")
+
+
+class BatchedRpcRequestsTests(MockRpcTestCase):
+    def make_requests(self, count: int) -> List[dict]:
+        return [
+            {"jsonrpc": "2.0", "id": f"request-{i}", "method": "getHealth"}
+            for i in range(count)
+        ]
+
+    @mock.patch("markets.rpc.BASE_WAIT", 0)
+    async def test_failed_items_are_resent(self):
+        server = await self.start_mock_rpc(
+            [], batch_error_rate=0.3, batch_drop_rate=0.2, seed=1
+        )
+        try:
+            responses = await batched_rpc_requests(
+                self.make_requests(50), 10, max_attempts=10
+            )
+        finally:
+            await self.stop_mock_rpc(server)
+
+        stats = server.stats()
+        self.assertGreater(stats["errors"], 0)
+        self.assertGreater(stats["dropped"], 0)
+        self.assertEqual(stats["requests"], 50 + stats["errors"] + stats["dropped"])
+        self.assertEqual(
+            [response["id"] for response in responses],
+            [f"request-{i}" for i in range(50)],
+        )
+        self.assertTrue(all(response["result"] == "ok" for response in responses))
+
+    @mock.patch("markets.rpc.BASE_WAIT", 0)
+    async def test_items_failing_every_attempt_keep_their_error(self):
+        server = await self.start_mock_rpc([], batch_error_rate=1)
+        try:
+            responses = await batched_rpc_requests(
+                self.make_requests(3), 2, max_attempts=2
+            )
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertEqual(server.stats()["requests"], 6)
+        self.assertEqual(
+            [response["id"] for response in responses],
+            ["request-0", "request-1", "request-2"],
+        )
+        self.assertTrue(all("error" in response for response in responses))
+
+
+class CandleTests(TestCase):
+    def make_trade(
+        self, signature: str, timestamp: int, price: float
+    ) -> TokenTradeData:
+        return TokenTradeData(
+            type="buy",
+            sol_amount=price * 10,
+            token=MINT,
+            token_amount=10,
+            timestamp=timestamp,
+            signature=signature,
+            signer=SIGNER,
+        )
+
+    async def get_candles(self, market: AttentionMarket) -> List[dict]:
+        return [
+            candle
+            async for candle in Candle.objects.filter(market=market)
+            .order_by("interval", "bucket_start")
+            .values("interval", *CANDLE_FIELDS)
+        ]
+
+    async def test_incremental_candles_match_a_rebuild(self):
+        market = await create_market()
+        batches = [
+            [
+                self.make_trade("a", 1_700_000_010, 2),
+                self.make_trade("b", 1_700_000_070, 3),
+            ],
+            # Ingested late, older than the first batch, and a new close.
+            [
+                self.make_trade("c", 1_700_000_001, 1),
+                self.make_trade("d", 1_700_000_075, 4),
+            ],
+        ]
+        for trades in batches:
+            # Stores expect trades newest first.
+            await store_market_trades(
+                market.id,
+                sorted(trades, key=lambda trade: -trade.timestamp),
+                since_signature=None,
+                newest_signature=None,
+            )
+
+        incremental = await self.get_candles(market)
+        await sync_to_async(rebuild_candles)(market.id)
+        self.assertEqual(incremental, await self.get_candles(market))
+
+        hour = next(candle for candle in incremental if candle["interval"] == "1h")
+        self.assertEqual(
+            (hour["open"], hour["high"], hour["low"], hour["close"]), (1, 4, 1, 4)
+        )
+        self.assertEqual(hour["trade_count"], 4)
+
+
+class TradeBroadcastHubTests(SimpleTestCase):
+    async def test_slow_subscriber_is_evicted_without_blocking_others(self):
+        hub = TradeBroadcastHub(queue_size=2)
+        fast, slow = hub.connect(), hub.connect()
+        hub.subscribe(fast, [1])
+        hub.subscribe(slow, [1, 2])
+
+        for i in range(3):
+            hub.publish(1, [{"signature": f"sig-{i}"}])
+            self.assertIn(f"sig-{i}", fast.queue.get_nowait())
+
+        self.assertEqual(slow.close_code, status.WS_1013_TRY_AGAIN_LATER)
+        # The backlog is dropped, only the close sentinel is left.
+        self.assertIsNone(slow.queue.get_nowait())
+        self.assertTrue(slow.queue.empty())
+        self.assertFalse(hub.has_subscribers(2))
+        self.assertEqual(hub.publish(2, [{"signature": "sig-3"}]), 0)
+        self.assertEqual(hub.publish(1, [{"signature": "sig-4"}]), 1)
+        self.assertEqual(hub.stats()["evicted"], 1)
+        self.assertEqual(hub.stats()["subscribers"], 1)
+
+
+class MarketListingTests(TestCase):
+    def setUp(self):
+        self.now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        for patcher in [
+            mock.patch("django.utils.timezone.now", lambda: self.now),
+            mock.patch("markets.listing_cache.LISTING_VERSION_CHECK_INTERVAL", 0),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_conditional_requests_see_created_and_deleted_markets(self):
+        await create_market()
+        self.now += timedelta(minutes=1)
+        other = await AttentionMarket.objects.acreate(
+            slug="other", address="Other" + "4" * 39, image_url=""
+        )
+
+        async with api_client() as client:
+            response = await client.get("/markets/attention/")
+            self.assertEqual(len(response.json()), 2)
+            etag = response.headers["etag"]
+            last_modified = response.headers["last-modified"]
+            self.assertEqual(parse_http_date(last_modified), int(self.now.timestamp()))
+
+            for headers in [
+                {"If-None-Match": etag},
+                {"If-Modified-Since": last_modified},
+            ]:
+                response = await client.get("/markets/attention/", headers=headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.headers["etag"], etag)
+
+            # Deleting the newest market must not move Last-Modified back.
+            self.now += timedelta(minutes=1)
+            await other.adelete()
+            for headers in [
+                {"If-None-Match": etag},
+                {"If-Modified-Since": last_modified},
+            ]:
+                response = await client.get("/markets/attention/", headers=headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [market["slug"] for market in response.json()], ["test"]
+                )
+                self.assertNotEqual(response.headers["etag"], etag)
+                self.assertEqual(
+                    parse_http_date(response.headers["last-modified"]),
+                    int(self.now.timestamp()),
+                )
+
+
+class RpcPoolTests(MockRpcTestCase):
+    async def test_latency_excludes_the_rate_limiter_wait(self):
+        server = await self.start_mock_rpc([])
+        endpoint = rpc_pool.endpoints[0]
+        # Tokens for one call every 20ms, calls mostly wait in the limiter.
+        endpoint.rate_limiter = AdaptiveRateLimiter(max_in_flight=8, rate=50, burst=1)
+        start = asyncio.get_running_loop().time()
+        try:
+            await asyncio.gather(
+                *[
+                    rpc_request({"jsonrpc": "2.0", "id": i, "method": "getHealth"})
+                    for i in range(RPC_HEDGE_MIN_SAMPLES)
+                ]
+            )
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertGreater(asyncio.get_running_loop().time() - start, 0.3)
+        self.assertLess(endpoint.latency_percentile(99), 0.1)
+        self.assertLess(endpoint.ewma_latency, 0.1)
+
+    async def test_slow_reads_are_hedged_to_the_next_endpoint(self):
+        slow = MockRpcServer(FixtureResponder(make_fixture([])), latency=1)
+        fast = MockRpcServer(FixtureResponder(make_fixture([])))
+        slow_endpoint = RpcEndpoint(await slow.start("127.0.0.1", 0))
+        fast_endpoint = RpcEndpoint(await fast.start("127.0.0.1", 0))
+        # The slow endpoint looks best until it fails to answer in time.
+        for _ in range(RPC_HEDGE_MIN_SAMPLES):
+            slow_endpoint.record_success(0.01)
+        fast_endpoint.record_success(0.02)
+
+        hedge_wins = rpc_pool.hedge_wins
+        request = {"jsonrpc": "2.0", "id": 1, "method": "getHealth"}
+        endpoints = [slow_endpoint, fast_endpoint]
+        try:
+            with mock.patch.object(rpc_pool, "endpoints", endpoints):
+                response = await asyncio.wait_for(rpc_request(request), 0.5)
+                # Writes are never sent twice.
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(rpc_request(request, hedge=False), 0.5)
+        finally:
+            await slow.stop()
+            await fast.stop()
+            await close_http_session()
+
+        self.assertEqual(response["result"], "ok")
+        self.assertEqual(rpc_pool.hedge_wins, hedge_wins + 1)
+        self.assertEqual(fast.stats()["requests"], 1)
+
+
+class RpcEndpointPoolTests(SimpleTestCase):
+    def test_fastest_healthy_endpoint_is_picked(self):
+        pool = RpcEndpointPool(["http://a", "http://b", "http://c"])
+        a, b, c = pool.endpoints
+        a.record_success(0.3)
+        b.record_success(0.1)
+        c.record_success(0.05)
+        c.healthy = False
+
+        self.assertIs(pool.pick(), b)
+        self.assertIs(pool.pick(exclude=b), a)
+
+        # With every endpoint down, the fastest one is still tried.
+        a.healthy = b.healthy = False
+        self.assertIs(pool.pick(), c)
+
+    async def test_failing_endpoint_is_routed_around(self):
+        pool = RpcEndpointPool(["http://a", "http://b"])
+        a, b = pool.endpoints
+        a.record_success(0.01)
+        b.record_success(0.1)
+
+        async def send(endpoint: RpcEndpoint):
+            if endpoint is a:
+                raise ConnectionError()
+            return endpoint.url, 0.1
+
+        for _ in range(RPC_MAX_CONSECUTIVE_FAILURES):
+            with self.assertRaises(ConnectionError):
+                await pool.request(send, hedge=False)
+
+        self.assertFalse(a.healthy)
+        self.assertEqual(await pool.request(send, hedge=False), "http://b")
+
+
+class TradeClassifierTests(SimpleTestCase):
+    def test_batch_matches_the_per_transaction_classifier(self):
+        transactions = make_transactions(2000, seed=7)
+        # Transactions with no signer or no balances are skipped, not failed.
+        transactions += [{}, {"meta": {}, "transaction": {"message": {}}}]
+
+        trades = classify_sol_token_trades(transactions)
+
+        self.assertEqual(trades, [classify_per_transaction(tx) for tx in transactions])
+        self.assertEqual(trades, [is_sol_token_trade(tx) for tx in transactions])
+        self.assertEqual(
+            {trade.type if trade else None for trade in trades}, {"buy", "sell", None}
+        )
+
+
+class TradeIndexerTests(MockRpcTestCase):
+    async def get_cursor(self, market: AttentionMarket) -> str:
+        cursor = await MarketTradeCursor.objects.aget(market=market)
+        return cursor.last_signature
+
+    async def test_full_signature_page_is_walked_to_the_cursor(self):
+        market = await create_market()
+        history = [make_swap("sig-0", 1_700_000_000)]
+        server = await self.start_mock_rpc(history)
+        indexer = TradeIndexer(poll_interval=0)
+        try:
+            # A node answering two signatures per page.
+            with mock.patch("markets.mock_rpc.SIGNATURES_PAGE_SIZE", 2), mock.patch(
+                "markets.rpc.SIGNATURES_PAGE_SIZE", 2
+            ), mock.patch("markets.indexer.SIGNATURES_PAGE_SIZE", 2):
+                await indexer.tick()
+                self.assertEqual(await self.get_cursor(market), "sig-0")
+
+                history += [
+                    make_swap(f"sig-{i}", 1_700_000_000 + i) for i in range(1, 6)
+                ]
+                server.responder = FixtureResponder(make_fixture(history))
+                await indexer.tick()
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertEqual(len(await get_signatures(market)), 6)
+        self.assertEqual(await self.get_cursor(market), "sig-5")
+
+    async def test_cursor_waits_for_missing_transactions(self):
+        market = await create_market()
+        history = [make_swap("sig-0", 1_700_000_000)]
+        server = await self.start_mock_rpc(history)
+        indexer = TradeIndexer(poll_interval=0)
+        try:
+            await indexer.tick()
+
+            history += [make_swap(f"sig-{i}", 1_700_000_000 + i) for i in (1, 2)]
+            server.responder = FailingResponder(make_fixture(history), ["sig-1"])
+            await indexer.tick()
+            self.assertEqual(set(await get_signatures(market)), {"sig-0", "sig-2"})
+            self.assertEqual(await self.get_cursor(market), "sig-0")
+
+            # The next poll fetches the same range again.
+            server.responder = FixtureResponder(make_fixture(history))
+            await indexer.tick()
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertEqual(len(await get_signatures(market)), 3)
+        self.assertEqual(await self.get_cursor(market), "sig-2")
+
+
+class TransactionCacheTests(MockRpcTestCase):
+    async def test_fetched_transactions_are_served_from_cache(self):
+        history = [make_swap(f"sig-{i}", 1_700_000_000 + i) for i in range(3)]
+        server = await self.start_mock_rpc(history)
+        cache = TransactionCache()
+        signatures = ["sig-2", "sig-0", "unknown"]
+        try:
+            with mock.patch("markets.rpc.transaction_cache", cache):
+                fetched = await get_transactions(signatures, use_cache=True)
+                requests = server.stats()["requests"]
+                cached = await get_transactions(signatures, use_cache=True)
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertEqual(
+            [tx["transaction"]["signatures"][0] for tx in fetched], ["sig-2", "sig-0"]
+        )
+        self.assertEqual(cached, fetched)
+        # Only the transaction the node doesn't have is requested again.
+        self.assertEqual(server.stats()["requests"], requests + 1)
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["stores"], 2)
+
+    async def test_least_recently_used_entries_are_evicted(self):
+        cache = TransactionCache(max_entries=2)
+        now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        with mock.patch("markets.tx_cache.timezone.now", lambda: now):
+            for signature in ["a", "b", "c"]:
+                await cache.set_many({signature: b"{}"})
+                now += timedelta(hours=1)
+
+            # Reading "a" moves it ahead of "b".
+            self.assertEqual(await cache.get_many(["a"]), {"a": b"{}"})
+            await cache.evict()
+
+            self.assertEqual(set(await cache.get_many(["a", "b", "c"])), {"a", "c"})
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+@mock.patch("markets.mock_rpc.SIGNATURES_PAGE_SIZE", 3)
+@mock.patch("markets.rpc.SIGNATURES_PAGE_SIZE", 3)
+@mock.patch("markets.rpc.BATCH_REQUEST_SIZE", 2)
+class TradePipelineTests(MockRpcTestCase):
+    """Runs against a node answering three signatures per page."""
+
+    async def test_history_of_several_pages_is_streamed_in_order(self):
+        history = [
+            make_swap(f"sig-{i}", 1_700_000_000 + i, kind=["buy", "sell"][i % 2])
+            for i in range(10)
+        ]
+        server = await self.start_mock_rpc(history)
+        try:
+            trades = await get_sol_token_trades(MINT)
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertEqual(
+            [(trade.signature, trade.type) for trade in trades],
+            [(f"sig-{i}", ["buy", "sell"][i % 2]) for i in reversed(range(10))],
+        )
+
+    async def test_fetches_stay_bounded_ahead_of_the_consumer(self):
+        history = [make_swap(f"sig-{i}", 1_700_000_000 + i) for i in range(30)]
+        server = await self.start_mock_rpc(history)
+        batches = iter_transaction_batches(MINT, max_in_flight=1)
+        try:
+            signatures, transactions = await anext(batches)
+            # Give the producer time to run as far ahead as it may.
+            await asyncio.sleep(0.1)
+            requests = server.stats()["requests"]
+            await batches.aclose()
+        finally:
+            await self.stop_mock_rpc(server)
+
+        self.assertEqual(signatures, ["sig-29", "sig-28"])
+        self.assertEqual(len(transactions), 2)
+        # Of 10 pages and 30 transactions: two pages and three batches, the
+        # one yielded, one queued and one waiting to be queued.
+        self.assertLessEqual(requests, 2 + 5)
+
+
+class RecordReplayTests(MockRpcTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cassette_path = os.path.join(directory.name, "rpc.jsonl")
+
+        for patcher in [
+            # Every transaction goes through the transport on both runs.
+            mock.patch("markets.rpc.TX_CACHE_ENABLED", False),
+            mock.patch("tools.http._transport", None),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_recorded_history_is_replayed_without_the_node(self):
+        history = [
+            make_swap(f"sig-{i}", 1_700_000_000 + i, kind=["buy", "sell"][i % 2])
+            for i in range(7)
+        ]
+        server = await self.start_mock_rpc(history)
+        set_http_transport(RecordingTransport(Cassette(self.cassette_path)))
+        try:
+            recorded = await get_sol_token_trades(MINT)
+        finally:
+            await self.stop_mock_rpc(server)
+
+        # The node is gone, only the cassette answers.
+        set_http_transport(ReplayTransport(Cassette(self.cassette_path).load()))
+        replayed = await get_sol_token_trades(MINT)
+
+        self.assertEqual(len(recorded), 7)
+        self.assertEqual(replayed, recorded)
+
+        cassette = Cassette(self.cassette_path).load()
+        with self.assertLogs("tools.transport", "WARNING"):
+            response, _ = cassette.respond(
+                {"id": 1, "method": "getTransaction", "params": ["unknown"]}
+            )
+        self.assertEqual(response["error"]["code"], NOT_RECORDED_ERROR_CODE)
+
+
+class MarketTradesEndpointTests(MockRpcTestCase):
+    async def test_trades_are_paged_by_signature_and_streamed(self):
+        market = await create_market()
+        history = [make_swap(f"sig-{i}", 1_700_000_000 + i) for i in range(5)]
+        server = await self.start_mock_rpc(history)
+        url = f"/markets/attention/trades/{market.id}"
+        try:
+            async with api_client() as client:
+
+                async def get_page(**params) -> List[str]:
+                    response = await client.get(url, params=params)
+                    self.assertEqual(response.status_code, 200)
+                    return [trade["signature"] for trade in response.json()]
+
+                # The whole history by default, synced on read.
+                self.assertEqual(
+                    await get_page(), [f"sig-{i}" for i in range(4, -1, -1)]
+                )
+                self.assertEqual(await get_page(limit=2), ["sig-4", "sig-3"])
+                self.assertEqual(
+                    await get_page(before="sig-3", limit=2), ["sig-2", "sig-1"]
+                )
+                self.assertEqual(await get_page(before="sig-0"), [])
+
+                response = await client.get(
+                    url, params={"stream": "true", "before": "sig-2"}
+                )
+                self.assertEqual(
+                    response.headers["content-type"], "application/x-ndjson"
+                )
+                self.assertEqual(
+                    [
+                        msgspec.json.decode(line)["signature"]
+                        for line in response.text.splitlines()
+                    ],
+                    ["sig-1", "sig-0"],
+                )
+
+                for params in [
+                    {"before": "unknown"},
+                    {"before": "unknown", "stream": "true"},
+                ]:
+                    response = await client.get(url, params=params)
+                    self.assertEqual(response.status_code, 404)
+                response = await client.get(url, params={"limit": 100_000})
+                self.assertEqual(response.status_code, 422)
+        finally:
+            await self.stop_mock_rpc(server)
+
+
+class RpcDecoderTests(SimpleTestCase):
+    def test_transactions_keep_only_the_classified_fields(self):
+        transactions = make_transactions(50, seed=3)
+
+        decoded = [decode_transaction(msgspec.json.encode(tx)) for tx in transactions]
+
+        self.assertNotIn("innerInstructions", decoded[0]["meta"])
+        self.assertNotIn("instructions", decoded[0]["transaction"]["message"])
+        self.assertEqual(
+            classify_sol_token_trades(decoded), classify_sol_token_trades(transactions)
+        )
+
+    def test_raw_results_are_kept_byte_for_byte(self):
+        transaction = msgspec.json.encode(make_swap("sig-0", 1_700_000_000))
+        items = [
+            b'{"jsonrpc":"2.0","id":"sig-0","result":' + transaction + b"}",
+            b'{"jsonrpc":"2.0","id":"sig-1","result":null}',
+        ]
+
+        responses = decode_raw_transactions(b"[" + b",".join(items) + b"]")
+
+        self.assertEqual(bytes(responses[0]["result"]), transaction)
+        self.assertEqual(bytes(responses[1]["result"]), b"null")
+
+    def test_unexpected_bodies_are_decoded_untyped(self):
+        body = b'{"jsonrpc":"2.0","id":null,"error":{"code":-32600}}'
+
+        self.assertEqual(decode_raw_transactions(body)["error"], {"code": -32600})
+
+
+class FakeSolanaClient:
+    """Stands in for the solana-py client, keeping the sent transactions."""
+
+    commitment = "confirmed"
+
+    def __init__(self):
+        self.sent = []
+
+    async def get_minimum_balance_for_rent_exemption(self, size: int):
+        return SimpleNamespace(value=1_461_600)
+
+    async def get_latest_blockhash(self):
+        return SimpleNamespace(
+            value=SimpleNamespace(blockhash=Hash.default(), last_valid_block_height=10)
+        )
+
+    async def send_transaction(self, transaction, opts):
+        self.sent.append((transaction, opts))
+        return SimpleNamespace(value=transaction.signatures[0])
+
+
+class TokenCreationTests(SimpleTestCase):
+    async def test_token_is_created_and_minted_in_one_transaction(self):
+        client = FakeSolanaClient()
+        payer, mint = Keypair(), Keypair()
+        with mock.patch(
+            "markets.api.get_sonic_testnet_client", return_value=client
+        ), mock.patch("markets.api.get_keypair", return_value=payer):
+            address = await create_and_mint_token(mint)
+
+        self.assertEqual(address, str(mint.pubkey()))
+        self.assertEqual(len(client.sent), 1)
+        transaction, opts = client.sent[0]
+        transaction.verify()
+        message = transaction.message
+        self.assertEqual(message.account_keys[:2], [payer.pubkey(), mint.pubkey()])
+        self.assertEqual(
+            [
+                message.account_keys[instruction.program_id_index]
+                for instruction in message.instructions
+            ],
+            [
+                SYSTEM_PROGRAM_ID,
+                TOKEN_PROGRAM_ID,
+                ASSOCIATED_TOKEN_PROGRAM_ID,
+                TOKEN_PROGRAM_ID,
+            ],
+        )
+        # The market is only stored once the mint landed.
+        self.assertFalse(opts.skip_confirmation)
+
+
+class MarketCreationJobTests(TestCase):
+    def setUp(self):
+        self.minted = []
+        self.fail_minting = False
+        for patcher in [
+            mock.patch("markets.jobs.create_and_mint_token", self.mint),
+            # Nothing landed from the failed attempt.
+            mock.patch("markets.jobs.mint_exists", return_value=False),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def mint(self, mint: Keypair) -> str:
+        if self.fail_minting:
+            raise ConnectionError("RPC unavailable")
+
+        self.minted.append(str(mint.pubkey()))
+        return self.minted[-1]
+
+    async def test_slug_is_the_idempotency_key_and_failed_jobs_are_retried(self):
+        request = {"slug": "test", "image_url": "https://example.com/test.png"}
+        async with api_client() as client:
+            self.fail_minting = True
+            response = await client.post("/markets/attention/", json=request)
+            self.assertEqual(response.status_code, 202)
+            job = response.json()
+            self.assertEqual(job["status"], "failed")
+            self.assertEqual(job["error"], "RPC unavailable")
+
+            # Posting the slug again retries the same job.
+            self.fail_minting = False
+            response = await client.post("/markets/attention/", json=request)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["id"], job["id"])
+            self.assertEqual(response.json()["status"], "succeeded")
+
+            # And once it succeeded, returns it without minting again.
+            response = await client.post(
+                "/markets/attention/", json={**request, "image_url": "ignored"}
+            )
+            self.assertEqual(response.status_code, 200)
+            market = response.json()["market"]
+            self.assertEqual(market["address"], self.minted[0])
+            self.assertEqual(market["image_url"], request["image_url"])
+
+            response = await client.get(f"/markets/attention/jobs/{job['id']}")
+            self.assertEqual(response.json()["status"], "succeeded")
+            response = await client.get("/markets/attention/jobs/0")
+            self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(len(self.minted), 1)
+        self.assertEqual(await AttentionMarket.objects.acount(), 1)
+        job = await MarketCreationJob.objects.aget(slug="test")
+        self.assertEqual(job.attempts, 2)
+        # The retry resent for the mint of the failed attempt.
+        self.assertEqual(
+            str(Keypair.from_base58_string(job.mint_keypair).pubkey()), self.minted[0]
+        )
+
+
+async def create_jobs(count: int) -> List[MarketCreationJob]:
+    return [
+        await MarketCreationJob.objects.acreate(slug=f"job-{i}", image_url="")
+        for i in range(count)
+    ]
+
+
+class MintPoolTests(TestCase):
+    async def test_pool_is_refilled_below_the_low_water_mark(self):
+        minted = iter(range(100))
+
+        async def mint() -> str:
+            return f"Mint{next(minted)}"
+
+        with mock.patch("markets.mint_pool.create_and_mint_token", mint):
+            self.assertEqual(await fill_mint_pool(size=3, low_water=2), 3)
+            self.assertEqual(await fill_mint_pool(size=3, low_water=2), 0)
+
+    async def test_each_mint_is_claimed_once(self):
+        for address in ["Mint0", "Mint1"]:
+            await PooledMint.objects.acreate(address=address)
+        jobs = await create_jobs(3)
+
+        claimed = await asyncio.gather(*[claim_pooled_mint(job.id) for job in jobs])
+
+        self.assertEqual(claimed, ["Mint0", "Mint1", None])
+        self.assertEqual(
+            [
+                address
+                async for address in MarketCreationJob.objects.order_by(
+                    "id"
+                ).values_list("token_address", flat=True)
+            ],
+            claimed,
+        )
+        self.assertFalse(
+            await PooledMint.objects.filter(claimed_at__isnull=True).aexists()
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Row locks need Postgres")
+class MintPoolLockingTests(TransactionTestCase):
+    def test_claims_skip_mints_locked_by_another_claim(self):
+        for address in ["Mint0", "Mint1"]:
+            PooledMint.objects.create(address=address)
+        (job,) = async_to_sync(create_jobs)(1)
+
+        with connection.cursor() as cursor:
+            # Fail rather than hang if the claim waits for the lock.
+            cursor.execute("SET lock_timeout = '5s'")
+
+        # A claim in flight on another connection holds the first mint.
+        other = connections.create_connection("default")
+        try:
+            with other.cursor() as cursor:
+                other.set_autocommit(False)
+                cursor.execute(
+                    "SELECT id FROM markets_pooledmint WHERE address = %s FOR UPDATE",
+                    ["Mint0"],
+                )
+                self.assertEqual(async_to_sync(claim_pooled_mint)(job.id), "Mint1")
+                other.rollback()
+        finally:
+            other.close()
+
+
+class PortfolioTests(TestCase):
+    def setUp(self):
+        self.owner = str(Keypair().pubkey())
+        self.rpc_request = mock.AsyncMock()
+        for patcher in [
+            mock.patch("markets.portfolio.portfolio_cache", TTLCache(ttl=60)),
+            mock.patch("markets.portfolio.rpc_request", self.rpc_request),
+            mock.patch(
+                "markets.portfolio.get_sol_balance", mock.AsyncMock(return_value=2.0)
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def token_account(self, pubkey: str, mint: str, amount: int) -> dict:
+        return {
+            "pubkey": pubkey,
+            "account": {
+                "data": {
+                    "parsed": {
+                        "info": {
+                            "mint": mint,
+                            "tokenAmount": {"amount": str(amount), "decimals": 6},
+                        }
+                    }
+                }
+            },
+        }
+
+    async def test_holdings_are_summed_per_mint_and_valued_at_the_last_trade(self):
+        market = await create_market()
+        other = await AttentionMarket.objects.acreate(
+            slug="other", address="Other" + "4" * 39, image_url=""
+        )
+        for signature, timestamp, sol_amount in [
+            ("old", 1_700_000_000, 1.0),
+            ("new", 1_700_000_010, 0.5),
+        ]:
+            await TokenTrade.objects.acreate(
+                market=market,
+                signature=signature,
+                type="buy",
+                sol_amount=sol_amount,
+                token=MINT,
+                token_amount=10,
+                timestamp=timestamp,
+                signer=SIGNER,
+            )
+        self.rpc_request.return_value = {
+            "result": {
+                "value": [
+                    self.token_account("small", MINT, 10**6),
+                    self.token_account("large", MINT, 3 * 10**6),
+                    self.token_account("empty", other.address, 0),
+                    self.token_account("unlisted", "Unlisted" + "5" * 36, 10**6),
+                ]
+            }
+        }
+
+        async with api_client() as client:
+            url = f"/users/{self.owner}/portfolio"
+            response = await client.get(url)
+            self.assertEqual(response.status_code, 200)
+            portfolio = response.json()
+            self.assertEqual(portfolio["sol_balance"], 2.0)
+            self.assertEqual(
+                [
+                    (holding["slug"], holding["token_account"], holding["balance"])
+                    for holding in portfolio["holdings"]
+                ],
+                [("test", "large", 4.0)],
+            )
+            self.assertEqual(portfolio["holdings"][0]["price"], 0.05)
+            self.assertAlmostEqual(portfolio["total_value_sol"], 0.2)
+
+            # Served from the cache.
+            self.assertEqual((await client.get(url)).json(), portfolio)
+            self.assertEqual(self.rpc_request.await_count, 1)
+
+            response = await client.get("/users/invalid/portfolio")
+            self.assertEqual(response.status_code, 400)
@@ -1,8 +1,15 @@
+import time
+
+from markets.constants import SOL_DECIMALS
 from markets.typing import TokenTrade
-from markets.rpc import get_all_signatures, get_transactions
-from typing import Dict, Any, Optional, List
+from markets.rpc import iter_transaction_batches
+from tools.metrics import record_classification
+from tools.singleflight import coalesce
+from tools.tracing import span
+from typing import AsyncIterator, Dict, Any, Optional, List
 
 
+@coalesce()
 async def get_sol_token_trades(token_address: str) -> List[TokenTrade]:
     """
     Gets the history of SOL/token trades for a specific token.
@@ -13,16 +20,25 @@ async def get_sol_token_trades(token_address: str) -> List[TokenTrade]:
     Returns:
         List of trade details objects
     """
-    signatures = await get_all_signatures(token_address)
-    transactions = await get_transactions(signatures)
+    return [trade async for trade in iter_sol_token_trades(token_address)]
 
-    sol_trades = []
-    for tx in transactions:
-        trade_info = is_sol_token_trade(tx)
-        if trade_info:
-            sol_trades.append(trade_info)
 
-    return sol_trades
+async def iter_sol_token_trades(
+    token_address: str, *, until: Optional[str] = None
+) -> AsyncIterator[TokenTrade]:
+    """
+    Streams SOL/token trades for a specific token, newest first.
+
+    Args:
+        token_address: Address of the token
+        until: Stop at this signature, exclusive
+
+    Yields:
+        Trade details objects, as their transactions are fetched
+    """
+    async for _, transactions in iter_transaction_batches(token_address, until=until):
+        for trade_info in get_sol_token_trades_from_transactions(transactions):
+            yield trade_info
 
 
 def is_sol_token_trade(transaction: Dict[str, Any]) -> Optional[TokenTrade]:
@@ -36,117 +52,135 @@ def is_sol_token_trade(transaction: Dict[str, Any]) -> Optional[TokenTrade]:
     Returns:
         Dictionary with trade details if it's a SOL trade, None otherwise
     """
-    # Basic validation
-    if not transaction or "meta" not in transaction or "transaction" not in transaction:
-        return None
-
-    meta = transaction["meta"]
-    tx_message = transaction["transaction"]["message"]
-
-    # Get signers (first account in accountKeys is usually the signer/fee payer)
-    account_keys = tx_message.get("accountKeys", [])
-    if not account_keys:
-        return None
-
-    # Find the signer account
-    signers = [acc for acc in account_keys if acc.get("signer")]
-    if not signers:
-        return None
-
-    signer = signers[0]["pubkey"]
-    signer_index = next(
-        (i for i, acc in enumerate(account_keys) if acc.get("pubkey") == signer), None
-    )
-    if signer_index is None:
-        return None
-
-    # Get SOL balances before and after
-    pre_sol_balance = (
-        meta.get("preBalances", [])[signer_index]
-        if signer_index < len(meta.get("preBalances", []))
-        else 0
-    )
-    post_sol_balance = (
-        meta.get("postBalances", [])[signer_index]
-        if signer_index < len(meta.get("postBalances", []))
-        else 0
-    )
-    sol_change = (post_sol_balance - pre_sol_balance) / 10**9  # Convert lamports to SOL
-
-    # Get token balances before and after
-    pre_token_balances = meta.get("preTokenBalances", [])
-    post_token_balances = meta.get("postTokenBalances", [])
-
-    # Find tokens owned by the signer
-    signer_pre_tokens = {
-        balance["mint"]: float(balance["uiTokenAmount"]["amount"])
-        / 10 ** balance["uiTokenAmount"]["decimals"]
-        for balance in pre_token_balances
-        if balance.get("owner") == signer
-    }
-
-    signer_post_tokens = {
-        balance["mint"]: float(balance["uiTokenAmount"]["amount"])
-        / 10 ** balance["uiTokenAmount"]["decimals"]
-        for balance in post_token_balances
-        if balance.get("owner") == signer
-    }
-
-    # Calculate token changes
-    token_changes = {}
-    all_tokens = set(list(signer_pre_tokens.keys()) + list(signer_post_tokens.keys()))
-
-    for token in all_tokens:
-        pre_amount = signer_pre_tokens.get(token, 0)
-        post_amount = signer_post_tokens.get(token, 0)
-        change = post_amount - pre_amount
-        if change != 0:
-            token_changes[token] = change
-
-    # Transaction fee always reduces SOL balance, so we need to account for it
-    transaction_fee = meta.get("fee", 0) / 10**9
-    adjusted_sol_change = sol_change + transaction_fee
-
-    # Determine if this is a buy or sell with SOL
-    if adjusted_sol_change < 0 and any(change > 0 for change in token_changes.values()):
-        # SOL decreased, token increased = BUY
-        traded_token = next(
-            (token for token, change in token_changes.items() if change > 0), None
+    return classify_sol_token_trades([transaction])[0]
+
+
+LAMPORTS_PER_SOL = 10**SOL_DECIMALS
+
+# 10 ** decimals for every decimals value seen, tokens use a handful.
+_token_scales: Dict[int, int] = {}
+
+
+def get_sol_token_trades_from_transactions(
+    transactions: List[Dict[str, Any]],
+) -> List[TokenTrade]:
+    start = time.perf_counter()
+    with span("classify", transactions=len(transactions)):
+        trades = [trade for trade in classify_sol_token_trades(transactions) if trade]
+    record_classification(len(transactions), len(trades), time.perf_counter() - start)
+
+    return trades
+
+
+def classify_sol_token_trades(
+    transactions: List[Dict[str, Any]],
+) -> List[Optional[TokenTrade]]:
+    """
+    Classifies a batch of transactions, see `is_sol_token_trade`.
+
+    This is still a loop over the transactions in Python, most of its time
+    goes to walking the nested JSON. It saves the per-transaction work that
+    doesn't change the result: token balances are only read for signers
+    whose fee adjusted SOL balance moved, and only the signer's balances.
+    Results match the per-transaction classifier it replaced, kept in
+    `benchmarks.token_trades` as the reference.
+
+    Args:
+        transactions: Transaction objects from the Solana blockchain
+
+    Returns:
+        Trade details or None, for each transaction
+    """
+    trades: List[Optional[TokenTrade]] = [None] * len(transactions)
+    for i, transaction in enumerate(transactions):
+        if (
+            not transaction
+            or "meta" not in transaction
+            or "transaction" not in transaction
+        ):
+            continue
+
+        # The fee payer is the first signer.
+        account_keys = transaction["transaction"]["message"].get("accountKeys", [])
+        for signer_index, account in enumerate(account_keys):
+            if account.get("signer"):
+                break
+        else:
+            continue
+
+        meta = transaction["meta"]
+        pre_balances = meta.get("preBalances", [])
+        post_balances = meta.get("postBalances", [])
+        pre_lamports = (
+            pre_balances[signer_index] if signer_index < len(pre_balances) else 0
         )
-        return TokenTrade(
-            type="buy",
-            sol_amount=abs(adjusted_sol_change),
-            token=traded_token,
-            token_amount=token_changes.get(traded_token, 0) if traded_token else 0,
-            timestamp=transaction.get("blockTime"),
-            signature=(
-                transaction["transaction"]["signatures"][0]
-                if transaction["transaction"].get("signatures")
-                else None
-            ),
-            signer=signer,
+        post_lamports = (
+            post_balances[signer_index] if signer_index < len(post_balances) else 0
+        )
+
+        # SOL change of the signer, net of the transaction fee.
+        adjusted_sol_change = (
+            post_lamports - pre_lamports
+        ) / LAMPORTS_PER_SOL + meta.get("fee", 0) / LAMPORTS_PER_SOL
+        if adjusted_sol_change == 0:
+            continue
+
+        signer = account_keys[signer_index]["pubkey"]
+        signer_pre_tokens = _get_owner_token_amounts(
+            meta.get("preTokenBalances", []), signer
         )
-    elif adjusted_sol_change > 0 and any(
-        change < 0 for change in token_changes.values()
-    ):
-        # SOL increased, token decreased = SELL
-        traded_token = next(
-            (token for token, change in token_changes.items() if change < 0), None
+        signer_post_tokens = _get_owner_token_amounts(
+            meta.get("postTokenBalances", []), signer
         )
-        return TokenTrade(
-            type="sell",
-            sol_amount=adjusted_sol_change,
+
+        # Same iteration order as the replaced classifier, to pick the same
+        # token.
+        traded_token = None
+        token_change = 0
+        for token in set(
+            list(signer_pre_tokens.keys()) + list(signer_post_tokens.keys())
+        ):
+            change = signer_post_tokens.get(token, 0) - signer_pre_tokens.get(token, 0)
+            if change == 0:
+                continue
+            if (adjusted_sol_change < 0 and change > 0) or (
+                adjusted_sol_change > 0 and change < 0
+            ):
+                traded_token = token
+                token_change = change
+                break
+
+        if traded_token is None:
+            continue
+
+        signatures = transaction["transaction"].get("signatures")
+        trades[i] = TokenTrade(
+            type="buy" if adjusted_sol_change < 0 else "sell",
+            sol_amount=abs(adjusted_sol_change),
             token=traded_token,
-            token_amount=(
-                abs(token_changes.get(traded_token, 0)) if traded_token else 0
-            ),
+            token_amount=abs(token_change),
             timestamp=transaction.get("blockTime"),
-            signature=(
-                transaction["transaction"]["signatures"][0]
-                if transaction["transaction"].get("signatures")
-                else None
-            ),
+            signature=signatures[0] if signatures else None,
             signer=signer,
         )
 
-    return None
+    return trades
+
+
+def _get_owner_token_amounts(
+    token_balances: List[Dict[str, Any]], owner: str
+) -> Dict[str, float]:
+    amounts = {}
+    for balance in token_balances:
+        if balance.get("owner") != owner:
+            continue
+
+        ui_token_amount = balance["uiTokenAmount"]
+        decimals = ui_token_amount["decimals"]
+        scale = _token_scales.get(decimals)
+        if scale is None:
+            scale = _token_scales[decimals] = 10**decimals
+
+        amounts[balance["mint"]] = float(ui_token_amount["amount"]) / scale
+
+    return amounts
@@ -0,0 +1,149 @@
+import os
+import json
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel announcing newly stored trades to every API worker.
+TRADE_CHANNEL = "market_trades"
+TRADE_CHANNEL_RECONNECT_DELAY = float(os.getenv("TRADE_CHANNEL_RECONNECT_DELAY", 1))
+TRADE_CHANNEL_MAX_RECONNECT_DELAY = float(
+    os.getenv("TRADE_CHANNEL_MAX_RECONNECT_DELAY", 30)
+)
+
+
+def trade_channel_enabled() -> bool:
+    """Trades are announced through Postgres, other databases stay in process."""
+    return connection.vendor == "postgresql"
+
+
+def notify_trades(market_id: int, first_id: int, last_id: int):
+    """
+    Announces the trades of a market stored with ids in the given range.
+
+    Must run in the transaction storing them, Postgres delivers the
+    notification once it commits and drops it on a rollback.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_notify(%s, %s)",
+            [
+                TRADE_CHANNEL,
+                json.dumps(
+                    {"market_id": market_id, "first_id": first_id, "last_id": last_id}
+                ),
+            ],
+        )
+
+
+class TradeChannelListener:
+    """
+    Listens to trade announcements of every process and hands them to
+    `publish`, so that trade stream subscribers get trades whichever
+    process ingested them.
+
+    Notifications are handled one at a time, in commit order. The listener
+    holds its own database connection, trades announced while it is
+    reconnecting are not published.
+    """
+
+    def __init__(self, publish: Callable[[int, int, int], Awaitable]):
+        self.publish = publish
+
+        self._stop: Optional[asyncio.Event] = None
+        self._counters = defaultdict(int)
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def stats(self) -> Dict:
+        return dict(self._counters)
+
+    async def run(self):
+        if not trade_channel_enabled():
+            return
+
+        # Created here, the listener is module wide but runs on the loop of
+        # each server lifespan.
+        self._stop = asyncio.Event()
+        logger.info("Trade channel listener started")
+        delay = TRADE_CHANNEL_RECONNECT_DELAY
+        while not self._stop.is_set():
+            try:
+                conn = await self._connect()
+            except Exception as e:
+                logger.warning("Failed to listen to the trade channel: %s", e)
+            else:
+                delay = TRADE_CHANNEL_RECONNECT_DELAY
+                try:
+                    await self._listen(conn)
+                except Exception as e:
+                    logger.warning("Trade channel connection lost: %s", e)
+                    self._counters["disconnects"] += 1
+                finally:
+                    conn.close()
+
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, TRADE_CHANNEL_MAX_RECONNECT_DELAY)
+
+        logger.info("Trade channel listener stopped")
+
+    @sync_to_async(thread_sensitive=False)
+    def _connect(self):
+        # A connection of its own, outside of Django's per-thread ones.
+        db = connections.create_connection("default")
+        conn = db.get_new_connection(db.get_connection_params())
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {TRADE_CHANNEL}")
+
+        return conn
+
+    async def _listen(self, conn):
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        fd = conn.fileno()
+        loop.add_reader(fd, readable.set)
+        try:
+            stopping = asyncio.ensure_future(self._stop.wait())
+            try:
+                while not self._stop.is_set():
+                    waiting = asyncio.ensure_future(readable.wait())
+                    await asyncio.wait(
+                        [waiting, stopping], return_when=asyncio.FIRST_COMPLETED
+                    )
+                    waiting.cancel()
+                    readable.clear()
+
+                    # Reads what arrived without blocking, raises once the
+                    # server closed the connection.
+                    conn.poll()
+                    while conn.notifies:
+                        await self._handle(conn.notifies.pop(0).payload)
+            finally:
+                stopping.cancel()
+        finally:
+            loop.remove_reader(fd)
+
+    async def _handle(self, payload: str):
+        self._counters["notifications"] += 1
+        try:
+            announcement = json.loads(payload)
+            await self.publish(
+                announcement["market_id"],
+                announcement["first_id"],
+                announcement["last_id"],
+            )
+        except Exception:
+            logger.exception("Failed to publish announced trades %s", payload)
+            self._counters["failed"] += 1
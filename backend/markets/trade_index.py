@@ -0,0 +1,275 @@
+import os
+import logging
+from datetime import timedelta
+from typing import AsyncIterator, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from markets.broadcast import trade_broadcast_hub
+from markets.candles import update_candles
+from markets.models import AttentionMarket, MarketTradeCursor, TokenTrade
+from markets.rpc import RpcException, TransactionFetchError, iter_transaction_batches
+from markets.token_trades import get_sol_token_trades_from_transactions
+from markets.trade_channel import (
+    TradeChannelListener,
+    notify_trades,
+    trade_channel_enabled,
+)
+from markets.typing import TokenTrade as TokenTradeData
+from tools.singleflight import coalesce
+
+logger = logging.getLogger(__name__)
+
+# A market read within this many seconds of its last sync is served as is.
+TRADE_SYNC_INTERVAL = float(os.getenv("TRADE_SYNC_INTERVAL", 5))
+# Disable when the `index_trades` daemon keeps markets synced.
+TRADE_SYNC_ON_READ = os.getenv("TRADE_SYNC_ON_READ", "true").lower() == "true"
+# Runs trade ingestion in the API worker, "poll" or "ws" like `index_trades`.
+# Empty leaves ingestion to the `index_trades` daemon.
+TRADE_INGEST_IN_API = os.getenv("TRADE_INGEST_IN_API", "")
+
+# Rows fetched at a time when streaming a market's trades.
+TRADE_STREAM_CHUNK_SIZE = 1000
+
+TRADE_FIELDS = [
+    "type",
+    "sol_amount",
+    "token",
+    "token_amount",
+    "timestamp",
+    "signature",
+    "signer",
+]
+
+
+# Readers of a trending market wait on one sync instead of each walking the
+# chain from the same cursor.
+@coalesce(key=lambda market: market.id)
+async def sync_market_trades(market: AttentionMarket) -> List[TokenTrade]:
+    """
+    Ingests trades newer than the market's cursor.
+
+    The cursor only moves once every transaction of the walk was fetched.
+    On a failed page or transaction, the trades fetched are stored and the
+    cursor stays put, so the next sync walks the same range again.
+
+    Args:
+        market: Market to sync
+
+    Returns:
+        Newly stored trades
+    """
+    cursor, _ = await MarketTradeCursor.objects.aget_or_create(market=market)
+
+    trades = []
+    newest_signature = None
+    try:
+        async for signatures, transactions in iter_transaction_batches(
+            market.address, until=cursor.last_signature
+        ):
+            newest_signature = newest_signature or signatures[0]
+            trades.extend(get_sol_token_trades_from_transactions(transactions))
+    except RpcException as e:
+        if isinstance(e, TransactionFetchError):
+            trades.extend(get_sol_token_trades_from_transactions(e.transactions))
+        logger.error("Failed to sync trades for market %s: %s", market.id, e)
+        newest_signature = None
+
+    return await store_market_trades(
+        market.id,
+        trades,
+        since_signature=cursor.last_signature,
+        newest_signature=newest_signature or cursor.last_signature,
+    )
+
+
+async def sync_market_trades_if_stale(market: AttentionMarket) -> List[TokenTrade]:
+    if not TRADE_SYNC_ON_READ:
+        return []
+
+    cursor = await MarketTradeCursor.objects.filter(market=market).afirst()
+    if (
+        cursor is not None
+        and cursor.synced_at is not None
+        and timezone.now() - cursor.synced_at < timedelta(seconds=TRADE_SYNC_INTERVAL)
+    ):
+        return []
+
+    return await sync_market_trades(market)
+
+
+async def store_market_trades(
+    market_id: int,
+    trades: List[TokenTradeData],
+    *,
+    since_signature: Optional[str],
+    newest_signature: Optional[str],
+) -> List[TokenTrade]:
+    """
+    Stores trades and publishes the new ones to the market's subscribers.
+
+    On Postgres the trades are announced to the trade channel, and every API
+    worker publishes them to its own subscribers. Otherwise only this
+    process's subscribers get them.
+
+    Returns:
+        Newly stored trades, oldest first
+    """
+    new_trades = await _store_market_trades(
+        market_id,
+        trades,
+        since_signature=since_signature,
+        newest_signature=newest_signature,
+    )
+
+    # Published once committed, from the event loop the hub runs on.
+    if (
+        new_trades
+        and not trade_channel_enabled()
+        and trade_broadcast_hub.has_subscribers(market_id)
+    ):
+        trade_broadcast_hub.publish(
+            market_id,
+            [
+                {field: getattr(trade, field) for field in TRADE_FIELDS}
+                for trade in new_trades
+            ],
+        )
+
+    return new_trades
+
+
+async def publish_stored_trades(market_id: int, first_id: int, last_id: int):
+    """Publishes trades announced to the trade channel to their subscribers."""
+    if not trade_broadcast_hub.has_subscribers(market_id):
+        return
+
+    trades = [
+        values
+        async for values in TokenTrade.objects.filter(
+            market_id=market_id, id__gte=first_id, id__lte=last_id
+        )
+        .order_by("id")
+        .values(*TRADE_FIELDS)
+    ]
+    trade_broadcast_hub.publish(market_id, trades)
+
+
+@sync_to_async
+def _store_market_trades(
+    market_id: int,
+    trades: List[TokenTradeData],
+    *,
+    since_signature: Optional[str],
+    newest_signature: Optional[str],
+) -> List[TokenTrade]:
+    """
+    Stores trades, folds them into the market's candles and advances the
+    market cursor in one transaction.
+
+    Trades come newest first from the chain, they are inserted oldest first
+    so that ids follow chain order within a block time. The cursor is only
+    moved if no concurrent sync moved it since `since_signature` was read.
+    """
+    with transaction.atomic():
+        cursor = MarketTradeCursor.objects.select_for_update().get(market_id=market_id)
+
+        existing = set(
+            TokenTrade.objects.filter(
+                market_id=market_id,
+                signature__in=[trade.signature for trade in trades],
+            ).values_list("signature", flat=True)
+        )
+
+        new_trades = []
+        for trade in reversed(trades):
+            if trade.signature in existing:
+                continue
+
+            existing.add(trade.signature)
+            new_trades.append(TokenTrade(market_id=market_id, **trade.model_dump()))
+
+        TokenTrade.objects.bulk_create(new_trades, ignore_conflicts=True)
+        if new_trades:
+            # Candles order trades by id, which ignore_conflicts leaves unset.
+            new_trades = list(
+                TokenTrade.objects.filter(
+                    market_id=market_id,
+                    signature__in=[trade.signature for trade in new_trades],
+                ).order_by("id")
+            )
+            update_candles(market_id, new_trades)
+
+            # Stores of a market are serialized by the cursor lock, so no
+            # other trade of the market falls within this batch's ids.
+            if trade_channel_enabled():
+                notify_trades(market_id, new_trades[0].id, new_trades[-1].id)
+
+        if cursor.last_signature == since_signature:
+            cursor.last_signature = newest_signature
+        cursor.synced_at = timezone.now()
+        cursor.save()
+
+    return new_trades
+
+
+def get_market_trades_queryset(market: AttentionMarket):
+    return TokenTrade.objects.filter(market=market).order_by("-timestamp", "-id")
+
+
+async def get_trades_before(market: AttentionMarket, before: Optional[str] = None):
+    """
+    Returns the market's trades older than the trade with signature `before`.
+
+    Trades are keyset paginated on (timestamp, id), newest first. Raises
+    `TokenTrade.DoesNotExist` for an unknown `before` signature.
+    """
+    trades = get_market_trades_queryset(market)
+    if before is None:
+        return trades
+
+    anchor = await TokenTrade.objects.aget(market=market, signature=before)
+    return trades.filter(
+        Q(timestamp__lt=anchor.timestamp)
+        | Q(timestamp=anchor.timestamp, id__lt=anchor.id)
+    )
+
+
+async def get_market_trades(
+    market: AttentionMarket,
+    *,
+    before: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> List[TokenTradeData]:
+    """Returns the stored trades of a market, newest first."""
+    trades = (await get_trades_before(market, before)).values(*TRADE_FIELDS)
+    if limit is not None:
+        trades = trades[:limit]
+
+    return [TokenTradeData(**values) async for values in trades]
+
+
+async def iter_market_trades(
+    market: AttentionMarket,
+    *,
+    before: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> AsyncIterator[dict]:
+    """
+    Streams the stored trades of a market as dicts, newest first.
+
+    Rows are read in chunks of `TRADE_STREAM_CHUNK_SIZE`, so the first ones
+    are sent without waiting for the rest of the history.
+    """
+    trades = (await get_trades_before(market, before)).values(*TRADE_FIELDS)
+    if limit is not None:
+        trades = trades[:limit]
+
+    async for values in trades.aiterator(chunk_size=TRADE_STREAM_CHUNK_SIZE):
+        yield values
+
+
+trade_channel_listener = TradeChannelListener(publish_stored_trades)
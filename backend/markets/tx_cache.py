@@ -0,0 +1,111 @@
+import os
+import zlib
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List
+
+from django.utils import timezone
+
+from markets.models import CachedTransaction
+
+logger = logging.getLogger(__name__)
+
+TX_CACHE_ENABLED = os.getenv("TX_CACHE_ENABLED", "true").lower() == "true"
+TX_CACHE_MAX_ENTRIES = int(os.getenv("TX_CACHE_MAX_ENTRIES", 500_000))
+# Eviction needs a count query, so it only runs every this many inserts.
+TX_CACHE_EVICT_EVERY = int(os.getenv("TX_CACHE_EVICT_EVERY", 1_000))
+# Hits refresh the LRU position at most this often to avoid write churn.
+TX_CACHE_TOUCH_INTERVAL = timedelta(minutes=10)
+
+
+class TransactionCache:
+    """
+    Signature keyed, compressed LRU cache of raw `getTransaction` results.
+
+    Only finalized transactions may be stored, those never change. Entries
+    live in Postgres so the cache is shared by all workers and survives
+    restarts. Results are stored and returned as the JSON bytes the RPC
+    sent, readers decode the fields they need.
+    """
+
+    def __init__(self, max_entries: int = TX_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._counters = defaultdict(int)
+        self._inserts_since_eviction = TX_CACHE_EVICT_EVERY
+
+    async def get_many(self, signatures: List[str]) -> Dict[str, bytes]:
+        if not signatures:
+            return {}
+
+        found = {}
+        stale_signatures = []
+        touch_before = timezone.now() - TX_CACHE_TOUCH_INTERVAL
+        async for signature, data, accessed_at in CachedTransaction.objects.filter(
+            signature__in=signatures
+        ).values_list("signature", "data", "accessed_at"):
+            found[signature] = zlib.decompress(data)
+            if accessed_at < touch_before:
+                stale_signatures.append(signature)
+
+        if stale_signatures:
+            await CachedTransaction.objects.filter(
+                signature__in=stale_signatures
+            ).aupdate(accessed_at=timezone.now())
+
+        self._counters["hits"] += len(found)
+        self._counters["misses"] += len(set(signatures)) - len(found)
+
+        return found
+
+    async def set_many(self, transactions: Dict[str, bytes]):
+        if not transactions:
+            return
+
+        now = timezone.now()
+        entries = [
+            CachedTransaction(
+                signature=signature,
+                data=zlib.compress(transaction),
+                accessed_at=now,
+            )
+            for signature, transaction in transactions.items()
+        ]
+        await CachedTransaction.objects.abulk_create(entries, ignore_conflicts=True)
+
+        self._counters["stores"] += len(entries)
+        self._inserts_since_eviction += len(entries)
+        if self._inserts_since_eviction >= TX_CACHE_EVICT_EVERY:
+            self._inserts_since_eviction = 0
+            await self.evict()
+
+    async def evict(self):
+        excess = await CachedTransaction.objects.acount() - self.max_entries
+        if excess <= 0:
+            return
+
+        oldest_ids = [
+            pk
+            async for pk in CachedTransaction.objects.order_by(
+                "accessed_at"
+            ).values_list("pk", flat=True)[:excess]
+        ]
+        await CachedTransaction.objects.filter(pk__in=oldest_ids).adelete()
+
+        self._counters["evictions"] += len(oldest_ids)
+        logger.info("Evicted %s cached transactions", len(oldest_ids))
+
+    def stats(self) -> Dict:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "enabled": TX_CACHE_ENABLED,
+            "max_entries": self.max_entries,
+            "hits": self._counters["hits"],
+            "misses": self._counters["misses"],
+            "hit_ratio": self._counters["hits"] / lookups if lookups else None,
+            "stores": self._counters["stores"],
+            "evictions": self._counters["evictions"],
+        }
+
+
+transaction_cache = TransactionCache()
@@ -14,6 +14,14 @@ class CreateAttentionMarketResponse(BaseModel):
     address: str
 
 
+class MarketCreationJobResponse(BaseModel):
+    id: int
+    slug: str
+    status: Literal["pending", "running", "succeeded", "failed"]
+    error: Optional[str]
+    market: Optional[CreateAttentionMarketResponse]
+
+
 class TokenTrade(BaseModel):
     type: Literal["buy", "sell"]
     sol_amount: float
@@ -22,3 +30,49 @@ class TokenTrade(BaseModel):
     timestamp: int
     signature: str
     signer: str
+
+
+class Candle(BaseModel):
+    bucket_start: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume_sol: float
+    volume_token: float
+    trade_count: int
+
+
+class Holder(BaseModel):
+    token_account: str
+    owner: Optional[str]
+    amount: float
+
+
+class MarketStats(BaseModel):
+    last_price: Optional[float]
+    last_trade_at: Optional[int]
+    volume_sol_24h: float
+    volume_token_24h: float
+    trade_count_24h: int
+    trade_count: int
+    unique_traders: int
+    top_holders: Optional[List[Holder]]
+
+
+class Holding(BaseModel):
+    market_id: int
+    slug: str
+    image_url: Optional[str]
+    token: str
+    token_account: str
+    balance: float
+    price: Optional[float]
+    value_sol: float
+
+
+class Portfolio(BaseModel):
+    owner: str
+    sol_balance: Optional[float]
+    total_value_sol: float
+    holdings: List[Holding]
@@ -1,35 +1,112 @@
 import logging
-from typing import List
+import msgspec
+from typing import AsyncIterator, List, Literal, Optional
 
-from markets.models import AttentionMarket
-from markets.token_trades import get_sol_token_trades
-from markets.api import (
-    create_attention_market as create_attention_market_api,
-    get_attention_markets as get_attention_markets_api,
+from markets.broadcast import serve_trade_stream, trade_broadcast_hub
+from markets.candles import get_candles
+from markets.jobs import market_creation_executor
+from markets.models import (
+    AttentionMarket,
+    MarketCreationJob,
+    TokenTrade as TokenTradeModel,
+)
+from markets.trade_index import (
+    iter_market_trades,
+    sync_market_trades_if_stale,
+    trade_channel_listener,
 )
 from markets.typing import (
+    Candle,
     CreateAttentionMarketRequest,
     CreateAttentionMarketResponse,
+    MarketCreationJobResponse,
+    MarketStats,
+    Portfolio,
     TokenTrade,
 )
-from fastapi import APIRouter, Request, FastAPI, HTTPException
+from markets.listing_cache import market_listing_cache
+from markets.portfolio import get_portfolio
+from markets.rpc import RpcException
+from markets.rpc_pool import rpc_pool
+from markets.stats import get_market_stats
+from markets.tx_cache import transaction_cache
+from tools.http import get_http_pool_stats
+from tools.responses import (
+    MsgspecJSONResponse,
+    get_validator_headers,
+    is_not_modified,
+    not_modified_response,
+)
+from tools.singleflight import single_flight
+from tools.tracing import span, trace_exporter
+from fastapi import (
+    APIRouter,
+    Request,
+    FastAPI,
+    HTTPException,
+    Query,
+    WebSocket,
+    status,
+)
+from fastapi.responses import Response, StreamingResponse
 
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
 
+TRADES_MAX_PAGE_SIZE = 5000
 
-@router.post("/attention/")
+router = APIRouter(default_response_class=MsgspecJSONResponse)
+users_router = APIRouter(default_response_class=MsgspecJSONResponse)
+
+
+@router.post("/attention/", status_code=202)
 async def create_attention_market(
     request: CreateAttentionMarketRequest,
-) -> CreateAttentionMarketResponse:
-    market = await create_attention_market_api(request.slug, request.image_url)
-
-    return CreateAttentionMarketResponse(
-        id=market.id,
-        slug=market.slug,
-        image_url=market.image_url,
-        address=market.address,
+    response: Response,
+) -> MarketCreationJobResponse:
+    """
+    Starts creating a market and returns its job, poll it for completion.
+
+    The slug is the idempotency key, posting it again returns the same job
+    and retries it if it failed.
+    """
+    job = await market_creation_executor.submit(request.slug, request.image_url)
+    if job.status == MarketCreationJob.SUCCEEDED:
+        response.status_code = 200
+
+    return await get_job_response(job)
+
+
+@router.get("/attention/jobs/{job_id}")
+async def get_market_creation_job(job_id: int) -> MarketCreationJobResponse:
+    try:
+        job = await MarketCreationJob.objects.aget(id=job_id)
+    except MarketCreationJob.DoesNotExist:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    return await get_job_response(job)
+
+
+async def get_job_response(job: MarketCreationJob) -> MarketCreationJobResponse:
+    market = None
+    if job.market_id is not None:
+        market = await AttentionMarket.objects.aget(id=job.market_id)
+
+    return MarketCreationJobResponse(
+        id=job.id,
+        slug=job.slug,
+        status=job.status,
+        error=job.error,
+        market=(
+            CreateAttentionMarketResponse(
+                id=market.id,
+                slug=market.slug,
+                image_url=market.image_url,
+                address=market.address,
+            )
+            if market
+            else None
+        ),
     )
 
 
@@ -37,13 +114,160 @@ async def create_attention_market(
 async def get_attention_markets(
     request: Request,
 ) -> List[CreateAttentionMarketResponse]:
-    return await get_attention_markets_api()
+    """
+    All markets, served from the serialized listing cache.
+
+    Send the returned `ETag` as `If-None-Match` to get an empty 304 while
+    the listing is unchanged.
+    """
+    listing = await market_listing_cache.get()
+    headers = get_validator_headers(listing.etag, listing.last_modified)
+    if is_not_modified(request, listing.etag, listing.last_modified):
+        return not_modified_response(headers)
+
+    return Response(listing.body, media_type="application/json", headers=headers)
 
 
 @router.get("/attention/trades/{market_id}")
 async def get_attention_market_trades(
     market_id: int,
+    before: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=TRADES_MAX_PAGE_SIZE),
+    stream: bool = False,
 ) -> List[TokenTrade]:
-    market = await AttentionMarket.objects.aget(id=market_id)
-    trades = await get_sol_token_trades(market.address)
-    return trades
+    """
+    Trades of a market, newest first, all of them unless `limit` is given.
+
+    Pass the signature of the last trade received as `before` to get the
+    next page. With `stream`, trades are sent as NDJSON while they are read.
+    """
+    with span("db.market"):
+        market = await AttentionMarket.objects.aget(id=market_id)
+    if before is None:
+        try:
+            with span("trades.sync"):
+                await sync_market_trades_if_stale(market)
+        except Exception:
+            # Serve what is already indexed if the chain is unavailable.
+            logger.exception("Failed to sync trades for market %s", market_id)
+
+    try:
+        trades = iter_market_trades(market, before=before, limit=limit)
+        if stream:
+            # Fail on an unknown `before` before the response starts.
+            first_trade = await anext(trades, None)
+
+            return StreamingResponse(
+                iter_ndjson(first_trade, trades), media_type="application/x-ndjson"
+            )
+
+        # Rows are already valid trades, skip building and validating models.
+        with span("db.trades"):
+            rows = [trade async for trade in trades]
+
+        return MsgspecJSONResponse(rows)
+    except TokenTradeModel.DoesNotExist:
+        raise HTTPException(status_code=404, detail="Unknown trade signature")
+
+
+@router.websocket("/attention/ws")
+async def stream_attention_market_trades(websocket: WebSocket, markets: str = ""):
+    """
+    Pushes new trades of the subscribed markets as they are stored.
+
+    Subscribe with `?markets=1,2` and by sending
+    `{"action": "subscribe" | "unsubscribe", "markets": [1, 2]}`. Trades
+    arrive as `{"type": "trades", "market_id": 1, "trades": [...]}`, oldest
+    first. Clients that fall behind are disconnected with code 1013.
+    """
+    await websocket.accept()
+    try:
+        market_ids = [int(market_id) for market_id in markets.split(",") if market_id]
+    except ValueError:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await serve_trade_stream(websocket, trade_broadcast_hub, market_ids)
+
+
+async def iter_ndjson(first_trade: Optional[dict], trades: AsyncIterator[dict]):
+    if first_trade is None:
+        return
+
+    encoder = msgspec.json.Encoder()
+    yield encoder.encode(first_trade) + b"\n"
+    async for trade in trades:
+        yield encoder.encode(trade) + b"\n"
+
+
+@router.get("/attention/{market_id}/candles")
+async def get_attention_market_candles(
+    market_id: int,
+    interval: Literal["1m", "5m", "1h", "1d"] = "1m",
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    limit: int = Query(500, ge=1, le=5000),
+) -> List[Candle]:
+    """
+    OHLCV bars of a market, oldest first, prices in SOL per token.
+
+    `start` and `end` are unix times bounding the bucket starts, without
+    `start` the latest `limit` bars are returned.
+    """
+    try:
+        market = await AttentionMarket.objects.aget(id=market_id)
+    except AttentionMarket.DoesNotExist:
+        raise HTTPException(status_code=404, detail="Unknown market")
+
+    return MsgspecJSONResponse(
+        await get_candles(market, interval, start=start, end=end, limit=limit)
+    )
+
+
+@router.get("/attention/{market_id}/stats")
+async def get_attention_market_stats(market_id: int) -> MarketStats:
+    """
+    Summary of a market: last price in SOL per token, 24h volume, trade and
+    trader counts and top holders. Served from a short lived cache.
+    """
+    try:
+        market = await AttentionMarket.objects.aget(id=market_id)
+    except AttentionMarket.DoesNotExist:
+        raise HTTPException(status_code=404, detail="Unknown market")
+
+    return MsgspecJSONResponse(await get_market_stats(market))
+
+
+@users_router.get("/{pubkey}/portfolio")
+async def get_user_portfolio(pubkey: str) -> Portfolio:
+    """
+    Balances and SOL values of a wallet in every attention market, with the
+    value taken at each market's last trade price. Cached for a few seconds.
+    """
+    try:
+        portfolio = await get_portfolio(pubkey)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid wallet address")
+    except RpcException:
+        logger.exception("Failed to read the portfolio of %s", pubkey)
+        raise HTTPException(status_code=502, detail="RPC unavailable")
+
+    return MsgspecJSONResponse(portfolio)
+
+
+@router.get("/rpc/stats")
+async def get_rpc_stats() -> dict:
+    return get_component_stats()
+
+
+def get_component_stats() -> dict:
+    """Stats of the worker's pools and caches, also exported as metrics."""
+    return {
+        "http_pool": get_http_pool_stats(),
+        "rpc_pool": rpc_pool.stats(),
+        "tx_cache": transaction_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "trade_broadcast": trade_broadcast_hub.stats(),
+        "trade_channel": trade_channel_listener.stats(),
+        "trace_exporter": trace_exporter.stats(),
+    }
@@ -5,7 +5,9 @@ import logging
 import aiohttp
 from aiohttp import ClientTimeout
 import random
-from typing import List, Dict
+import asyncio
+import warnings
+from typing import Any, Callable, List, Dict, NamedTuple, Optional
 from collections import defaultdict
 
 from tenacity import (
@@ -15,6 +17,8 @@ from tenacity import (
     retry_if_exception_type,
 )
 
+from tools.metrics import HTTP_RATE_LIMITED, record_retry
+
 logger = logging.getLogger(__name__)
 
 HELIUS_API_KEY = os.getenv("HELIUS_API_KEY")
@@ -23,15 +27,196 @@ BASE_WAIT = 1
 MAX_WAIT = 60
 MAX_FAILURES = 3  # Maximum number of failures before a proxy is considered bad
 
+# Shared connection pool settings, one pool per worker process.
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 32))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+
+# How POST requests are sent: "live", or "record" to and "replay" from the
+# HTTP_CASSETTE file of JSON-RPC responses, see `tools.transport`.
+HTTP_TRANSPORT = os.getenv("HTTP_TRANSPORT", "live")
+HTTP_CASSETTE = os.getenv("HTTP_CASSETTE")
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+_pool_counters = defaultdict(int)
+_transport: Optional["HttpTransport"] = None
+
 
 class RateLimitException(Exception):
     pass
 
 
+class HttpStatusError(aiohttp.ClientError):
+    def __init__(self, url: str, status: int):
+        super().__init__(f"{status} response from {url}")
+        self.status = status
+
+
+class HttpResponse(NamedTuple):
+    status: int
+    body: bytes
+
+
+class HttpTransport:
+    """Sends POST requests over the shared session."""
+
+    async def post(
+        self, url: str, data: Any, *, headers: dict, params: dict
+    ) -> HttpResponse:
+        session = get_http_session()
+        async with session.post(
+            url, headers=headers, json=data, params=params
+        ) as response:
+            return HttpResponse(response.status, await response.read())
+
+
+def get_http_transport() -> HttpTransport:
+    global _transport
+
+    if _transport is None:
+        from tools.transport import create_http_transport
+
+        _transport = create_http_transport(HTTP_TRANSPORT, HTTP_CASSETTE)
+
+    return _transport
+
+
+def set_http_transport(transport: Optional[HttpTransport]):
+    """Replaces the transport of POST requests, None restores the default."""
+    global _transport
+
+    _transport = transport
+
+
+def _create_trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        _pool_counters["requests"] += 1
+
+    async def on_connection_create_end(session, ctx, params):
+        _pool_counters["connections_created"] += 1
+
+    async def on_connection_reuseconn(session, ctx, params):
+        _pool_counters["connections_reused"] += 1
+
+    async def on_connection_queued_start(session, ctx, params):
+        _pool_counters["connections_queued"] += 1
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_connection_queued_start.append(on_connection_queued_start)
+
+    return trace_config
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=300,
+    )
+
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        trace_configs=[_create_trace_config()],
+    )
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Returns the worker wide pooled session, creating it on first use.
+
+    The session is opened on app startup, but scripts and the django shell
+    get one lazily. A session is bound to the loop it was created on, so a
+    new one is made when called from a different loop, and the previous one
+    is closed.
+    """
+    global _session, _session_loop
+
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        if _session is not None and not _session.closed:
+            _close_stale_session(_session)
+        _session = _create_session()
+        _session_loop = loop
+
+    return _session
+
+
+def _close_stale_session(session: aiohttp.ClientSession):
+    """
+    Closes a session of a previous loop, which may be closed already, so
+    without awaiting on it.
+
+    The session is detached from its connector, then the connector closes
+    its connections, synchronously as of the pinned aiohttp 3.9.
+    """
+    connector = session.connector
+    session.detach()
+    if connector is not None:
+        with warnings.catch_warnings():
+            # The awaitable returned for compatibility does nothing.
+            warnings.simplefilter("ignore", DeprecationWarning)
+            connector.close()
+
+
+async def open_http_session() -> aiohttp.ClientSession:
+    return get_http_session()
+
+
+async def close_http_session():
+    global _session, _session_loop
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+    _session = None
+    _session_loop = None
+
+
+def get_http_pool_stats() -> Dict:
+    stats = {
+        "open": _session is not None and not _session.closed,
+        "limit": HTTP_POOL_LIMIT,
+        "limit_per_host": HTTP_POOL_LIMIT_PER_HOST,
+        "keepalive_timeout": HTTP_KEEPALIVE_TIMEOUT,
+        **_pool_counters,
+    }
+    if not stats["open"]:
+        return stats
+
+    # aiohttp has no public API for the pool usage, these are private
+    # attributes of its TCPConnector as of the pinned 3.9. Skipped rather
+    # than failing the stats if a release renames them.
+    connector = _session.connector
+    acquired = getattr(connector, "_acquired", None)
+    if acquired is not None:
+        stats["in_use"] = len(acquired)
+    acquired_per_host = getattr(connector, "_acquired_per_host", None)
+    if acquired_per_host is not None:
+        stats["in_use_per_host"] = {
+            f"{key.host}:{key.port}": len(protos)
+            for key, protos in acquired_per_host.items()
+        }
+    idle = getattr(connector, "_conns", None)
+    if idle is not None:
+        stats["idle"] = sum(len(conns) for conns in idle.values())
+
+    return stats
+
+
 @retry(
     stop=stop_after_attempt(MAX_RETRIES),
     wait=wait_exponential(multiplier=BASE_WAIT, max=MAX_WAIT),
     retry=retry_if_exception_type(RateLimitException),
+    before_sleep=record_retry,
     reraise=True,
 )
 async def req_get(
@@ -43,36 +228,40 @@ async def req_get(
     timeout: int = 5,
 ) -> Dict:
     timeout = ClientTimeout(total=timeout)
+    session = get_http_session()
 
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        if helius_auth:
-            params = {**params, "api-key": HELIUS_API_KEY}
+    if helius_auth:
+        params = {**params, "api-key": HELIUS_API_KEY}
 
-        while True:
-            try:
-                async with session.get(url, headers=headers, params=params) as response:
-                    if response.status == 429:  # Too Many Requests
-                        response_text = await response.text()
-                        logger.warning(
-                            f"Rate limit exceeded for {url} with response {response_text}"
-                        )
-                        raise RateLimitException("Rate limit exceeded")
+    while True:
+        try:
+            async with session.get(
+                url, headers=headers, params=params, timeout=timeout
+            ) as response:
+                if response.status == 429:  # Too Many Requests
+                    HTTP_RATE_LIMITED.inc()
+                    response_text = await response.text()
+                    logger.warning(
+                        f"Rate limit exceeded for {url} with response {response_text}"
+                    )
+                    raise RateLimitException("Rate limit exceeded")
 
-                    # Raise an error if the response is not ok
-                    response.raise_for_status()
+                # Raise an error if the response is not ok
+                response.raise_for_status()
 
-                    return await response.json()
-            except RateLimitException:
-                continue
-            except Exception as e:
-                logger.warning(f"Request failed: {str(e)}")
-                raise
+                return await response.json()
+        except RateLimitException:
+            continue
+        except Exception as e:
+            logger.warning(f"Request failed: {str(e)}")
+            raise
 
 
 @retry(
     stop=stop_after_attempt(MAX_RETRIES),
     wait=wait_exponential(multiplier=BASE_WAIT, max=MAX_WAIT),
     retry=retry_if_exception_type(RateLimitException),
+    before_sleep=record_retry,
     reraise=True,
 )
 async def req_post(
@@ -83,26 +272,48 @@ async def req_post(
     params: dict = {},
     helius_auth: bool = False,
 ):
-    async with aiohttp.ClientSession() as session:
-        if helius_auth:
-            params = {**params, "api-key": HELIUS_API_KEY}
-        async with session.post(
-            url, headers=headers, json=data, params=params
-        ) as response:
-            if response.status == 429:  # Too Many Requests
-                response_text = await response.text()
-                logger.warning(
-                    "Rate limit exceeded for %s with data %s with response %s",
-                    url,
-                    data,
-                    response_text,
-                )
-                raise RateLimitException("Rate limit exceeded")
+    return await req_post_once(
+        url, data, headers=headers, params=params, helius_auth=helius_auth
+    )
 
-            # Raise an error if the response is not ok
-            response.raise_for_status()
 
-            return await response.json()
+async def req_post_once(
+    url: str,
+    data: dict,
+    *,
+    headers: dict = {},
+    params: dict = {},
+    helius_auth: bool = False,
+    decode: Optional[Callable[[bytes], Any]] = None,
+):
+    """
+    Like `req_post`, but raises `RateLimitException` instead of retrying.
+
+    `decode` parses the raw response body in place of `response.json()`.
+    """
+    if helius_auth:
+        params = {**params, "api-key": HELIUS_API_KEY}
+    response = await get_http_transport().post(
+        url, data, headers=headers, params=params
+    )
+    if response.status == 429:  # Too Many Requests
+        HTTP_RATE_LIMITED.inc()
+        logger.warning(
+            "Rate limit exceeded for %s with data %s with response %s",
+            url,
+            data,
+            response.body.decode(errors="replace"),
+        )
+        raise RateLimitException("Rate limit exceeded")
+
+    # Raise an error if the response is not ok
+    if response.status >= 400:
+        raise HttpStatusError(url, response.status)
+
+    if decode is not None:
+        return decode(response.body)
+
+    return json.loads(response.body)
 
 
 async def req_put(
@@ -115,19 +326,19 @@ async def req_put(
     timeout: int = 5,
 ):
     timeout = ClientTimeout(total=timeout)
+    session = get_http_session()
 
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        if helius_auth:
-            params = {**params, "api-key": HELIUS_API_KEY}
+    if helius_auth:
+        params = {**params, "api-key": HELIUS_API_KEY}
 
-        try:
-            async with session.put(
-                url, headers=headers, json=data, params=params
-            ) as response:
-                # Raise an error if the response is not ok
-                response.raise_for_status()
+    try:
+        async with session.put(
+            url, headers=headers, json=data, params=params, timeout=timeout
+        ) as response:
+            # Raise an error if the response is not ok
+            response.raise_for_status()
 
-                return await response.json()
-        except Exception as e:
-            logger.warning(f"PUT request failed: {str(e)}")
-            raise
+            return await response.json()
+    except Exception as e:
+        logger.warning(f"PUT request failed: {str(e)}")
+        raise
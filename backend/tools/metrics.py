@@ -0,0 +1,230 @@
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Set to a writable directory shared by the workers of a multi-process
+# server, so each scrape aggregates every worker.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+RPC_REQUESTS = Counter(
+    "rpc_requests_total",
+    "JSON-RPC HTTP requests sent, by method and outcome.",
+    ["method", "batch", "outcome"],
+)
+RPC_REQUEST_DURATION = Histogram(
+    "rpc_request_duration_seconds",
+    "Latency of JSON-RPC HTTP requests, by method.",
+    ["method", "batch"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+RPC_BATCH_SIZE = Histogram(
+    "rpc_batch_size",
+    "Requests per JSON-RPC batch sent by batched_rpc_requests.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000),
+)
+RPC_BATCH_ITEM_RETRIES = Counter(
+    "rpc_batch_item_retries_total",
+    "Batch items resent after a missing response or a transient error.",
+)
+HTTP_RATE_LIMITED = Counter(
+    "http_rate_limited_total",
+    "429 responses to outgoing HTTP requests.",
+)
+HTTP_RETRIES = Counter(
+    "http_retries_total",
+    "Retries scheduled by the retrying HTTP and RPC wrappers.",
+    ["function"],
+)
+TRANSACTIONS_CLASSIFIED = Counter(
+    "transactions_classified_total",
+    "Transactions classified as SOL/token trades or not.",
+)
+TRADES_CLASSIFIED = Counter(
+    "trades_classified_total",
+    "SOL/token trades found by the classifier.",
+)
+CLASSIFICATION_SECONDS = Counter(
+    "classification_seconds_total",
+    "Time spent classifying transactions.",
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Latency of ORM queries, by statement.",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Latency of API requests, by route.",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_RESPONSES = Counter(
+    "http_responses_total",
+    "API responses, by route and status.",
+    ["method", "route", "status"],
+)
+
+DB_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+_METRIC_NAME_PART = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+_stats_collectors: List["StatsCollector"] = []
+
+
+def get_rpc_method(request_body) -> str:
+    """The method of a request, or of a batch if all its requests share it."""
+    if not isinstance(request_body, list):
+        return request_body.get("method", "unknown")
+
+    methods = {request.get("method") for request in request_body}
+    return methods.pop() if len(methods) == 1 else "mixed"
+
+
+def record_retry(retry_state):
+    """`before_sleep` hook of tenacity retries."""
+    HTTP_RETRIES.labels(retry_state.fn.__name__).inc()
+
+
+def record_classification(transactions: int, trades: int, seconds: float):
+    TRANSACTIONS_CLASSIFIED.inc(transactions)
+    TRADES_CLASSIFIED.inc(trades)
+    CLASSIFICATION_SECONDS.inc(seconds)
+
+
+def time_db_query(execute, sql, params, many, context):
+    """Django execute wrapper observing the latency of each query."""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        operation = sql[:6].upper()
+        DB_QUERY_DURATION.labels(
+            operation if operation in DB_OPERATIONS else "OTHER"
+        ).observe(time.perf_counter() - start)
+
+
+def install_db_query_timer(sender, connection, **kwargs):
+    """`connection_created` receiver, every thread opens its own connection."""
+    if time_db_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_db_query)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing the latency of HTTP requests.
+
+    Requests are labeled with the path template of their route, so the
+    series don't grow with path parameters.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Set on the scope by the router once a route matched.
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "other"
+            HTTP_REQUEST_DURATION.labels(scope["method"], path).observe(
+                time.perf_counter() - start
+            )
+            HTTP_RESPONSES.labels(scope["method"], path, str(status)).inc()
+
+
+class StatsCollector:
+    """
+    Exposes the numbers of component `stats()` dicts as gauges, read at
+    scrape time so the components keep their plain counters.
+
+    Nested dicts are flattened into the metric name. Lists of endpoint stats
+    are labeled by their `url`, and dicts keyed by something other than a
+    name, like hosts, by their `key`.
+    """
+
+    def __init__(self, get_stats: Callable[[], Dict[str, Any]]):
+        self.get_stats = get_stats
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        samples: Dict[str, List[Tuple[Dict[str, str], float]]] = defaultdict(list)
+        for name, labels, value in _flatten_stats("", self.get_stats(), {}):
+            samples[name].append((labels, value))
+
+        for name, values in samples.items():
+            family = GaugeMetricFamily(
+                name, f"{name} from the stats endpoint.", labels=list(values[0][0])
+            )
+            for labels, value in values:
+                family.add_metric(list(labels.values()), value)
+            yield family
+
+
+def _flatten_stats(
+    prefix: str, value: Any, labels: Dict[str, str]
+) -> Iterator[Tuple[str, Dict[str, str], float]]:
+    if isinstance(value, bool):
+        yield prefix, labels, int(value)
+    elif isinstance(value, (int, float)):
+        yield prefix, labels, value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if _METRIC_NAME_PART.match(str(key)):
+                yield from _flatten_stats(
+                    f"{prefix}_{key}" if prefix else key, item, labels
+                )
+            else:
+                yield from _flatten_stats(prefix, item, {**labels, "key": str(key)})
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict) and "url" in item:
+                yield from _flatten_stats(
+                    prefix, item, {**labels, "endpoint": item["url"]}
+                )
+
+
+def register_stats(get_stats: Callable[[], Dict[str, Any]]):
+    collector = StatsCollector(get_stats)
+    _stats_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Serves the metrics in the Prometheus text format."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # Stats are only those of the worker serving the scrape.
+        for collector in _stats_collectors:
+            registry.register(collector)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,159 @@
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from tools.http import RateLimitException
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """
+    Shared admission control for calls to one rate limited upstream.
+
+    Callers are bounded by an in-flight limit and a token bucket. Both adapt
+    AIMD style: every success grows them additively up to the configured
+    maximum, every rate limit response shrinks them multiplicatively and
+    pauses all callers, so throughput converges to what the upstream allows
+    instead of each caller retrying on its own.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_in_flight: int,
+        rate: float,
+        burst: float,
+        min_rate: float = 1,
+        increase_step: float = 1,
+        decrease_factor: float = 0.5,
+        base_pause: float = 0.5,
+        max_pause: float = 30,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.base_pause = base_pause
+        self.max_pause = max_pause
+
+        self.rate = rate
+        self._in_flight_limit = float(max_in_flight)
+        self._in_flight = 0
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        self._pause = base_pause
+        self._paused_until = 0.0
+        self._counters = defaultdict(int)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slot_available: Optional[asyncio.Condition] = None
+
+    @property
+    def in_flight_limit(self) -> int:
+        return max(1, int(self._in_flight_limit))
+
+    @property
+    def is_paused(self) -> bool:
+        return time.monotonic() < self._paused_until
+
+    @asynccontextmanager
+    async def acquire(self, cost: float = 1):
+        """Waits for an in-flight slot and `cost` tokens, then runs the body."""
+        await self._acquire_slot()
+        try:
+            await self._acquire_tokens(min(cost, self.burst))
+            yield
+        except RateLimitException:
+            self._on_throttled()
+            raise
+        else:
+            self._on_success()
+        finally:
+            await self._release_slot()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self._in_flight,
+            "in_flight_limit": self.in_flight_limit,
+            "max_in_flight": self.max_in_flight,
+            "rate": self.rate,
+            "max_rate": self.max_rate,
+            "paused_for": max(self._paused_until - time.monotonic(), 0),
+            **self._counters,
+        }
+
+    def _condition(self) -> asyncio.Condition:
+        # asyncio primitives are bound to one loop, scripts may use several.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slot_available = asyncio.Condition()
+            self._in_flight = 0
+
+        return self._slot_available
+
+    async def _acquire_slot(self):
+        condition = self._condition()
+        async with condition:
+            if self._in_flight >= self.in_flight_limit:
+                self._counters["queued"] += 1
+            await condition.wait_for(lambda: self._in_flight < self.in_flight_limit)
+            self._in_flight += 1
+
+    async def _release_slot(self):
+        condition = self._condition()
+        async with condition:
+            self._in_flight -= 1
+            condition.notify_all()
+
+    async def _acquire_tokens(self, cost: float):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._refilled_at) * self.rate
+            )
+            self._refilled_at = now
+            if self._tokens >= cost:
+                self._tokens -= cost
+                return
+
+            await asyncio.sleep((cost - self._tokens) / self.rate)
+
+    def _on_success(self):
+        self._counters["succeeded"] += 1
+        self._pause = self.base_pause
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+        self._in_flight_limit = min(
+            self.max_in_flight, self._in_flight_limit + 1 / self._in_flight_limit
+        )
+
+    def _on_throttled(self):
+        self._counters["throttled"] += 1
+
+        now = time.monotonic()
+        if now < self._paused_until:
+            # Already backing off for this burst of rate limit responses.
+            return
+
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self._in_flight_limit = max(1, self._in_flight_limit * self.decrease_factor)
+        self._tokens = 0
+        self._paused_until = now + self._pause
+        self._pause = min(self.max_pause, self._pause * 2)
+
+        logger.warning(
+            "Rate limited, pausing %.2fs with rate %.1f/s and %s in flight",
+            self._paused_until - now,
+            self.rate,
+            self.in_flight_limit,
+        )
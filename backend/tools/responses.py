@@ -0,0 +1,53 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import msgspec
+from django.utils.http import http_date, parse_http_date_safe
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+
+class MsgspecJSONResponse(JSONResponse):
+    """JSON response rendered with msgspec, several times faster than json."""
+
+    def render(self, content: Any) -> bytes:
+        return msgspec.json.encode(content)
+
+
+def get_validator_headers(
+    etag: str, last_modified: Optional[datetime] = None
+) -> Dict[str, str]:
+    # no-cache makes clients revalidate instead of serving a stale copy.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified.timestamp())
+
+    return headers
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: Optional[datetime] = None
+) -> bool:
+    """
+    Evaluates the request's `If-None-Match`/`If-Modified-Since` headers.
+
+    As per RFC 9110, `If-Modified-Since` is ignored when `If-None-Match` is
+    sent, and weak ETags compare equal to strong ones.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = parse_http_date_safe(
+        request.headers.get("if-modified-since", "")
+    )
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    # HTTP dates have a resolution of one second.
+    return int(last_modified.timestamp()) <= if_modified_since
+
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
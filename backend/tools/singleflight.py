@@ -0,0 +1,74 @@
+import asyncio
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls of the same operation into one execution.
+
+    The first caller for a key starts the call, later callers arriving while
+    it runs await the same result or exception. Nothing is cached, the key
+    is forgotten as soon as the call completes. The shared call is shielded,
+    a caller that is cancelled, e.g. by a client disconnect, doesn't cancel
+    it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._counters = defaultdict(int)
+
+    async def do(
+        self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs
+    ) -> Any:
+        call = self._calls.get(key)
+        # Futures are bound to one loop, scripts may use several.
+        if call is None or call.get_loop() is not asyncio.get_running_loop():
+            self._counters["calls"] += 1
+            call = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._counters["coalesced"] += 1
+
+        return await asyncio.shield(call)
+
+    def _forget(self, key: Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+        # Mark the exception retrieved in case every caller was cancelled.
+        if not call.cancelled():
+            call.exception()
+
+    def stats(self) -> Dict:
+        return {"in_flight": len(self._calls), **self._counters}
+
+
+single_flight = SingleFlight()
+
+
+def coalesce(key: Optional[Callable[..., Hashable]] = None):
+    """
+    Decorates a coroutine function so concurrent identical calls share one.
+
+    Calls are keyed by the function and `key(*args, **kwargs)`, by default
+    the arguments themselves, which must then be hashable.
+    """
+
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if key is not None:
+                call_key = (name, key(*args, **kwargs))
+            else:
+                call_key = (name, args, frozenset(kwargs.items()))
+
+            return await single_flight.do(call_key, fn, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
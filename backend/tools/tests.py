@@ -0,0 +1,344 @@
+import asyncio
+from typing import Optional
+from unittest import mock
+
+import httpx
+from django.test import SimpleTestCase
+from fastapi import FastAPI
+from prometheus_client import REGISTRY, CollectorRegistry
+
+from tools.http import RateLimitException, close_http_session, get_http_session
+from tools.metrics import MetricsMiddleware, StatsCollector
+from tools.rate_limit import AdaptiveRateLimiter
+from tools.singleflight import SingleFlight
+from tools.tracing import (
+    STATUS_CODE_ERROR,
+    OtlpSpanExporter,
+    TracingMiddleware,
+    create_background_task,
+    span,
+)
+from tools.ttl_cache import TTLCache
+
+
+class AdaptiveRateLimiterTests(SimpleTestCase):
+    def make_limiter(self, **kwargs) -> AdaptiveRateLimiter:
+        options = {"max_in_flight": 4, "rate": 1000, "burst": 1000, "base_pause": 0.05}
+        return AdaptiveRateLimiter(**{**options, **kwargs})
+
+    async def throttle(self, limiter: AdaptiveRateLimiter):
+        with self.assertRaises(RateLimitException):
+            async with limiter.acquire():
+                raise RateLimitException()
+
+    async def test_rate_limit_backs_off_once_per_pause(self):
+        limiter = self.make_limiter()
+
+        async def call():
+            async with limiter.acquire():
+                await asyncio.sleep(0.01)
+                raise RateLimitException()
+
+        # Both calls were in flight when the first 429 came back.
+        results = await asyncio.gather(call(), call(), return_exceptions=True)
+        self.assertTrue(
+            all(isinstance(result, RateLimitException) for result in results)
+        )
+
+        self.assertTrue(limiter.is_paused)
+        self.assertEqual(limiter.rate, 500)
+        self.assertEqual(limiter.in_flight_limit, 2)
+        self.assertEqual(limiter.stats()["throttled"], 2)
+
+    async def test_successes_recover_additively(self):
+        limiter = self.make_limiter(increase_step=100)
+        await self.throttle(limiter)
+        for _ in range(3):
+            async with limiter.acquire():
+                pass
+
+        # The pause is waited out by the first caller.
+        self.assertFalse(limiter.is_paused)
+        self.assertEqual(limiter.rate, 800)
+        self.assertEqual(limiter.stats()["succeeded"], 3)
+
+    async def test_in_flight_calls_are_bounded(self):
+        limiter = self.make_limiter(max_in_flight=2)
+        in_flight = []
+        peak = 0
+
+        async def call():
+            nonlocal peak
+
+            async with limiter.acquire():
+                in_flight.append(None)
+                peak = max(peak, len(in_flight))
+                await asyncio.sleep(0.01)
+                in_flight.pop()
+
+        await asyncio.gather(*[call() for _ in range(6)])
+
+        self.assertEqual(peak, 2)
+        self.assertGreater(limiter.stats()["queued"], 0)
+
+
+class SingleFlightTests(SimpleTestCase):
+    async def test_concurrent_calls_share_one_execution(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def load(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(
+            *[single_flight.do("key", load, i) for i in range(5)]
+        )
+
+        self.assertEqual(calls, [0])
+        self.assertEqual(results, [0] * 5)
+        self.assertEqual(
+            single_flight.stats(), {"in_flight": 0, "calls": 1, "coalesced": 4}
+        )
+
+        # The key is forgotten once the call completed.
+        self.assertEqual(await single_flight.do("key", load, 5), 5)
+
+    async def test_exception_is_shared(self):
+        single_flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+
+        results = await asyncio.gather(
+            *[single_flight.do("key", fail) for _ in range(3)], return_exceptions=True
+        )
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_cancelled_caller_leaves_the_call_running(self):
+        single_flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return "value"
+
+        cancelled = asyncio.ensure_future(single_flight.do("key", load))
+        waiting = asyncio.ensure_future(single_flight.do("key", load))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        release.set()
+
+        self.assertEqual(await waiting, "value")
+        self.assertTrue(cancelled.cancelled())
+
+
+class TTLCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("tools.ttl_cache.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.loads = 0
+
+    async def load(self):
+        self.loads += 1
+        return self.loads
+
+    async def settle(self):
+        # Lets a background refresh run.
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def test_fresh_value_is_served_from_cache(self):
+        cache = TTLCache(ttl=10)
+        self.assertEqual(await cache.get("key", self.load), 1)
+        self.now += 9
+        self.assertEqual(await cache.get("key", self.load), 1)
+        self.now += 1
+        self.assertEqual(await cache.get("key", self.load), 2)
+        self.assertEqual(cache.stats(), {"entries": 1, "hits": 1, "misses": 2})
+
+    async def test_stale_value_is_served_while_refreshing(self):
+        cache = TTLCache(ttl=10, stale_ttl=20)
+        await cache.get("key", self.load)
+        self.now += 15
+
+        self.assertEqual(await cache.get("key", self.load), 1)
+        await self.settle()
+        self.assertEqual(await cache.get("key", self.load), 2)
+        self.assertEqual(self.loads, 2)
+
+    async def test_failed_refresh_keeps_the_stale_value(self):
+        cache = TTLCache(ttl=10, stale_ttl=20)
+        await cache.get("key", self.load)
+        self.now += 15
+
+        async def fail():
+            raise ValueError("failed")
+
+        with self.assertLogs("tools.ttl_cache", "ERROR"):
+            self.assertEqual(await cache.get("key", fail), 1)
+            await self.settle()
+
+        self.assertEqual(await cache.get("key", self.load), 1)
+        self.assertEqual(cache.stats()["refresh_errors"], 1)
+
+    async def test_least_recently_used_keys_are_dropped(self):
+        cache = TTLCache(ttl=10, max_entries=2)
+        for key in ["a", "b", "a", "c"]:
+            await cache.get(key, self.load)
+
+        self.assertEqual(cache.stats()["entries"], 2)
+        # "b" was dropped, "a" was used after it.
+        self.assertEqual(await cache.get("a", self.load), 1)
+        self.assertEqual(await cache.get("b", self.load), 4)
+
+
+class HttpSessionTests(SimpleTestCase):
+    def test_session_of_a_previous_loop_is_closed(self):
+        async def get_session():
+            return get_http_session()
+
+        loops = [asyncio.new_event_loop(), asyncio.new_event_loop()]
+        try:
+            first = loops[0].run_until_complete(get_session())
+            self.assertIs(loops[0].run_until_complete(get_session()), first)
+            connector = first.connector
+
+            second = loops[1].run_until_complete(get_session())
+            self.assertIsNot(second, first)
+            self.assertTrue(first.closed)
+            self.assertTrue(connector.closed)
+
+            # Also once the previous loop is closed.
+            loops[1].close()
+            third = loops[0].run_until_complete(get_session())
+            self.assertTrue(second.closed)
+            self.assertFalse(third.closed)
+        finally:
+            loops[0].run_until_complete(close_http_session())
+            for loop in loops:
+                loop.close()
+
+
+class TracingTests(SimpleTestCase):
+    async def request(self, app, headers: Optional[dict] = None) -> httpx.Response:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=TracingMiddleware(app)),
+            base_url="http://testserver",
+        ) as client:
+            return await client.get("/", headers=headers)
+
+    async def test_sampled_traceparent_is_continued_and_exported(self):
+        trace_id = "a" * 32
+        parent_id = "b" * 16
+
+        async def app(scope, receive, send):
+            with span("db.query", rows=2):
+                pass
+            with self.assertRaises(ValueError), span("rpc.call"):
+                raise ValueError()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        with mock.patch("tools.tracing.trace_exporter") as exporter:
+            response = await self.request(
+                app, headers={"traceparent": f"00-{trace_id}-{parent_id}-01"}
+            )
+
+        (trace,), _ = exporter.export.call_args
+        root = trace.spans[0]
+        server_timing = response.headers["server-timing"]
+        self.assertIn("db.query;dur=", server_timing)
+        self.assertIn(
+            f'traceparent;desc="00-{trace_id}-{root.span_id}-01"', server_timing
+        )
+
+        encoded = OtlpSpanExporter.encode(
+            [(trace.trace_id, span) for span in trace.spans]
+        )
+        spans = encoded["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual([span["traceId"] for span in spans], [trace_id] * 3)
+        self.assertEqual(spans[0]["parentSpanId"], parent_id)
+        self.assertEqual(
+            [span["parentSpanId"] for span in spans[1:]], [root.span_id] * 2
+        )
+        self.assertEqual(
+            spans[1]["attributes"], [{"key": "rows", "value": {"intValue": "2"}}]
+        )
+        self.assertEqual(
+            spans[2]["status"], {"code": STATUS_CODE_ERROR, "message": "ValueError"}
+        )
+
+    async def test_background_tasks_are_left_out_of_the_trace(self):
+        async def work(name: str):
+            with span(name):
+                await asyncio.sleep(0)
+
+        async def app(scope, receive, send):
+            await asyncio.ensure_future(work("request.task"))
+            await create_background_task(work("background.task"))
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        server_timing = (await self.request(app)).headers["server-timing"]
+
+        self.assertIn("request.task;", server_timing)
+        self.assertNotIn("background.task", server_timing)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_stats_are_flattened_into_gauges(self):
+        registry = CollectorRegistry()
+        registry.register(
+            StatsCollector(
+                lambda: {
+                    "cache": {"hits": 3, "paused": True},
+                    "endpoints": [{"url": "http://a", "in_flight": 2}],
+                    "hosts": {"example.com": {"connections": 1}},
+                }
+            )
+        )
+
+        self.assertEqual(registry.get_sample_value("cache_hits"), 3)
+        self.assertEqual(registry.get_sample_value("cache_paused"), 1)
+        self.assertEqual(
+            registry.get_sample_value("endpoints_in_flight", {"endpoint": "http://a"}),
+            2,
+        )
+        self.assertEqual(
+            registry.get_sample_value("hosts_connections", {"key": "example.com"}), 1
+        )
+
+    async def test_requests_are_labeled_with_their_route_template(self):
+        api = FastAPI()
+
+        @api.get("/items/{id}")
+        async def item(id: str) -> str:
+            return id
+
+        app = MetricsMiddleware(api)
+        labels = {"method": "GET", "route": "/items/{id}", "status": "200"}
+        before = REGISTRY.get_sample_value("http_responses_total", labels) or 0
+
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+        ) as client:
+            for id in ["1", "2"]:
+                self.assertEqual((await client.get(f"/items/{id}")).json(), id)
+            self.assertEqual((await client.get("/missing")).status_code, 404)
+
+        self.assertEqual(
+            REGISTRY.get_sample_value("http_responses_total", labels), before + 2
+        )
+        self.assertIsNotNone(
+            REGISTRY.get_sample_value(
+                "http_responses_total",
+                {"method": "GET", "route": "other", "status": "404"},
+            )
+        )
@@ -0,0 +1,386 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from typing import Any, Coroutine, Deque, Dict, Iterator, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from tools.http import get_http_session
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# OTLP/HTTP JSON endpoint of a collector, like http://localhost:4318/v1/traces.
+TRACE_EXPORT_URL = os.getenv("TRACE_EXPORT_URL")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "allyn-backend")
+# Share of requests exported, slow requests are sampled separately.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+# Requests at least this slow are tagged `slow`, logged and exported.
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", 1))
+TRACE_SLOW_SAMPLE_RATE = float(os.getenv("TRACE_SLOW_SAMPLE_RATE", 1))
+# Spans kept per trace, Server-Timing still covers the ones dropped.
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 1000))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", 5))
+TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", 10000))
+
+# OTLP span kinds and status codes.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_CODE_ERROR = 2
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "span_id",
+        "parent_id",
+        "kind",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        parent_id: Optional[str],
+        *,
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+
+class Trace:
+    """
+    Spans of one request, shared by the tasks it starts.
+
+    Durations are also summed per span name for the Server-Timing header,
+    so concurrent spans can add up to more than the request took.
+    """
+
+    def __init__(self, trace_id: Optional[str] = None, *, sampled: bool = False):
+        self.trace_id = trace_id or f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self.timings: Dict[str, List[float]] = {}
+
+    def add(self, span: Span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    def record(self, span: Span):
+        timing = self.timings.setdefault(span.name, [0.0, 0])
+        timing[0] += span.duration
+        timing[1] += 1
+
+    def get_server_timing(self, total: float) -> str:
+        metrics = [
+            f'{name};dur={seconds * 1000:.1f};desc="x{count}"'
+            for name, (seconds, count) in self.timings.items()
+        ]
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        if self.sampled:
+            metrics.append(f'traceparent;desc="{self.traceparent}"')
+
+        return ", ".join(metrics)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.spans[0].span_id}-01"
+
+    def get_breakdown(self) -> str:
+        return ", ".join(
+            f"{name} {seconds:.3f}s x{count}"
+            for name, (seconds, count) in sorted(
+                self.timings.items(), key=lambda item: -item[1][0]
+            )
+        )
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Times a block as a span of the current request's trace.
+
+    Does nothing outside of a traced request, so library code can be
+    instrumented unconditionally.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, attributes=attributes)
+    trace.add(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        trace.record(current)
+
+
+def create_background_task(coroutine: Coroutine) -> asyncio.Task:
+    """
+    Runs a coroutine as a task outside of the current request's trace.
+
+    A task copies the context it is created in, work started by a request
+    but outliving it would otherwise keep adding spans to its trace.
+    """
+    return asyncio.get_running_loop().create_task(coroutine, context=Context())
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Returns the trace id, parent span id and sampled flag of a W3C header."""
+    if not value:
+        return None
+
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+
+    return parts[1], parts[2], sampled
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware tracing each HTTP request.
+
+    Adds a Server-Timing header summing the request's spans per name.
+    Requests continuing a sampled `traceparent`, a `TRACE_SAMPLE_RATE`
+    share of the others, and sampled slow requests are exported.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            return await self.app(scope, receive, send)
+
+        incoming = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = None, None
+            sampled = random.random() < TRACE_SAMPLE_RATE
+        trace = Trace(trace_id, sampled=sampled)
+
+        root = Span(
+            f"{scope['method']} {scope['path']}", parent_id, kind=SPAN_KIND_SERVER
+        )
+        root.attributes["http.method"] = scope["method"]
+        trace.add(root)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", trace.get_server_timing(root.duration)
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            root.end_ns = time.time_ns()
+            # Set on the scope by the router once a route matched.
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+                root.attributes["http.route"] = route
+            self.finish(trace, root)
+
+    def finish(self, trace: Trace, root: Span):
+        if (
+            root.duration >= TRACE_SLOW_SECONDS
+            and random.random() < TRACE_SLOW_SAMPLE_RATE
+        ):
+            root.attributes["slow"] = True
+            trace.sampled = True
+            logger.warning(
+                "Slow request %s took %.3fs, trace %s: %s",
+                root.name,
+                root.duration,
+                trace.trace_id,
+                trace.get_breakdown(),
+            )
+
+        if trace.sampled:
+            trace_exporter.export(trace)
+
+
+class OtlpSpanExporter:
+    """
+    Sends finished traces to an OpenTelemetry collector, as OTLP/HTTP JSON.
+
+    Spans are queued and posted in the background every `interval`, a
+    full queue drops new spans rather than slowing requests down.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str],
+        *,
+        interval: float = TRACE_EXPORT_INTERVAL,
+        max_queue_size: int = TRACE_EXPORT_QUEUE_SIZE,
+    ):
+        self.url = url
+        self.interval = interval
+        self.max_queue_size = max_queue_size
+        self._queue: Deque[Tuple[str, Span]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {"exported": 0, "dropped": 0, "failed": 0}
+
+    def start(self):
+        if not self.url:
+            return
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+            await self.flush()
+
+        self._task = None
+
+    def export(self, trace: Trace):
+        if self._task is None:
+            return
+
+        for span in trace.spans:
+            if len(self._queue) >= self.max_queue_size:
+                self._counters["dropped"] += 1
+            else:
+                self._queue.append((trace.trace_id, span))
+
+    def stats(self) -> Dict:
+        return {"queued": len(self._queue), **self._counters}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        while self._queue:
+            batch = [
+                self._queue.popleft()
+                for _ in range(min(len(self._queue), TRACE_MAX_SPANS))
+            ]
+            try:
+                session = get_http_session()
+                async with session.post(self.url, json=self.encode(batch)) as response:
+                    response.raise_for_status()
+                self._counters["exported"] += len(batch)
+            except Exception as e:
+                self._counters["failed"] += len(batch)
+                logger.warning("Failed to export %s spans: %s", len(batch), e)
+                return
+
+    @staticmethod
+    def encode(batch: List[Tuple[str, Span]]) -> Dict:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _encode_attributes(
+                            {"service.name": TRACE_SERVICE_NAME}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [
+                                _encode_span(trace_id, span) for trace_id, span in batch
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+def _encode_span(trace_id: str, span: Span) -> Dict:
+    encoded = {
+        "traceId": trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": _encode_attributes(span.attributes),
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    if span.error:
+        encoded["status"] = {"code": STATUS_CODE_ERROR, "message": span.error}
+
+    return encoded
+
+
+def _encode_attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            encoded_value = {"boolValue": value}
+        elif isinstance(value, int):
+            encoded_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded_value = {"doubleValue": value}
+        else:
+            encoded_value = {"stringValue": str(value)}
+        encoded.append({"key": key, "value": encoded_value})
+
+    return encoded
+
+
+trace_exporter = OtlpSpanExporter(TRACE_EXPORT_URL)
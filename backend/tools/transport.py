@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgspec
+
+from tools.http import HttpResponse, HttpTransport
+
+logger = logging.getLogger(__name__)
+
+# Answered for requests missing from a cassette, not retried by RPC callers.
+NOT_RECORDED_ERROR_CODE = -32601
+
+
+class Cassette:
+    """
+    JSON-RPC responses recorded per request, one JSON line per call.
+
+    Requests are matched on method and params, ids are ignored, so a batch
+    can be replayed whatever its size and order. Calls recorded several
+    times are replayed in order, the last response repeating.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._responses: Dict[str, List[Tuple[dict, float]]] = defaultdict(list)
+        self._replayed: Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    def get_key(request: dict) -> str:
+        return json.dumps(
+            [request.get("method"), request.get("params")],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+
+    def load(self) -> "Cassette":
+        with open(self.path) as f:
+            for line in f:
+                entry = json.loads(line)
+                self._responses[self.get_key(entry)].append(
+                    (entry["response"], entry.get("latency", 0))
+                )
+
+        return self
+
+    def record(self, request: dict, response: dict, latency: float):
+        response = {
+            key: value for key, value in response.items() if key in ("result", "error")
+        }
+        self._responses[self.get_key(request)].append((response, latency))
+        with open(self.path, "a") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "method": request.get("method"),
+                        "params": request.get("params"),
+                        "response": response,
+                        "latency": round(latency, 6),
+                    }
+                )
+                + "\n"
+            )
+
+    def respond(self, request: dict) -> Tuple[dict, float]:
+        """Returns the recorded response to a request and its latency."""
+        key = self.get_key(request)
+        responses = self._responses.get(key)
+        if not responses:
+            logger.warning("No recorded response to %s", key)
+            response = {
+                "error": {
+                    "code": NOT_RECORDED_ERROR_CODE,
+                    "message": f"Not recorded: {request.get('method')}",
+                }
+            }
+            latency = 0
+        else:
+            index = min(self._replayed[key], len(responses) - 1)
+            self._replayed[key] += 1
+            response, latency = responses[index]
+
+        return {"jsonrpc": "2.0", "id": request.get("id"), **response}, latency
+
+
+class RecordingTransport(HttpTransport):
+    """Sends requests with `transport` and records JSON-RPC responses."""
+
+    def __init__(self, cassette: Cassette, transport: Optional[HttpTransport] = None):
+        self.cassette = cassette
+        self.transport = transport or HttpTransport()
+
+    async def post(
+        self, url: str, data: Any, *, headers: dict, params: dict
+    ) -> HttpResponse:
+        start = time.perf_counter()
+        response = await self.transport.post(url, data, headers=headers, params=params)
+        latency = time.perf_counter() - start
+        if response.status != 200:
+            return response
+
+        try:
+            body = msgspec.json.decode(response.body)
+        except msgspec.DecodeError:
+            return response
+
+        if isinstance(data, list) and isinstance(body, list):
+            requests_by_id = {request.get("id"): request for request in data}
+            for item in body:
+                request = requests_by_id.get(item.get("id"))
+                if request is not None:
+                    self.cassette.record(request, item, latency)
+        elif isinstance(data, dict) and isinstance(body, dict):
+            self.cassette.record(data, body, latency)
+
+        return response
+
+
+class ReplayTransport(HttpTransport):
+    """
+    Answers JSON-RPC requests from a cassette without any network access.
+
+    With `latency`, a call takes as long as when it was recorded, a batch as
+    long as its slowest item.
+    """
+
+    def __init__(self, cassette: Cassette, *, latency: bool = False):
+        self.cassette = cassette
+        self.latency = latency
+
+    async def post(
+        self, url: str, data: Any, *, headers: dict, params: dict
+    ) -> HttpResponse:
+        if isinstance(data, list):
+            replies = [self.cassette.respond(request) for request in data]
+            body = [response for response, _ in replies]
+            latency = max((latency for _, latency in replies), default=0)
+        else:
+            body, latency = self.cassette.respond(data)
+
+        if self.latency and latency:
+            await asyncio.sleep(latency)
+
+        return HttpResponse(200, msgspec.json.encode(body))
+
+
+def create_http_transport(mode: str, cassette_path: Optional[str]) -> HttpTransport:
+    """Creates the transport of `HTTP_TRANSPORT`: live, record or replay."""
+    if mode == "live":
+        return HttpTransport()
+
+    if not cassette_path:
+        raise ValueError(f"HTTP_CASSETTE must be set to {mode} requests")
+
+    if mode == "record":
+        os.makedirs(os.path.dirname(os.path.abspath(cassette_path)), exist_ok=True)
+        return RecordingTransport(Cassette(cassette_path))
+
+    if mode == "replay":
+        return ReplayTransport(
+            Cassette(cassette_path).load(),
+            latency=os.getenv("HTTP_REPLAY_LATENCY", "false").lower() == "true",
+        )
+
+    raise ValueError(f"Unknown HTTP_TRANSPORT {mode}")
@@ -0,0 +1,88 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set
+
+from tools.singleflight import SingleFlight
+from tools.tracing import create_background_task
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    In-process cache of async computations with stale-while-revalidate.
+
+    A value younger than `ttl` is served as is. Up to `ttl + stale_ttl` it
+    is still served, while one background refresh replaces it. Older or
+    missing values are loaded inline, concurrent loads of a key are
+    coalesced. A failed background refresh keeps the stale value. The least
+    recently used keys are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, *, ttl: float, stale_ttl: float = 0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._loads = SingleFlight()
+        self._refreshing: Set[Hashable] = set()
+        self._refreshes: Set[asyncio.Task] = set()
+        self._counters = defaultdict(int)
+
+    async def get(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            loaded_at, value = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl:
+                self._counters["hits"] += 1
+                self._entries.move_to_end(key)
+                return value
+
+            if age < self.ttl + self.stale_ttl:
+                self._counters["stale_hits"] += 1
+                self._entries.move_to_end(key)
+                self._refresh_in_background(key, load)
+                return value
+
+        self._counters["misses"] += 1
+        return await self._loads.do(key, self._load, key, load)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), **self._counters}
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        value = await load()
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        return value
+
+    def _refresh_in_background(self, key: Hashable, load: Callable[[], Awaitable[Any]]):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                await self._loads.do(key, self._load, key, load)
+            except Exception:
+                self._counters["refresh_errors"] += 1
+                logger.exception("Failed to refresh cached %s", key)
+            finally:
+                self._refreshing.discard(key)
+
+        self._refreshing.add(key)
+
+        # Keep a reference, the loop only holds weak ones to tasks. The
+        # refresh outlives the request that found the value stale, so stays
+        # out of its trace.
+        task = create_background_task(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)